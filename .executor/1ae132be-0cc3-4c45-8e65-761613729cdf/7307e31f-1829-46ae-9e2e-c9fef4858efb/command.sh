@@ -0,0 +1 @@
+python -c 'print(1 + 2)'
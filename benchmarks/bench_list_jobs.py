@@ -0,0 +1,71 @@
+"""Benchmark of the `/job/list_all` endpoint with many finished jobs.
+
+Compare the cached JSON serialization of jobs with
+serializing every job on each request:
+
+    python benchmarks/bench_list_jobs.py --n-jobs 10000
+"""
+import argparse
+import time
+from datetime import datetime
+
+from fastapi.testclient import TestClient
+from executor.engine import LocalJob
+
+from executor.http.server.app import create_app
+from executor.http.server.config import ServerSetting
+from executor.http.server.jobs import IndexedJobs, dump_json
+from executor.http.server.utils import ser_job
+
+
+def fill_jobs(jobs: IndexedJobs, n_jobs: int):
+    for i in range(n_jobs):
+        job = LocalJob(lambda x: x, args=(i,), name=f"task_{i % 10}")
+        job.submit_time = job.stoped_time = datetime.now()
+        job._status = "done"
+        jobs.add(job)
+
+
+def timeit(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n-jobs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app(ServerSetting(allowed_routers=["job"]))
+    jobs: IndexedJobs = app.engine.jobs
+    fill_jobs(jobs, args.n_jobs)
+
+    def uncached():
+        dump_json([ser_job(job, True) for job in jobs])
+
+    with TestClient(app) as client:
+        def request():
+            resp = client.get("/job/list_all")
+            assert resp.status_code == 200
+
+        t_uncached = timeit(uncached, args.repeat)
+        t_first = timeit(request, 1)
+        t_cached = timeit(request, args.repeat)
+        for job in list(jobs)[:args.n_jobs // 100]:
+            jobs.touch(job)
+        t_changed = timeit(request, 1)
+
+    print(f"jobs: {args.n_jobs}")
+    print(f"serialize all jobs (no cache): {t_uncached * 1000:.1f} ms")
+    print(f"list_all, cold cache: {t_first * 1000:.1f} ms")
+    print(f"list_all, warm cache: {t_cached * 1000:.1f} ms")
+    print(f"list_all, 1% jobs changed: {t_changed * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import typing as T
+import uuid
+import asyncio
+import functools
+import inspect
+
+from loky.process_executor import ProcessPoolExecutor
+
+
+# state of the actor in the worker process, created by the init function
+_state: T.Any = None
+
+# the pools are looked up by the key, so the jobs don't refer to them
+# and can be pickled(e.g. by the diskcache job store)
+_pools: T.Dict[str, "ActorPool"] = {}
+
+
+def _init_worker(init: T.Optional[T.Callable[[], T.Any]]):
+    global _state
+    if init is not None:
+        _state = init()
+
+
+def _call_in_worker(func: T.Callable, args: tuple, kwargs: dict) -> T.Any:
+    return func(_state, *args, **kwargs)
+
+
+class ActorPool(object):
+    """Long-lived worker processes which keep the state
+    returned by `init` across the calls."""
+
+    def __init__(
+            self, init: T.Optional[T.Callable[[], T.Any]] = None,
+            pool_size: int = 1) -> None:
+        if pool_size < 1:
+            raise ValueError("pool_size should be greater than 0.")
+        self.init = init
+        self.pool_size = pool_size
+        self._executor: T.Optional[ProcessPoolExecutor] = None
+        self.key = uuid.uuid4().hex
+        _pools[self.key] = self
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        # the workers are started at the first call
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                self.pool_size,
+                initializer=_init_worker, initargs=(self.init,))
+        return self._executor
+
+    async def call(
+            self, func: T.Callable, args: tuple, kwargs: dict) -> T.Any:
+        """Call `func(state, *args, **kwargs)` in a worker."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, _call_in_worker, func, args, kwargs)
+
+    def close(self):
+        """Stop the workers, they are restarted by the next call."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, kill_workers=True)
+            self._executor = None
+
+    def remove(self):
+        """Close the pool and remove it from the registry."""
+        self.close()
+        _pools.pop(self.key, None)
+
+
+def get_pool(key: str) -> ActorPool:
+    try:
+        return _pools[key]
+    except KeyError:
+        raise RuntimeError(f"The actor pool is removed: {key}")
+
+
+def actor_runner(
+        func: T.Callable, pool: ActorPool) -> T.Callable[..., T.Awaitable]:
+    """Wrap the actor function to run the calls in the pool,
+    the state argument is removed from the signature."""
+    # refer to the pool by the key, keep the job picklable
+    pool_key = pool.key
+
+    async def run_actor(*args, **kwargs):
+        return await get_pool(pool_key).call(func, args, kwargs)
+    functools.update_wrapper(run_actor, func)
+    sig = inspect.signature(func)
+    params = list(sig.parameters.values())
+    first = params[0].name if params else None
+    run_actor.__signature__ = sig.replace(  # type: ignore
+        parameters=params[1:])
+    run_actor.__annotations__ = {
+        k: v for k, v in func.__annotations__.items()
+        if (k == "return") or (k in sig.parameters and k != first)
+    }
+    del run_actor.__wrapped__  # type: ignore
+    return run_actor
@@ -0,0 +1,90 @@
+import typing as T
+import asyncio
+import math
+import time
+
+from fastapi import HTTPException, status
+
+from .jobs import IndexedJobs, JobEvent, finished_statuses
+from .user_db.schemas import User
+
+
+class AdmissionControl(object):
+    """Limit the number of the pending and running jobs,
+    globally and per user.
+
+    The drain rate(interval between the finishing of jobs) is tracked
+    by an exponentially weighted moving average, used for estimating
+    the `Retry-After` of the rejected requests."""
+
+    def __init__(
+            self, jobs: IndexedJobs,
+            max_active: T.Optional[int] = None,
+            max_active_per_user: T.Optional[int] = None,
+            wait_timeout: float = 0.0,
+            alpha: float = 0.2) -> None:
+        self.jobs = jobs
+        self.max_active = max_active
+        self.max_active_per_user = max_active_per_user
+        self.wait_timeout = wait_timeout
+        self.alpha = alpha
+        self.drain_interval: T.Optional[float] = None
+        self._last_finish: T.Optional[float] = None
+        self._waiters: T.List[asyncio.Future] = []
+        jobs.add_listener(self.on_event)
+
+    def on_event(self, event: JobEvent):
+        if (event.event == "status") and (event.status in finished_statuses):
+            now = time.monotonic()
+            if self._last_finish is not None:
+                interval = now - self._last_finish
+                if self.drain_interval is None:
+                    self.drain_interval = interval
+                else:
+                    self.drain_interval = self.alpha * interval + \
+                        (1 - self.alpha) * self.drain_interval
+            self._last_finish = now
+        if (event.event == "remove") or (event.status in finished_statuses):
+            waiters, self._waiters = self._waiters, []
+            for fut in waiters:
+                if not fut.done():
+                    fut.set_result(None)
+
+    def excess(self, n_jobs: int, user: T.Optional[User] = None) -> int:
+        """Number of jobs exceed the limits if admit `n_jobs` jobs."""
+        excess = 0
+        if self.max_active is not None:
+            excess = self.jobs.n_active() + n_jobs - self.max_active
+        if (self.max_active_per_user is not None) and (user is not None):
+            n_user = self.jobs.n_active(user.username)
+            excess = max(excess, n_user + n_jobs - self.max_active_per_user)
+        return max(excess, 0)
+
+    def retry_after(self, excess: int) -> int:
+        interval = self.drain_interval or 1.0
+        return min(max(math.ceil(excess * interval), 1), 3600)
+
+    async def admit(self, n_jobs: int, user: T.Optional[User] = None):
+        """Wait until the jobs can be admitted, at most `wait_timeout`
+        seconds, raise HTTPException(429) if still exceed the limits."""
+        if n_jobs <= 0:
+            return
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            excess = self.excess(n_jobs, user)
+            if excess == 0:
+                return
+            remain = deadline - time.monotonic()
+            if remain <= 0:
+                break
+            fut = asyncio.get_running_loop().create_future()
+            self._waiters.append(fut)
+            try:
+                await asyncio.wait_for(fut, remain)
+            except asyncio.TimeoutError:
+                pass
+        raise HTTPException(
+            status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many pending and running jobs.",
+            headers={"Retry-After": str(self.retry_after(excess))},
+        )
@@ -5,6 +5,12 @@ from fastapi.middleware.cors import CORSMiddleware
 from .config import ServerSetting
 from .task import TaskTable
 from .utils import CustomFastAPI
+from .jobs import IndexedJobs
+from .result import ResultCache
+from .admission import AdmissionControl
+from .scheduler import PriorityScheduler
+from .upload import UploadSessions
+from .dir_list import DirListCache
 
 from executor.engine import Engine
 
@@ -20,12 +26,55 @@ def create_app(
         task_table = TaskTable()
     if engine is None:
         engine = Engine(server_setting.engine_setting)
+    if task_table.cache_dir is None:
+        task_table.cache_dir = engine.cache_dir / "task_cache"
+    jobs = IndexedJobs.adopt(engine.jobs)
+    jobs.max_tombstones = server_setting.job_tombstones_size
+    jobs.add_listener(task_table.on_job_event)
+    jobs.scheduler = PriorityScheduler(
+        server_setting.scheduler_max_running or engine.setting.max_jobs,
+        server_setting.scheduler_aging_rate,
+        server_setting.fair_share_weights
+        if server_setting.user_mode == "hub" else None,
+    )
+    jobs.add_listener(jobs.scheduler.on_event)
+    engine.jobs = jobs
 
     app = CustomFastAPI()
     app.config = server_setting
     app.task_table = task_table
     app.engine = engine
     app.db_engine = None
+    app.result_cache = ResultCache(server_setting.result_cache_size)
+    app.job_archive = None
+    app.job_retention = None
+    app.upload_sessions = UploadSessions(
+        server_setting.upload_session_expire)
+    app.dir_cache = DirListCache(
+        server_setting.dir_cache_max_entries,
+        server_setting.dir_cache_ttl)
+    app.router.add_event_handler("shutdown", task_table.shutdown_actors)
+    app.admission = AdmissionControl(
+        jobs,
+        server_setting.max_active_jobs,
+        server_setting.max_active_jobs_per_user,
+        server_setting.admission_wait_timeout,
+    )
+
+    retention_limits = (
+        server_setting.max_finished_jobs,
+        server_setting.max_finished_job_age,
+        server_setting.max_finished_jobs_per_user,
+    )
+    if (server_setting.job_archive_path is not None) or \
+            any(v is not None for v in retention_limits):
+        from .archive import JobArchive, JobRetention
+        archive_path = server_setting.job_archive_path or \
+            (engine.cache_dir / "job_archive.db")
+        app.job_archive = JobArchive(archive_path)
+        app.job_retention = JobRetention(
+            jobs, app.job_archive, *retention_limits,
+            allow_proxy="proxy" in server_setting.allowed_routers)
 
     @app.get("/server_setting")
     def get_server_setting():
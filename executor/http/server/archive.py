@@ -0,0 +1,325 @@
+import typing as T
+import json
+import asyncio
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from executor.engine.job import Job
+from starlette.concurrency import run_in_threadpool
+
+from .jobs import (
+    IndexedJobs, JobQuery, JobEvent, SortKey, finished_statuses, get_job_type
+)
+from .utils import ser_job
+from .user_db.schemas import User, roles_under
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    status TEXT,
+    job_type TEXT,
+    username TEXT,
+    user_role TEXT,
+    user_id INTEGER,
+    created REAL,
+    stopped REAL,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_created ON jobs (created, id);
+CREATE INDEX IF NOT EXISTS idx_jobs_username ON jobs (username);
+"""
+
+
+def _timestamp(d: T.Optional[datetime]) -> T.Optional[float]:
+    return None if d is None else d.timestamp()
+
+
+class ArchivedJob(T.NamedTuple):
+    id: str
+    data: dict
+    owner: T.Optional[User]
+
+
+class JobArchive(object):
+    """On-disk(SQLite) store of the serialized jobs evicted from memory."""
+
+    def __init__(self, path: T.Union[str, Path]) -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        with self._lock:
+            self._conn.executescript(_schema)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, jobs: T.Iterable[Job], allow_proxy: bool):
+        rows = []
+        for job in jobs:
+            owner: T.Optional[User] = job.attrs.get("user")
+            rows.append((
+                job.id, job.name, job.status, get_job_type(job),
+                None if owner is None else owner.username,
+                None if owner is None else owner.role,
+                None if owner is None else owner.id,
+                _timestamp(job.created_time),
+                _timestamp(job.stoped_time),
+                json.dumps(ser_job(job, allow_proxy), default=str),
+            ))
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO jobs VALUES "
+                "(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    @staticmethod
+    def _to_archived(row: tuple) -> ArchivedJob:
+        job_id, username, role, user_id, data = row
+        owner = None
+        if username is not None:
+            owner = User(username=username, role=role, id=user_id)
+        return ArchivedJob(job_id, json.loads(data), owner)
+
+    def get(self, job_id: str) -> T.Optional[ArchivedJob]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, username, user_role, user_id, data "
+                "FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return self._to_archived(row)
+
+    def remove(self, job_id: str) -> bool:
+        return self.remove_many([job_id]) > 0
+
+    def remove_many(self, job_ids: T.Sequence[str]) -> int:
+        with self._lock, self._conn:
+            cur = self._conn.executemany(
+                "DELETE FROM jobs WHERE id = ?", [(i,) for i in job_ids])
+        return cur.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def query(
+            self, query: JobQuery,
+            cursor: T.Optional[SortKey] = None,
+            limit: T.Optional[int] = None,
+            reverse: bool = False,
+            user: T.Optional[User] = None,
+            ) -> T.Tuple[T.List[ArchivedJob], T.Optional[SortKey]]:
+        """Fetch a page of the archived jobs, ordered by created time,
+        same as `IndexedJobs.query`."""
+        conds: T.List[str] = []
+        params: T.List[T.Any] = []
+
+        def add_in(column: str, values: T.Optional[T.Sequence]):
+            if values is not None:
+                marks = ", ".join("?" for _ in values)
+                conds.append(f"{column} IN ({marks})")
+                params.extend(values)
+
+        def add_cmp(column: str, op: str, value: T.Optional[datetime]):
+            if value is not None:
+                conds.append(f"{column} {op} ?")
+                params.append(value.timestamp())
+
+        add_in("status", query.statuses)
+        add_in("name", query.names)
+        add_in("job_type", query.job_types)
+        add_in("username", query.usernames)
+        add_cmp("created", ">=", query.created_after)
+        add_cmp("created", "<=", query.created_before)
+        add_cmp("stopped", ">=", query.stopped_after)
+        add_cmp("stopped", "<=", query.stopped_before)
+        if user is not None:
+            roles = roles_under(user.role)
+            marks = ", ".join("?" for _ in roles)
+            conds.append(f"(username = ? OR user_role IN ({marks}))")
+            params.append(user.username)
+            params.extend(roles)
+        if cursor is not None:
+            op = "<" if reverse else ">"
+            conds.append(f"(created {op} ? OR (created = ? AND id {op} ?))")
+            params.extend([cursor[0], cursor[0], cursor[1]])
+        sql = "SELECT id, username, user_role, user_id, data, created " \
+              "FROM jobs"
+        if conds:
+            sql += " WHERE " + " AND ".join(conds)
+        order = "DESC" if reverse else "ASC"
+        sql += f" ORDER BY created {order}, id {order}"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        next_key: T.Optional[SortKey] = None
+        if (limit is not None) and (len(rows) > limit):
+            rows = rows[:limit]
+            next_key = (rows[-1][5], rows[-1][0])
+        return [self._to_archived(r[:5]) for r in rows], next_key
+
+
+class JobRetention(object):
+    """Evict the finished jobs from memory to the archive,
+    when exceed the limits of number, age or the per-user number.
+
+    On the job finish events, the limits are enforced in a task of the
+    running loop, the jobs finished in the meantime are archived in one
+    batch, and the SQLite writes run in the thread pool."""
+
+    def __init__(
+            self, jobs: IndexedJobs, archive: JobArchive,
+            max_finished: T.Optional[int] = None,
+            max_age: T.Optional[float] = None,
+            max_per_user: T.Optional[int] = None,
+            allow_proxy: bool = False) -> None:
+        self.jobs = jobs
+        self.archive = archive
+        self.max_finished = max_finished
+        self.max_age = max_age
+        self.max_per_user = max_per_user
+        self.allow_proxy = allow_proxy
+        self._per_user: T.Dict[str, "OrderedDict[str, Job]"] = {}
+        # users have the finished jobs not checked by `max_per_user`
+        self._dirty_users: T.Set[str] = set()
+        self._lock: T.Optional[asyncio.Lock] = None
+        self._task: T.Optional["asyncio.Task[None]"] = None
+        self._scheduled = False
+        for job in jobs.finished.values():
+            self._track(job)
+        jobs.add_listener(self.on_event)
+
+    @staticmethod
+    def _username(job: Job) -> T.Optional[str]:
+        owner: T.Optional[User] = job.attrs.get("user")
+        return None if owner is None else owner.username
+
+    def _track(self, job: Job):
+        username = self._username(job)
+        if username is not None:
+            jobs = self._per_user.setdefault(username, OrderedDict())
+            jobs[job.id] = job
+            jobs.move_to_end(job.id)
+
+    def _untrack(self, job: Job):
+        username = self._username(job)
+        jobs = self._per_user.get(username) if username else None
+        if jobs is not None:
+            jobs.pop(job.id, None)
+            if len(jobs) == 0:
+                self._per_user.pop(username)  # type: ignore
+
+    def on_event(self, event: JobEvent):
+        job = event.job
+        assert job is not None
+        if event.event == "remove":
+            self._untrack(job)
+        elif event.event == "status":
+            if event.status in finished_statuses:
+                self._track(job)
+                username = self._username(job)
+                if username is not None:
+                    self._dirty_users.add(username)
+                self.schedule()
+            else:
+                self._untrack(job)
+
+    def schedule(self):
+        """Enforce the limits in a task of the running loop,
+        or immediately if there is no running loop."""
+        if self._scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.enforce()
+            return
+        self._scheduled = True
+        self._task = loop.create_task(self._run_scheduled())
+
+    async def _run_scheduled(self):
+        self._scheduled = False
+        await self.enforce_async()
+
+    def _collect(self, usernames: T.Iterable[str]) -> T.List[Job]:
+        finished = self.jobs.finished
+        evict: T.Dict[str, Job] = {}
+        finished_iter = iter(finished.values())
+        if self.max_finished is not None:
+            n_evict = len(finished) - self.max_finished
+            for _ in range(max(n_evict, 0)):
+                job = next(finished_iter)
+                evict[job.id] = job
+        if self.max_age is not None:
+            expire = datetime.now() - timedelta(seconds=self.max_age)
+            for job in finished_iter:
+                if (job.stoped_time is None) or (job.stoped_time > expire):
+                    break
+                evict[job.id] = job
+        if self.max_per_user is not None:
+            for username in usernames:
+                self._collect_user(username, evict)
+        return list(evict.values())
+
+    def _collect_user(self, username: str, evict: T.Dict[str, Job]):
+        assert self.max_per_user is not None
+        user_jobs = self._per_user.get(username, OrderedDict())
+        n_over = len(user_jobs) - self.max_per_user - sum(
+            1 for j in evict.values() if self._username(j) == username)
+        for job in user_jobs.values():
+            if n_over <= 0:
+                break
+            if job.id not in evict:
+                evict[job.id] = job
+                n_over -= 1
+
+    def _take_dirty_users(self) -> T.Set[str]:
+        users = self._dirty_users
+        self._dirty_users = set()
+        return users
+
+    def _remove_evicted(self, evict: T.List[Job]) -> T.List[str]:
+        """Remove the archived jobs from memory, return the ids of the jobs
+        removed or rerun during the archiving, which should be dropped
+        from the archive."""
+        stale = []
+        for job in evict:
+            if (job.id in self.jobs) and (job.status in finished_statuses):
+                self.jobs.remove(job)
+                self._untrack(job)
+            else:
+                stale.append(job.id)
+        return stale
+
+    def enforce(self):
+        """Archive and remove the jobs exceed the limits."""
+        evict = self._collect(self._take_dirty_users())
+        if len(evict) == 0:
+            return
+        self.archive.add(evict, self.allow_proxy)
+        stale = self._remove_evicted(evict)
+        if stale:
+            self.archive.remove_many(stale)
+
+    async def enforce_async(self):
+        """Same as `enforce`, but the archive is written
+        in the thread pool."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            evict = self._collect(self._take_dirty_users())
+            if len(evict) == 0:
+                return
+            await run_in_threadpool(
+                self.archive.add, evict, self.allow_proxy)
+            stale = self._remove_evicted(evict)
+            if stale:
+                await run_in_threadpool(self.archive.remove_many, stale)
@@ -5,6 +5,8 @@ from dataclasses import dataclass, field
 
 from executor.engine import EngineSetting
 
+from .user_db.schemas import Role
+
 
 ValidRouters = T.Literal["job", "file", "task", "proxy", "user"]
 
@@ -36,6 +38,41 @@ class ServerSetting:
     jwt_algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     proxy_request_wait_time: float = 0.2
+    job_events_queue_size: int = 1000
+    # number of removed jobs tracked for the /job/changes
+    job_tombstones_size: int = 10000
+    # max number of the concurrent actions of /job/bulk
+    bulk_action_concurrency: int = 16
+    # limits of the pending and running jobs, exceeded calls get 429
+    max_active_jobs: T.Optional[int] = None
+    max_active_jobs_per_user: T.Optional[int] = None
+    # seconds to hold the call for waiting the capacity
+    admission_wait_timeout: float = 0.0
+    # max number of the running jobs started by the priority scheduler,
+    # default to the max_jobs of the engine
+    scheduler_max_running: T.Optional[int] = None
+    # priority gained per second of waiting in the pending queue
+    scheduler_aging_rate: float = 1 / 60
+    # in hub mode, the users share the slots of the scheduler
+    # in proportion to the weights of their roles
+    fair_share_weights: T.Dict[Role, float] = field(default_factory=lambda: {
+        "root": 4.0, "admin": 2.0, "user": 1.0,
+    })
+    allow_pickle_result: bool = False
+    # block size of reading and writing the uploaded and downloaded files
+    upload_chunk_size: int = 1024 * 1024  # bytes
+    # drop the upload sessions without update for this seconds
+    upload_session_expire: float = 24 * 3600
+    # cache of the dir listings, bounded by the total number of entries
+    dir_cache_max_entries: int = 1_000_000
+    # seconds to reuse the listing of an unchanged dir
+    dir_cache_ttl: float = 5.0
+    result_cache_size: int = 256 * 1024 * 1024  # bytes
+    # retention of the finished jobs, the evicted jobs will be archived
+    max_finished_jobs: T.Optional[int] = None
+    max_finished_job_age: T.Optional[float] = None  # seconds
+    max_finished_jobs_per_user: T.Optional[int] = None
+    job_archive_path: T.Optional[T.Union[str, Path]] = None
     engine_setting: EngineSetting = field(default_factory=lambda: EngineSetting(  # noqa: E501
         max_jobs=None,
         print_traceback=True,
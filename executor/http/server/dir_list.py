@@ -0,0 +1,227 @@
+import typing as T
+import os
+import json
+import base64
+import bisect
+import fnmatch
+import stat as stat_module
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from dataclasses import dataclass
+from pathlib import Path
+
+
+SortField = T.Literal["name", "mtime", "size"]
+EntryKey = T.Tuple[T.Any, ...]
+
+
+@dataclass
+class DirEntry:
+    name: str
+    is_dir: bool
+    mtime: float = 0.0
+    size: int = 0
+
+    def to_dict(self, names_only: bool = False) -> dict:
+        if names_only:
+            return {"name": self.name, "isDir": self.is_dir}
+        return {
+            "name": self.name,
+            "isDir": self.is_dir,
+            "modDate": str(datetime.fromtimestamp(self.mtime)),
+            "size": self.size,
+        }
+
+
+def scan_dir(path: Path, with_stat: bool = True) -> T.List[DirEntry]:
+    """List the entries by `os.scandir`, the file type comes from
+    the directory entry, stat is called only if `with_stat`."""
+    entries = []
+    with os.scandir(path) as it:
+        for e in it:
+            try:
+                is_dir = e.is_dir()
+                if not with_stat:
+                    entries.append(DirEntry(e.name, is_dir))
+                    continue
+                try:
+                    stat = e.stat()
+                except FileNotFoundError:
+                    # broken symbolic link
+                    stat = e.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                # removed during the listing
+                continue
+            entries.append(
+                DirEntry(e.name, is_dir, stat.st_mtime, stat.st_size))
+    return entries
+
+
+def entry_key(entry: DirEntry, sort: SortField) -> EntryKey:
+    if sort == "name":
+        return (entry.name,)
+    elif sort == "mtime":
+        return (entry.mtime, entry.name)
+    else:
+        return (entry.size, entry.name)
+
+
+def encode_cursor(sort: SortField, key: EntryKey) -> str:
+    data = json.dumps([sort, *key], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, sort: SortField) -> EntryKey:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except ValueError:
+        raise ValueError(f"Invalid cursor: {cursor}")
+    if (not isinstance(data, list)) or (len(data) < 2) or \
+            (data[0] != sort):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return tuple(data[1:])
+
+
+class DirListing(object):
+    """Entries of a dir, with the sorted orders memoized."""
+
+    def __init__(
+            self, entries: T.List[DirEntry], with_stat: bool,
+            mtime_ns: int = 0, scan_time: float = 0.0) -> None:
+        self.entries = entries
+        self.with_stat = with_stat
+        self.mtime_ns = mtime_ns
+        self.scan_time = scan_time
+        self._sorted: T.Dict[
+            SortField, T.Tuple[T.List[EntryKey], T.List[DirEntry]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def sorted(
+            self, sort: SortField
+            ) -> T.Tuple[T.List[EntryKey], T.List[DirEntry]]:
+        res = self._sorted.get(sort)
+        if res is None:
+            keyed = sorted(
+                ((entry_key(e, sort), e) for e in self.entries),
+                key=lambda x: x[0])
+            res = ([k for k, _ in keyed], [e for _, e in keyed])
+            self._sorted[sort] = res
+        return res
+
+
+def page_entries(
+        listing: DirListing,
+        sort: SortField = "name",
+        reverse: bool = False,
+        pattern: T.Optional[str] = None,
+        cursor: T.Optional[str] = None,
+        limit: T.Optional[int] = None,
+        ) -> T.Tuple[T.List[DirEntry], T.Optional[str]]:
+    """Filter, sort and slice the entries,
+    return the page and the cursor of the next page."""
+    keys, entries = listing.sorted(sort)
+    if pattern is not None:
+        matched = [
+            i for i, e in enumerate(entries)
+            if fnmatch.fnmatch(e.name, pattern)]
+        keys = [keys[i] for i in matched]
+        entries = [entries[i] for i in matched]
+    if not reverse:
+        start = 0
+        if cursor is not None:
+            start = bisect.bisect_right(keys, decode_cursor(cursor, sort))
+        end = len(keys) if limit is None else min(start + limit, len(keys))
+        page = entries[start:end]
+        has_more = end < len(keys)
+    else:
+        end = len(keys)
+        if cursor is not None:
+            end = bisect.bisect_left(keys, decode_cursor(cursor, sort))
+        start = 0 if limit is None else max(end - limit, 0)
+        page = entries[start:end][::-1]
+        has_more = start > 0
+    next_cursor = None
+    if has_more and page:
+        next_cursor = encode_cursor(sort, entry_key(page[-1], sort))
+    return page, next_cursor
+
+
+class DirListCache(object):
+    """LRU cache of the dir listings, bounded by the total number
+    of the cached entries.
+
+    A listing is reused while the mtime of the dir is not changed
+    (entries added, removed or renamed, also by the jobs) and it's not
+    older than `ttl` seconds (the changes of the files' size and mtime
+    don't change the dir's mtime). The file router invalidates the dirs
+    it changes."""
+
+    # dirs changed within this time of the scan may change again
+    # without changing the mtime(coarse timestamp)
+    mtime_granularity_ns = 1_000_000_000
+
+    def __init__(self, max_entries: int = 1_000_000, ttl: float = 5.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._listings: "OrderedDict[Path, DirListing]" = OrderedDict()
+        self._n_entries = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _pop(self, path: Path):
+        listing = self._listings.pop(path, None)
+        if listing is not None:
+            self._n_entries -= len(listing)
+
+    def list(self, path: Path, with_stat: bool = True) -> DirListing:
+        """Get the listing of the dir, scan it if not cached or changed.
+        Should be called in the threads."""
+        dir_stat = os.stat(path)
+        if not stat_module.S_ISDIR(dir_stat.st_mode):
+            raise NotADirectoryError(path)
+        with self._lock:
+            listing = self._listings.get(path)
+            if (listing is not None) and \
+                    (listing.mtime_ns == dir_stat.st_mtime_ns) and \
+                    (time.time() - listing.scan_time < self.ttl) and \
+                    (listing.with_stat or not with_stat):
+                self._listings.move_to_end(path)
+                self.hits += 1
+                return listing
+            self.misses += 1
+        scan_time = time.time()
+        listing = DirListing(
+            scan_dir(path, with_stat), with_stat,
+            dir_stat.st_mtime_ns, scan_time)
+        racy = scan_time * 1e9 - dir_stat.st_mtime_ns < \
+            self.mtime_granularity_ns
+        if racy or (len(listing) > self.max_entries):
+            return listing
+        with self._lock:
+            self._pop(path)
+            self._listings[path] = listing
+            self._n_entries += len(listing)
+            while self._n_entries > self.max_entries:
+                old_path = next(iter(self._listings))
+                self._pop(old_path)
+        return listing
+
+    def invalidate(self, path: Path, recursive: bool = False):
+        """Drop the listing of the dir,
+        and of the sub dirs if `recursive`."""
+        with self._lock:
+            self._pop(path)
+            if recursive:
+                for p in list(self._listings):
+                    if path in p.parents:
+                        self._pop(p)
+
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self._n_entries = 0
@@ -0,0 +1,166 @@
+import typing as T
+import io
+import os
+import asyncio
+import tarfile
+import threading
+import zipfile
+from pathlib import Path
+
+
+ArchiveFormat = T.Literal["zip", "tar", "tar.gz", "tar.zst"]
+
+archive_media_types: T.Dict[str, str] = {
+    "zip": "application/zip",
+    "tar": "application/x-tar",
+    "tar.gz": "application/gzip",
+    "tar.zst": "application/zstd",
+}
+
+
+class ArchiveError(Exception):
+    pass
+
+
+class ArchiveAborted(Exception):
+    """The receiver of the archive is gone."""
+
+
+def iter_entries(
+        paths: T.List[Path], root: Path) -> T.Iterator[T.Tuple[Path, str]]:
+    """Walk the paths, yield the files and dirs with their names in
+    the archive. The symbolic links point to outside of the `root`
+    are skipped."""
+    real_root = os.path.realpath(root)
+
+    def inside_root(p: Path) -> bool:
+        real = os.path.realpath(p)
+        return (real == real_root) or real.startswith(real_root + os.sep)
+
+    for path in paths:
+        if path.is_symlink() and not inside_root(path):
+            continue
+        arc_root = os.path.basename(os.path.normpath(path)) or "archive"
+        yield path, arc_root
+        if not path.is_dir():
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            rel = os.path.relpath(dirpath, path)
+            prefix = arc_root if rel == "." else os.path.join(arc_root, rel)
+            for name in sorted(dirnames) + sorted(filenames):
+                p = Path(dirpath) / name
+                if p.is_symlink() and not inside_root(p):
+                    continue
+                yield p, os.path.join(prefix, name)
+
+
+class ChunkWriter(io.RawIOBase):
+    """Not seekable file object which pass the written data
+    to `send` by chunks."""
+
+    def __init__(
+            self, send: T.Callable[[bytes], None],
+            chunk_size: int = 64 * 1024) -> None:
+        self._send = send
+        self._chunk_size = chunk_size
+        self._buf = bytearray()
+        self._pos = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:  # type: ignore
+        self._buf += b
+        n = len(b)
+        self._pos += n
+        if len(self._buf) >= self._chunk_size:
+            self._send(bytes(self._buf))
+            self._buf.clear()
+        return n
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        if (not self.closed) and self._buf:
+            self._send(bytes(self._buf))
+            self._buf.clear()
+        super().close()
+
+
+def write_archive(
+        entries: T.Iterable[T.Tuple[Path, str]],
+        fmt: ArchiveFormat, fileobj: T.BinaryIO):
+    if fmt == "zip":
+        with zipfile.ZipFile(
+                fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            for path, arcname in entries:
+                zf.write(path, arcname)
+        return
+    if fmt == "tar.zst":
+        import zstandard
+        zst = zstandard.ZstdCompressor().stream_writer(
+            fileobj, closefd=False)
+        with tarfile.open(fileobj=zst, mode="w|") as tar:
+            for path, arcname in entries:
+                tar.add(path, arcname, recursive=False)
+        zst.close()
+        return
+    mode = "w|gz" if fmt == "tar.gz" else "w|"
+    with tarfile.open(fileobj=fileobj, mode=mode) as tar:  # type: ignore
+        for path, arcname in entries:
+            tar.add(path, arcname, recursive=False)
+
+
+def check_format(fmt: ArchiveFormat):
+    if fmt == "tar.zst":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ArchiveError("zstandard is not installed on the server.")
+
+
+async def stream_archive(
+        paths: T.List[Path], root: Path, fmt: ArchiveFormat,
+        chunk_size: int = 64 * 1024,
+        max_chunks: int = 8) -> T.AsyncIterator[bytes]:
+    """Build the archive in a thread while sending it,
+    at most `max_chunks` chunks are buffered."""
+    loop = asyncio.get_running_loop()
+    queue: "asyncio.Queue[T.Union[bytes, BaseException, None]]" = \
+        asyncio.Queue(max_chunks)
+    closed = threading.Event()
+
+    def put(item: T.Union[bytes, BaseException, None]):
+        if closed.is_set():
+            raise ArchiveAborted()
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def produce():
+        try:
+            writer = ChunkWriter(put, chunk_size)
+            write_archive(iter_entries(paths, root), fmt, writer)
+            writer.close()
+            put(None)
+        except ArchiveAborted:
+            pass
+        except BaseException as e:
+            try:
+                put(e)
+            except ArchiveAborted:
+                pass
+
+    loop.run_in_executor(None, produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        # unblock the pending put, the producer stops at the next one
+        closed.set()
+        while not queue.empty():
+            queue.get_nowait()
@@ -0,0 +1,719 @@
+import typing as T
+import asyncio
+import bisect
+import contextlib
+import heapq
+import json
+import uuid
+from collections import OrderedDict, Counter
+from datetime import datetime
+from pathlib import Path
+
+from executor.engine.job import Job
+from executor.engine.job.base import JobStatusType
+from executor.engine.manager import Jobs, JobNotFoundError
+from fastapi.encoders import jsonable_encoder
+
+from .utils import job_to_jobtype, format_datetime, ser_job, JobType
+from .utils.etag import make_etag
+from .user_db.schemas import User, roles_under
+from .scheduler import PriorityScheduler
+
+
+SortKey = T.Tuple[float, str]
+
+finished_statuses: T.List[JobStatusType] = ["done", "failed", "cancelled"]
+active_statuses: T.List[JobStatusType] = ["pending", "running"]
+
+
+def get_job_type(job: Job) -> str:
+    try:
+        return job_to_jobtype(job)
+    except KeyError:  # pragma: no cover
+        return type(job).__name__
+
+
+def job_sort_key(job: Job) -> SortKey:
+    return (job.created_time.timestamp(), job.id)
+
+
+def dump_json(obj: T.Any) -> bytes:
+    """Encode the object to JSON bytes, same as the FastAPI's JSONResponse."""
+    return json.dumps(
+        jsonable_encoder(obj),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def encode_cursor(key: SortKey) -> str:
+    return f"{key[0]!r}:{key[1]}"
+
+
+def decode_cursor(cursor: str) -> SortKey:
+    ts, sep, job_id = cursor.partition(":")
+    if (not sep) or (not job_id):
+        raise ValueError(f"Invalid cursor: {cursor}")
+    return (float(ts), job_id)
+
+
+class SortedIndex(object):
+    """Map index keys to lists of job sort keys,
+    each list is kept ordered by the created time."""
+
+    def __init__(self) -> None:
+        self._lists: T.Dict[T.Hashable, T.List[SortKey]] = {}
+
+    def add(self, key: T.Hashable, skey: SortKey):
+        bisect.insort(self._lists.setdefault(key, []), skey)
+
+    def discard(self, key: T.Hashable, skey: SortKey):
+        lst = self._lists.get(key)
+        if lst is None:
+            return
+        idx = bisect.bisect_left(lst, skey)
+        if idx < len(lst) and lst[idx] == skey:
+            del lst[idx]
+        if len(lst) == 0:
+            self._lists.pop(key)
+
+    def get(self, key: T.Hashable) -> T.List[SortKey]:
+        return self._lists.get(key, [])
+
+    def clear(self):
+        self._lists.clear()
+
+
+def _iter_range(
+        lst: T.List[SortKey],
+        lower: T.Optional[SortKey],
+        upper: T.Optional[SortKey],
+        reverse: bool) -> T.Iterator[SortKey]:
+    """Iterate the keys inside the open interval (lower, upper)."""
+    start = 0 if lower is None else bisect.bisect_right(lst, lower)
+    stop = len(lst) if upper is None else bisect.bisect_left(lst, upper)
+    indexes = range(stop - 1, start - 1, -1) if reverse else range(start, stop)
+    for i in indexes:
+        yield lst[i]
+
+
+def call_in_loop(
+        loop: asyncio.AbstractEventLoop,
+        func: T.Callable, *args: T.Any):
+    """Call the function in the event loop,
+    safe to be called from any thread or event loop."""
+    try:
+        running: T.Optional[asyncio.AbstractEventLoop] = \
+            asyncio.get_running_loop()
+    except RuntimeError:
+        running = None
+    if running is loop:
+        func(*args)
+    else:
+        loop.call_soon_threadsafe(func, *args)
+
+
+def _set_future_result(fut: asyncio.Future, result: T.Any):
+    if not fut.done():
+        fut.set_result(result)
+
+
+def resolve_future(fut: asyncio.Future, result: T.Any):
+    call_in_loop(fut.get_loop(), _set_future_result, fut, result)
+
+
+JobEventType = T.Literal["add", "status", "remove", "overflow"]
+
+
+def call_later_in_thread(func: T.Callable, *args: T.Any):
+    """Call the function in the next iteration of the running loop,
+    if there is no running loop in this thread, call it immediately."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        func(*args)
+    else:
+        loop.call_soon(func, *args)
+
+
+class JobEvent(T.NamedTuple):
+    event: JobEventType
+    job: T.Optional[Job] = None
+    status: T.Optional[str] = None
+
+    def to_dict(self) -> dict:
+        """Convert to a compact JSON-able delta."""
+        if self.job is None:
+            return {'event': self.event}
+        job = self.job
+        res: T.Dict[str, T.Any] = {
+            'event': self.event,
+            'id': job.id,
+        }
+        if self.event == "remove":
+            return res
+        res['status'] = self.status
+        if self.event == "add":
+            res['name'] = job.name
+            res['job_type'] = get_job_type(job)
+            res['created_time'] = format_datetime(job.created_time)
+        res['submit_time'] = format_datetime(job.submit_time)
+        res['stoped_time'] = format_datetime(job.stoped_time)
+        return res
+
+
+class JobEventSubscriber(object):
+    """Receive the job events through a bounded queue.
+
+    When the consumer can't keep up and the queue is full,
+    the pending events are dropped and an "overflow" event is
+    delivered, then the subscriber stop receiving events.
+    The consumer should re-sync the job table after that."""
+
+    def __init__(
+            self, maxsize: int,
+            predicate: T.Optional[T.Callable[[Job], bool]] = None,
+            ) -> None:
+        self.queue: asyncio.Queue[dict] = asyncio.Queue(maxsize)
+        self.loop = asyncio.get_running_loop()
+        self.predicate = predicate
+        self.overflowed = False
+
+    def publish(self, event: JobEvent):
+        assert event.job is not None
+        if self.overflowed:
+            return
+        if (self.predicate is not None) and (not self.predicate(event.job)):
+            return
+        call_in_loop(self.loop, self._put, event.to_dict())
+
+    def _put(self, event: dict):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(JobEvent("overflow").to_dict())
+
+    async def __aiter__(self) -> T.AsyncIterator[dict]:
+        while True:
+            event = await self.queue.get()
+            yield event
+            if event['event'] == "overflow":
+                break
+
+
+Waiter = T.Tuple[T.FrozenSet[str], asyncio.Future]
+
+
+class JobQuery(T.NamedTuple):
+    statuses: T.Optional[T.Sequence[JobStatusType]] = None
+    names: T.Optional[T.Sequence[str]] = None
+    job_types: T.Optional[T.Sequence[JobType]] = None
+    usernames: T.Optional[T.Sequence[str]] = None
+    created_after: T.Optional[datetime] = None
+    created_before: T.Optional[datetime] = None
+    stopped_after: T.Optional[datetime] = None
+    stopped_before: T.Optional[datetime] = None
+
+
+class IndexedJobs(Jobs):
+    """Jobs manager which keep secondary indexes
+    (status, task name, job type, created time) in sync with
+    the job state changes, so the listing of jobs can be answered
+    without scanning the whole job table."""
+
+    def __init__(self, cache_path: T.Optional[Path] = None) -> None:
+        self._refs: T.Dict[str, Job] = {}
+        self._keys: T.Dict[str, SortKey] = {}
+        self._all: T.List[SortKey] = []
+        self.by_status = SortedIndex()
+        self.by_name = SortedIndex()
+        self.by_type = SortedIndex()
+        # owner's username and role of the jobs
+        self.by_owner = SortedIndex()
+        self.by_owner_role = SortedIndex()
+        self._owners: T.Dict[str, T.Tuple[str, str]] = {}
+        # number of the pending and running jobs of the owners
+        self.active_by_owner: T.Counter[str] = Counter()
+        self._waiters: T.Dict[str, T.List[Waiter]] = {}
+        self._subscribers: T.Set[JobEventSubscriber] = set()
+        self._listeners: T.List[T.Callable[[JobEvent], None]] = []
+        # finished jobs, in the order of finishing
+        self.finished: "OrderedDict[str, Job]" = OrderedDict()
+        # increase when any job's state is changed,
+        # versions are kept in the order of changing
+        self.version = 0
+        self.versions: "OrderedDict[str, int]" = OrderedDict()
+        # removed jobs: id -> (version, owner)
+        self.tombstones: "OrderedDict[str, T.Tuple[int, T.Any]]" = \
+            OrderedDict()
+        self.max_tombstones = 10000
+        # the changes before this version are not tracked
+        self.changes_floor = 0
+        # distinguish the versions of different server runs
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.scheduler: T.Optional[PriorityScheduler] = None
+        self._ser_cache: T.Dict[
+            T.Tuple[str, bool],
+            T.Tuple[int, T.Optional[datetime], bytes]] = {}
+        super().__init__(cache_path)
+        self.rebuild_index()
+
+    @classmethod
+    def adopt(cls, jobs: Jobs) -> "IndexedJobs":
+        """Create an indexed manager which share the stores of `jobs`."""
+        if isinstance(jobs, cls):
+            return jobs
+        new = cls()
+        new.cache_path = jobs.cache_path
+        new._stores = jobs._stores
+        new.set_attrs_for_read()
+        new.rebuild_index()
+        return new
+
+    def rebuild_index(self):
+        self._refs.clear()
+        self._keys.clear()
+        self._all.clear()
+        self.finished.clear()
+        self.versions.clear()
+        self.tombstones.clear()
+        self.changes_floor = self.version
+        self._ser_cache.clear()
+        self._owners.clear()
+        self.active_by_owner.clear()
+        for idx in (
+                self.by_status, self.by_name, self.by_type,
+                self.by_owner, self.by_owner_role):
+            idx.clear()
+        for job in super().__iter__():
+            self._index(job)
+
+    def _index(self, job: Job):
+        skey = job_sort_key(job)
+        self._refs[job.id] = job
+        self._keys[job.id] = skey
+        bisect.insort(self._all, skey)
+        self.by_status.add(job.status, skey)
+        self.by_name.add(job.name, skey)
+        self.by_type.add(get_job_type(job), skey)
+        owner: T.Optional[User] = job.attrs.get("user")
+        if owner is not None:
+            self._owners[job.id] = (owner.username, owner.role)
+            self.by_owner.add(owner.username, skey)
+            self.by_owner_role.add(owner.role, skey)
+            if job.status in active_statuses:
+                self.active_by_owner[owner.username] += 1
+        for username in job.attrs.get("shared_users", []):
+            self.by_owner.add(username, skey)
+        if job.status in finished_statuses:
+            self.finished[job.id] = job
+        self.touch(job)
+
+    def _unindex(self, job: Job):
+        skey = self._keys.pop(job.id, None)
+        if skey is None:
+            return
+        self._refs.pop(job.id, None)
+        idx = bisect.bisect_left(self._all, skey)
+        if idx < len(self._all) and self._all[idx] == skey:
+            del self._all[idx]
+        self.by_status.discard(job.status, skey)
+        self.by_name.discard(job.name, skey)
+        self.by_type.discard(get_job_type(job), skey)
+        owner_key = self._owners.pop(job.id, None)
+        if owner_key is not None:
+            self.by_owner.discard(owner_key[0], skey)
+            self.by_owner_role.discard(owner_key[1], skey)
+            if job.status in active_statuses:
+                self._dec_active(owner_key[0])
+        for username in job.attrs.get("shared_users", []):
+            self.by_owner.discard(username, skey)
+        self.finished.pop(job.id, None)
+        self.versions.pop(job.id, None)
+        self._ser_cache.pop((job.id, True), None)
+        self._ser_cache.pop((job.id, False), None)
+
+    def _dec_active(self, username: str):
+        self.active_by_owner[username] -= 1
+        if self.active_by_owner[username] <= 0:
+            del self.active_by_owner[username]
+
+    def n_active(self, username: T.Optional[str] = None) -> int:
+        """Number of the pending and running jobs,
+        of all jobs or the jobs owned by the user."""
+        if username is not None:
+            return self.active_by_owner.get(username, 0)
+        return sum(len(self.by_status.get(s)) for s in active_statuses)
+
+    def share(self, job: Job, user: User):
+        """Share the job with the user besides the owner,
+        the usernames are recorded in `job.attrs['shared_users']`."""
+        owner_key = self._owners.get(job.id)
+        if (owner_key is not None) and (owner_key[0] == user.username):
+            return
+        shared: T.List[str] = job.attrs.setdefault("shared_users", [])
+        if user.username in shared:
+            return
+        shared.append(user.username)
+        skey = self._keys.get(job.id)
+        if skey is not None:
+            self.by_owner.add(user.username, skey)
+            self.touch(job)
+
+    def touch(self, job: Job):
+        """Mark the state of the job is changed."""
+        self.version += 1
+        self.versions[job.id] = self.version
+        self.versions.move_to_end(job.id)
+
+    def _add_tombstone(self, job: Job):
+        self.version += 1
+        self.tombstones[job.id] = (self.version, job.attrs.get("user"))
+        while len(self.tombstones) > self.max_tombstones:
+            _, (version, _) = self.tombstones.popitem(last=False)
+            self.changes_floor = version
+
+    def changes_cursor(self) -> str:
+        """Opaque cursor of the current version, for `changes`."""
+        return f"{self.instance_id}:{self.version}"
+
+    def parse_changes_cursor(self, cursor: str) -> T.Optional[int]:
+        """Get the version from the cursor,
+        None if it's invalid or from another server run."""
+        instance_id, sep, version = cursor.partition(":")
+        if (not sep) or (instance_id != self.instance_id):
+            return None
+        try:
+            return int(version)
+        except ValueError:
+            return None
+
+    def changes(self, since: int) -> T.Optional[
+            T.Tuple[T.List[Job], T.List[T.Tuple[str, T.Any]]]]:
+        """Get the jobs changed and the removed (id, owner)
+        after the version `since`, in the order of changing.
+        Return None if the changes since the version are not tracked,
+        the client should fetch all jobs again."""
+        if (since < self.changes_floor) or (since > self.version):
+            return None
+        changed: T.List[Job] = []
+        for job_id, version in reversed(self.versions.items()):
+            if version <= since:
+                break
+            changed.append(self._refs[job_id])
+        removed: T.List[T.Tuple[str, T.Any]] = []
+        for job_id, (version, owner) in reversed(self.tombstones.items()):
+            if version <= since:
+                break
+            removed.append((job_id, owner))
+        changed.reverse()
+        removed.reverse()
+        return changed, removed
+
+    def job_etag(self, job: Job) -> str:
+        """Entity tag of the job's state."""
+        version = self.versions.get(job.id, 0)
+        stopped = int(job.stoped_time is not None)
+        parts = [self.instance_id, job.id, f"{version}.{stopped}"]
+        position = self.queue_position(job)
+        if position is not None:
+            # the position changes with the other jobs
+            parts.append(f"q{position}")
+        return make_etag(*parts)
+
+    def queue_position(self, job: Job) -> T.Optional[int]:
+        if self.scheduler is None:
+            return None
+        return self.scheduler.position(job.id)
+
+    def table_etag(self, *parts: T.Any) -> str:
+        """Entity tag of the job table, with extra parts
+        (e.g. the user's visibility)."""
+        if self.scheduler is not None:
+            parts = (f"q{self.scheduler.version}",) + parts
+        return make_etag(self.instance_id, self.version, *parts)
+
+    def ser_job_json(self, job: Job, allow_proxy: bool) -> bytes:
+        """Serialize the job to JSON bytes,
+        cached until the state version of the job is changed."""
+        key = (job.id, allow_proxy)
+        version = self.versions.get(job.id)
+        cached = self._ser_cache.get(key)
+        # the position in the pending queue changes with the other jobs
+        queued = self.queue_position(job) is not None
+        # the stoped_time is set after the status changed
+        if (cached is not None) and (cached[0] == version) and \
+                (cached[1] is job.stoped_time) and (not queued):
+            return cached[2]
+        data = dump_json(ser_job(job, allow_proxy))
+        if (version is not None) and (not queued):
+            self._ser_cache[key] = (version, job.stoped_time, data)
+        return data
+
+    def add(self, job: Job):
+        super().add(job)
+        self._unindex(job)
+        self.tombstones.pop(job.id, None)
+        self._index(job)
+        self._wake_waiters(job)
+        call_later_in_thread(self._publish, JobEvent("add", job, job.status))
+
+    def remove(self, job: Job):
+        super().remove(job)
+        if job.id in self._refs:
+            self._add_tombstone(job)
+        self._unindex(job)
+        self._wake_waiters(job, removed=True)
+        call_later_in_thread(self._publish, JobEvent("remove", job))
+
+    def move_job_store(
+            self, job: Job,
+            new_status: JobStatusType,
+            old_status: T.Optional[JobStatusType] = None):
+        if old_status is None:
+            old_status = job.status
+        super().move_job_store(job, new_status, old_status)
+        if old_status == new_status:
+            return
+        skey = self._keys.get(job.id)
+        if skey is not None:
+            self.by_status.discard(old_status, skey)
+            self.by_status.add(new_status, skey)
+            if new_status in finished_statuses:
+                self.finished[job.id] = job
+                self.finished.move_to_end(job.id)
+            else:
+                self.finished.pop(job.id, None)
+            owner_key = self._owners.get(job.id)
+            if owner_key is not None:
+                was_active = old_status in active_statuses
+                is_active = new_status in active_statuses
+                if is_active and not was_active:
+                    self.active_by_owner[owner_key[0]] += 1
+                elif was_active and not is_active:
+                    self._dec_active(owner_key[0])
+            self.touch(job)
+        self._wake_waiters(job, new_status)
+        # publish after the status setter finished(e.g. set the stoped_time)
+        call_later_in_thread(
+            self._publish, JobEvent("status", job, new_status))
+
+    def _wake_waiters(
+            self, job: Job,
+            new_status: T.Optional[str] = None,
+            removed: bool = False):
+        waiters = self._waiters.get(job.id)
+        if not waiters:
+            return
+        status = new_status or job.status
+        for statuses, fut in waiters:
+            if removed or (status in statuses):
+                resolve_future(fut, status)
+
+    def _publish(self, event: JobEvent):
+        for listener in self._listeners:
+            listener(event)
+        for sub in list(self._subscribers):
+            sub.publish(event)
+
+    def add_listener(self, listener: T.Callable[[JobEvent], None]):
+        """Add a callback of the job events,
+        it's called in the event loop thread."""
+        self._listeners.append(listener)
+
+    @contextlib.contextmanager
+    def subscribe(
+            self, maxsize: int,
+            predicate: T.Optional[T.Callable[[Job], bool]] = None,
+            ) -> T.Iterator[JobEventSubscriber]:
+        """Subscribe the job events(add, status change and remove)."""
+        sub = JobEventSubscriber(maxsize, predicate)
+        self._subscribers.add(sub)
+        try:
+            yield sub
+        finally:
+            self._subscribers.discard(sub)
+
+    async def wait_status(
+            self, job: Job,
+            statuses: T.Iterable[str],
+            timeout: T.Optional[float] = None) -> bool:
+        """Wait until the job transit to one of the `statuses`,
+        or the job is removed from the manager.
+
+        Return False if timeout, else return True."""
+        statuses = frozenset(statuses)
+        if (job.status in statuses) or (job.id not in self._refs):
+            return True
+        fut = asyncio.get_running_loop().create_future()
+        waiter: Waiter = (statuses, fut)
+        waiters = self._waiters.setdefault(job.id, [])
+        waiters.append(waiter)
+        try:
+            await asyncio.wait_for(fut, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            waiters.remove(waiter)
+            if len(waiters) == 0:
+                self._waiters.pop(job.id, None)
+
+    def clear(self, statuses: T.List[JobStatusType]):
+        super().clear(statuses)
+        self.rebuild_index()
+
+    def update_from_cache(self, clear_old=True):
+        super().update_from_cache(clear_old=clear_old)
+        self.rebuild_index()
+
+    def get_job_by_id(self, job_id: str) -> Job:
+        try:
+            return self._refs[job_id]
+        except KeyError:
+            raise JobNotFoundError(job_id)
+
+    def __iter__(self):
+        """Iterate all jobs in the order of created time."""
+        for skey in list(self._all):
+            yield self._refs[skey[1]]
+
+    def __len__(self):
+        return len(self._refs)
+
+    def _candidates(
+            self, query: JobQuery,
+            user: T.Optional[User] = None,
+            ) -> T.List[T.List[SortKey]]:
+        """Select the smallest index which can answer the query."""
+        choices: T.List[T.List[T.List[SortKey]]] = []
+        if user is not None:
+            choices.append(
+                [self.by_owner.get(user.username)] +
+                [self.by_owner_role.get(r) for r in roles_under(user.role)])
+        if query.statuses is not None:
+            choices.append([self.by_status.get(s) for s in query.statuses])
+        if query.names is not None:
+            choices.append([self.by_name.get(n) for n in query.names])
+        if query.job_types is not None:
+            choices.append([self.by_type.get(t) for t in query.job_types])
+        if query.usernames is not None:
+            choices.append([self.by_owner.get(u) for u in query.usernames])
+        if len(choices) == 0:
+            return [self._all]
+        return min(choices, key=lambda lists: sum(len(lst) for lst in lists))
+
+    def _visible(self, job: Job, user: User) -> bool:
+        """Same as `user_can_access`, check by the indexed owner."""
+        if user.username in job.attrs.get("shared_users", ()):
+            return True
+        owner_key = self._owners.get(job.id)
+        if owner_key is None:
+            return False
+        username, role = owner_key
+        return (username == user.username) or \
+            (role in roles_under(user.role))
+
+    def _match(self, job: Job, query: JobQuery) -> bool:
+        if (query.statuses is not None) and \
+                (job.status not in query.statuses):
+            return False
+        if (query.names is not None) and (job.name not in query.names):
+            return False
+        if (query.job_types is not None) and \
+                (get_job_type(job) not in query.job_types):
+            return False
+        if query.usernames is not None:
+            owner_key = self._owners.get(job.id)
+            usernames = list(job.attrs.get("shared_users", []))
+            if owner_key is not None:
+                usernames.append(owner_key[0])
+            if not any(u in query.usernames for u in usernames):
+                return False
+        if (query.stopped_after is not None) or \
+                (query.stopped_before is not None):
+            stopped = job.stoped_time
+            if stopped is None:
+                return False
+            if (query.stopped_after is not None) and \
+                    (stopped < query.stopped_after):
+                return False
+            if (query.stopped_before is not None) and \
+                    (stopped > query.stopped_before):
+                return False
+        return True
+
+    def iter_query(
+            self, query: JobQuery,
+            cursor: T.Optional[SortKey] = None,
+            reverse: bool = False,
+            user: T.Optional[User] = None,
+            ) -> T.Iterator[T.Tuple[SortKey, Job]]:
+        """Iterate the jobs match the query, ordered by created time.
+        The iteration start after the `cursor`.
+        If `user` is given, only iterate the jobs the user can access."""
+        lower: T.Optional[SortKey] = None
+        upper: T.Optional[SortKey] = None
+        if query.created_after is not None:
+            lower = (query.created_after.timestamp(), "")
+        if query.created_before is not None:
+            # all job ids are greater than the empty string
+            upper = (query.created_before.timestamp(), "\uffff")
+        if cursor is not None:
+            if reverse:
+                upper = cursor if upper is None else min(upper, cursor)
+            else:
+                lower = cursor if lower is None else max(lower, cursor)
+        iters = [
+            _iter_range(lst, lower, upper, reverse)
+            for lst in self._candidates(query, user)
+        ]
+        skeys = iters[0] if len(iters) == 1 else \
+            heapq.merge(*iters, reverse=reverse)
+        last: T.Optional[SortKey] = None
+        for skey in skeys:
+            # the owner's index and role's index may overlap
+            if skey == last:
+                continue
+            last = skey
+            job = self._refs[skey[1]]
+            if (user is not None) and (not self._visible(job, user)):
+                continue
+            if self._match(job, query):
+                yield skey, job
+
+    def count(
+            self, query: JobQuery,
+            user: T.Optional[User] = None) -> int:
+        """Count the jobs match the query."""
+        return sum(1 for _ in self.iter_query(query, user=user))
+
+    def query(
+            self, query: JobQuery,
+            cursor: T.Optional[SortKey] = None,
+            limit: T.Optional[int] = None,
+            reverse: bool = False,
+            predicate: T.Optional[T.Callable[[Job], bool]] = None,
+            user: T.Optional[User] = None,
+            ) -> T.Tuple[T.List[Job], T.Optional[SortKey]]:
+        """Fetch a page of jobs match the query.
+
+        Return the jobs and the cursor for fetching the next page,
+        the cursor is None if there are no more jobs."""
+        jobs: T.List[Job] = []
+        last: T.Optional[SortKey] = None
+        for skey, job in self.iter_query(query, cursor, reverse, user):
+            if (predicate is not None) and (not predicate(job)):
+                continue
+            if (limit is not None) and (len(jobs) >= limit):
+                return jobs, last
+            jobs.append(job)
+            last = skey
+        return jobs, None
@@ -0,0 +1,192 @@
+import typing as T
+import io
+import pickle
+import threading
+from collections import OrderedDict
+
+from executor.engine.job import Job
+
+
+ResultFormat = T.Literal["json", "msgpack", "pickle", "raw", "npy"]
+
+format_media_types: T.Dict[ResultFormat, str] = {
+    "json": "application/json",
+    "msgpack": "application/msgpack",
+    "pickle": "application/x-python-pickle",
+    "raw": "application/octet-stream",
+    "npy": "application/x-npy",
+}
+
+_media_type_to_format: T.Dict[str, ResultFormat] = {
+    v: k for k, v in format_media_types.items()}
+_media_type_to_format["application/x-msgpack"] = "msgpack"
+_media_type_to_format["application/python-pickle"] = "pickle"
+
+
+class ResultEncodeError(Exception):
+    pass
+
+
+def negotiate_format(accept: T.Optional[str]) -> ResultFormat:
+    """Select the result format by the Accept header,
+    fallback to JSON."""
+    if not accept:
+        return "json"
+    candidates: T.List[T.Tuple[float, int, ResultFormat]] = []
+    for idx, part in enumerate(accept.split(",")):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        fmt = _media_type_to_format.get(media_type.lower())
+        if fmt is None:
+            continue
+        q = 1.0
+        for param in params:
+            key, _, val = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            candidates.append((-q, idx, fmt))
+    if len(candidates) == 0:
+        return "json"
+    return min(candidates)[2]
+
+
+# the encoded result is sent by chunks of the buffers,
+# the large buffers are the views of the result without copy
+Buffers = T.List[T.Union[bytes, memoryview]]
+
+
+def _encode_msgpack(obj: T.Any) -> Buffers:
+    try:
+        import msgpack
+    except ImportError:
+        raise ResultEncodeError("msgpack is not installed on the server.")
+    try:
+        return [msgpack.packb(obj)]
+    except TypeError as e:
+        raise ResultEncodeError(f"Can't encode the result as msgpack: {e}")
+
+
+def _encode_raw(obj: T.Any) -> Buffers:
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        view = memoryview(obj)
+        if not view.c_contiguous:
+            return [view.tobytes()]
+        return [view.cast("B")]
+    if isinstance(obj, str):
+        return [obj.encode("utf-8")]
+    raise ResultEncodeError(
+        f"Can't encode the result of type {type(obj).__name__} as raw bytes.")
+
+
+def _encode_npy(obj: T.Any) -> Buffers:
+    try:
+        import numpy as np
+    except ImportError:
+        raise ResultEncodeError("numpy is not installed on the server.")
+    arr = np.ascontiguousarray(obj)
+    if arr.dtype.hasobject:
+        raise ResultEncodeError(
+            "Can't encode the result as npy: object arrays need pickle.")
+    header = io.BytesIO()
+    d = np.lib.format.header_data_from_array_1_0(arr)
+    try:
+        np.lib.format.write_array_header_1_0(header, d)
+    except ValueError:
+        # the header is too large for the version 1.0
+        header = io.BytesIO()
+        np.lib.format.write_array_header_2_0(header, d)
+    data = arr.reshape(-1).view(np.uint8).data
+    return [header.getvalue(), data]
+
+
+def _encode_pickle(obj: T.Any) -> Buffers:
+    try:
+        return [pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)]
+    except Exception as e:
+        raise ResultEncodeError(f"Can't pickle the result: {e}")
+
+
+_encoders: T.Dict[ResultFormat, T.Callable[[T.Any], Buffers]] = {
+    "msgpack": _encode_msgpack,
+    "raw": _encode_raw,
+    "npy": _encode_npy,
+    "pickle": _encode_pickle,
+}
+
+
+def encode_result(obj: T.Any, fmt: ResultFormat) -> Buffers:
+    """Encode the result to the buffers, raise ResultEncodeError
+    if the result can't be encoded in the format."""
+    return _encoders[fmt](obj)
+
+
+def iter_chunks(
+        buffers: Buffers,
+        chunk_size: int = 256 * 1024) -> T.Iterator[bytes]:
+    for buf in buffers:
+        view = memoryview(buf)
+        for start in range(0, len(view), chunk_size):
+            yield bytes(view[start:start + chunk_size])
+
+
+class ResultCache(object):
+    """LRU cache of the encoded job results, bounded by the total size.
+    The entries are keyed on the job's stopped time,
+    so a re-run job will not hit the old result."""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.size = 0
+        self._cache: "OrderedDict[T.Tuple, bytes]" = OrderedDict()
+        # the streamed chunks are cached in the thread pool
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(job: Job, fmt: ResultFormat) -> T.Tuple:
+        return (job.id, job.stoped_time, fmt)
+
+    def get(self, job: Job, fmt: ResultFormat) -> T.Optional[bytes]:
+        key = self._key(job, fmt)
+        with self._lock:
+            data = self._cache.get(key)
+            if data is not None:
+                self._cache.move_to_end(key)
+        return data
+
+    def set(self, job: Job, fmt: ResultFormat, data: bytes):
+        if len(data) > self.max_size:
+            return
+        key = self._key(job, fmt)
+        with self._lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._cache[key] = data
+            self.size += len(data)
+            while self.size > self.max_size:
+                _, evicted = self._cache.popitem(last=False)
+                self.size -= len(evicted)
+
+    def tee(
+            self, job: Job, fmt: ResultFormat,
+            chunks: T.Iterable[bytes]) -> T.Iterator[bytes]:
+        """Yield the chunks and cache them when all of them are sent,
+        the result larger than the cache is not collected."""
+        parts: T.Optional[T.List[bytes]] = []
+        size = 0
+        for chunk in chunks:
+            if parts is not None:
+                size += len(chunk)
+                if size > self.max_size:
+                    parts = None
+                else:
+                    parts.append(chunk)
+            yield chunk
+        if parts is not None:
+            self.set(job, fmt, b"".join(parts))
+
+    def __len__(self):
+        return len(self._cache)
@@ -3,13 +3,26 @@ import os
 import shutil
 from os.path import abspath, join
 from pathlib import Path
-from datetime import datetime
+from urllib.parse import quote
 
-from fastapi import APIRouter, HTTPException, status, File, UploadFile, Depends
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi import (
+    APIRouter, HTTPException, status, File, UploadFile, Depends, Request,
+    Query,
+)
+from fastapi.responses import (
+    FileResponse, JSONResponse, StreamingResponse,
+)
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
 from ..utils import auth, get_app, CustomFastAPI
+from ..utils.file_range import file_response
+from ..upload import UploadSession, copy_file
+from ..dir_list import SortField, page_entries
+from ..file_archive import (
+    ArchiveFormat, ArchiveError, archive_media_types, check_format,
+    stream_archive,
+)
 
 from ..user_db.schemas import User
 
@@ -19,6 +32,14 @@ router = APIRouter(prefix="/file")
 
 class ListDirRequest(BaseModel):
     path: str
+    sort: SortField = "name"
+    reverse: bool = False
+    # glob pattern of the names, e.g. "*.csv"
+    pattern: T.Optional[str] = None
+    limit: T.Optional[int] = Field(None, ge=1)
+    cursor: T.Optional[str] = None
+    # only list the names and types, skip the stat of the entries
+    names_only: bool = False
 
 
 def is_sub_path(parent: Path, sub: Path) -> bool:
@@ -50,35 +71,39 @@ def get_user_path(
 @router.post("/list_dir")
 async def list_dir(
         req: ListDirRequest,
-        user_path: Path = Depends(get_user_path)):
+        user_path: Path = Depends(get_user_path),
+        app: "CustomFastAPI" = Depends(get_app)):
+    """List the entries of the dir, sorted by `sort`.
+    When the result is truncated by `limit`, the cursor for
+    fetching the next page is returned in the `X-Next-Cursor` header."""
     path = get_path(user_path, req.path)
-    if (not path.exists()) or (not path.is_dir()):
+    names_only = req.names_only and (req.sort == "name")
+    try:
+        listing = await run_in_threadpool(
+            app.dir_cache.list, path, not names_only)
+    except (FileNotFoundError, NotADirectoryError):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The dir is not exists.")
-    else:
-        files = []
-        for p in path.glob("*"):
-            stat = p.stat()
-            f = {
-                "name": p.name,
-                "isDir": p.is_dir(),
-                "modDate": str(datetime.fromtimestamp(stat.st_mtime)),
-                "size": stat.st_size,
-            }
-            files.append(f)
-        return files
+    try:
+        page, next_cursor = await run_in_threadpool(
+            page_entries, listing, req.sort, req.reverse, req.pattern,
+            req.cursor, req.limit)
+    except ValueError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=str(e))
+    headers = {}
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    return JSONResponse(
+        [e.to_dict(req.names_only) for e in page], headers=headers)
 
 
 class DownloadReq(BaseModel):
     path: str
 
 
-@router.post("/download")
-async def download(
-        req: DownloadReq,
-        user_path: Path = Depends(get_user_path)):
-    path = get_path(user_path, req.path)
+def get_file_path(user_path: Path, path_str: str) -> Path:
+    path = get_path(user_path, path_str)
     if not path.exists():
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -87,20 +112,198 @@ async def download(
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="The path is not a file.")
+    return path
+
+
+@router.post("/download")
+async def download(
+        req: DownloadReq,
+        user_path: Path = Depends(get_user_path)):
+    path = get_file_path(user_path, req.path)
     return FileResponse(abspath(path))
 
 
+@router.get("/download")
+async def download_file(
+        request: Request,
+        path: str,
+        user_path: Path = Depends(get_user_path),
+        app: "CustomFastAPI" = Depends(get_app)):
+    """Download the file, support the range requests
+    (resume or parallel segments) and the conditional requests."""
+    file_path = get_file_path(user_path, path)
+    return await file_response(
+        request, file_path, app.config.upload_chunk_size)
+
+
 @router.post("/upload")
 async def upload(
         path: str,
         files: T.List[UploadFile] = File(...),
-        user_path: Path = Depends(get_user_path)):
+        user_path: Path = Depends(get_user_path),
+        app: "CustomFastAPI" = Depends(get_app)):
     for file in files:
         assert file.filename is not None
         file_path = get_path(user_path, join(path, file.filename))
-        content = await file.read()
-        with open(file_path, 'wb') as f:
-            f.write(content)
+        await run_in_threadpool(
+            copy_file, file.file, file_path, app.config.upload_chunk_size)
+        app.dir_cache.invalidate(file_path.parent)
+
+
+class ArchiveReq(BaseModel):
+    paths: T.List[str] = Field(..., min_length=1)
+    format: ArchiveFormat = "zip"
+
+
+@router.post("/archive")
+async def download_archive(
+        req: ArchiveReq,
+        user_path: Path = Depends(get_user_path),
+        app: "CustomFastAPI" = Depends(get_app)):
+    """Download the files and dirs as an archive, the archive is built
+    while sending, without the temporary file."""
+    paths: T.List[Path] = []
+    for p in req.paths:
+        path = get_path(user_path, p)
+        if not path.exists():
+            raise HTTPException(
+                status.HTTP_404_NOT_FOUND,
+                detail=f"The path is not exists: {p}")
+        paths.append(path)
+    try:
+        check_format(req.format)
+    except ArchiveError as e:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if len(paths) == 1:
+        name = os.path.basename(os.path.normpath(paths[0])) or "archive"
+    else:
+        name = "archive"
+    filename = quote(f"{name}.{req.format}")
+    return StreamingResponse(
+        stream_archive(
+            paths, user_path, req.format, app.config.upload_chunk_size),
+        media_type=archive_media_types[req.format],
+        headers={
+            "Content-Disposition": f"attachment; filename*=UTF-8''{filename}"
+        })
+
+
+class UploadSessionReq(BaseModel):
+    path: str
+    size: int = Field(..., ge=0)
+    # the expected sha256 hex digest of the file
+    sha256: T.Optional[str] = None
+
+
+def get_upload_session(
+        session_id: str,
+        user_path: Path = Depends(get_user_path),
+        app: "CustomFastAPI" = Depends(get_app)) -> UploadSession:
+    session = app.upload_sessions.get(session_id)
+    if (session is None) or (session.user_path != user_path):
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND,
+            detail=f"Upload session not found: {session_id}")
+    return session
+
+
+@router.post("/upload_session")
+async def create_upload_session(
+        req: UploadSessionReq,
+        user_path: Path = Depends(get_user_path),
+        app: "CustomFastAPI" = Depends(get_app)):
+    """Create a session for uploading the file by chunks,
+    the chunks are sent by `PUT /file/upload_session/{id}?offset=N`
+    in any order, and the file is moved to the path when finalized."""
+    file_path = get_path(user_path, req.path)
+    if not file_path.parent.is_dir():
+        raise HTTPException(
+            status.HTTP_404_NOT_FOUND,
+            detail=f"The dir is not exists: {file_path.parent}")
+    session = await run_in_threadpool(
+        UploadSession, user_path, file_path, req.size, req.sha256)
+    app.upload_sessions.add(session)
+    return session.to_dict()
+
+
+@router.get("/upload_session/{session_id}")
+async def get_upload_session_status(
+        session: UploadSession = Depends(get_upload_session)):
+    """The received ranges of the session, for resuming the upload."""
+    return session.to_dict()
+
+
+@router.put("/upload_session/{session_id}")
+async def upload_chunk(
+        request: Request,
+        offset: int = Query(..., ge=0),
+        session: UploadSession = Depends(get_upload_session),
+        app: "CustomFastAPI" = Depends(get_app)):
+    """Write the request body to the file at the offset.
+    The body is streamed, the data received before a broken connection
+    is kept."""
+    exceed_error = HTTPException(
+        status.HTTP_400_BAD_REQUEST,
+        detail="The chunk exceeds the size of the file.")
+    length = request.headers.get("content-length")
+    if length is not None:
+        try:
+            n_bytes = int(length)
+        except ValueError:
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid Content-Length: {length}")
+        if offset + n_bytes > session.size:
+            raise exceed_error
+    chunk_size = app.config.upload_chunk_size
+    buf = bytearray()
+    pos = offset
+    async for data in request.stream():
+        if pos + len(buf) + len(data) > session.size:
+            raise exceed_error
+        buf += data
+        if len(buf) >= chunk_size:
+            await run_in_threadpool(session.write, pos, bytes(buf))
+            pos += len(buf)
+            buf.clear()
+    if buf:
+        await run_in_threadpool(session.write, pos, bytes(buf))
+    await session.update_hash(chunk_size)
+    return session.to_dict()
+
+
+@router.post("/upload_session/{session_id}/finalize")
+async def finalize_upload_session(
+        session: UploadSession = Depends(get_upload_session),
+        app: "CustomFastAPI" = Depends(get_app)):
+    if not session.complete:
+        raise HTTPException(
+            status.HTTP_409_CONFLICT,
+            detail="The file is not completely received.")
+    await session.update_hash(app.config.upload_chunk_size)
+    app.upload_sessions.pop(session.id)
+    sha256 = session.sha256()
+    if (session.expected_sha256 is not None) and \
+            (session.expected_sha256.lower() != sha256):
+        await run_in_threadpool(session.close)
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            detail=f"Checksum mismatch, got sha256: {sha256}")
+    await run_in_threadpool(session.finalize)
+    app.dir_cache.invalidate(session.target.parent)
+    return {
+        "path": str(session.target.relative_to(session.user_path)),
+        "size": session.size,
+        "sha256": sha256,
+    }
+
+
+@router.delete("/upload_session/{session_id}")
+async def abort_upload_session(
+        session: UploadSession = Depends(get_upload_session),
+        app: "CustomFastAPI" = Depends(get_app)):
+    app.upload_sessions.pop(session.id)
+    await run_in_threadpool(session.close)
 
 
 class DeleteReq(BaseModel):
@@ -110,7 +313,8 @@ class DeleteReq(BaseModel):
 @router.post("/delete")
 async def delete(
         req: DeleteReq,
-        user_path: Path = Depends(get_user_path)):
+        user_path: Path = Depends(get_user_path),
+        app: "CustomFastAPI" = Depends(get_app)):
     paths_to_delete: T.List[Path] = []
     for p in req.paths:
         path = get_path(user_path, p)
@@ -118,8 +322,10 @@ async def delete(
     for path in paths_to_delete:
         if path.is_dir():
             shutil.rmtree(path)
+            app.dir_cache.invalidate(path, recursive=True)
         else:
             os.remove(path)
+        app.dir_cache.invalidate(path.parent)
 
 
 class MoveReq(BaseModel):
@@ -130,7 +336,8 @@ class MoveReq(BaseModel):
 @router.post("/move")
 async def move(
         req: MoveReq,
-        user_path: Path = Depends(get_user_path)):
+        user_path: Path = Depends(get_user_path),
+        app: "CustomFastAPI" = Depends(get_app)):
     path_dest = get_path(user_path, req.destination)
     if not path_dest.is_dir():
         raise HTTPException(
@@ -144,3 +351,7 @@ async def move(
         shutil.move(
             str(path),
             str(path_dest / path.name))
+        app.dir_cache.invalidate(path, recursive=True)
+        app.dir_cache.invalidate(path_dest / path.name, recursive=True)
+        app.dir_cache.invalidate(path.parent)
+    app.dir_cache.invalidate(path_dest)
@@ -1,7 +1,15 @@
 import typing as T
 import asyncio
+import functools
+import json
+from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import (
+    APIRouter, HTTPException, status, Depends, Query, Response,
+    Request, WebSocket
+)
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
 from executor.engine import Engine
@@ -10,22 +18,37 @@ from executor.engine.job import Job
 from executor.engine.job.base import JobStatusType
 from executor.engine.manager import JobNotFoundError
 
-from ..utils import ser_job, get_app, CustomFastAPI
-from ..utils.auth import get_current_user, check_user_job, user_can_access
+from ..utils import ser_job, get_app, CustomFastAPI, JobType
+from ..utils.logfile import read_log_async, follow_log_response
+from ..utils.etag import not_modified, user_tag
+from ..utils.auth import (
+    get_current_user, get_websocket_user, check_user_job, user_can_access,
+    user_can_manage, user_can_access_owner
+)
 from ..user_db.schemas import User
+from ..result import (
+    ResultFormat, ResultEncodeError, negotiate_format, encode_result,
+    format_media_types, iter_chunks
+)
+from ..jobs import (
+    IndexedJobs, JobQuery, encode_cursor, decode_cursor, finished_statuses,
+    dump_json
+)
 
 
 router = APIRouter(prefix="/job")
 
 
-def get_job(engine: Engine, job_id: str, user: T.Optional[User]) -> Job:
+def get_job(
+        engine: Engine, job_id: str, user: T.Optional[User],
+        manage: bool = False) -> Job:
     try:
         job = engine.jobs.get_job_by_id(job_id)
     except JobNotFoundError:
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST,
             detail="Job not found.")
-    job = check_user_job(user, job)
+    job = check_user_job(user, job, manage)
     return job
 
 
@@ -33,59 +56,283 @@ def is_allow_proxy(app: "CustomFastAPI") -> bool:
     return "proxy" in app.config.allowed_routers
 
 
+def get_job_index(app: "CustomFastAPI") -> IndexedJobs:
+    jobs = app.engine.jobs
+    assert isinstance(jobs, IndexedJobs)
+    return jobs
+
+
+def job_query_params(
+        statuses: T.Optional[T.List[JobStatusType]] = Query(
+            None, alias="status"),
+        task_names: T.Optional[T.List[str]] = Query(None, alias="task_name"),
+        job_types: T.Optional[T.List[JobType]] = Query(None, alias="job_type"),
+        usernames: T.Optional[T.List[str]] = Query(None, alias="username"),
+        created_after: T.Optional[datetime] = None,
+        created_before: T.Optional[datetime] = None,
+        stopped_after: T.Optional[datetime] = None,
+        stopped_before: T.Optional[datetime] = None,
+        ) -> JobQuery:
+    return JobQuery(
+        statuses=statuses,
+        names=task_names,
+        job_types=job_types,
+        usernames=usernames,
+        created_after=created_after,
+        created_before=created_before,
+        stopped_after=stopped_after,
+        stopped_before=stopped_before,
+    )
+
+
+def user_predicate(
+        user: T.Optional[User]) -> T.Optional[T.Callable[[Job], bool]]:
+    if user is None:
+        return None
+    return functools.partial(user_can_access, user)
+
+
+def json_list_response(
+        items: T.Iterable[bytes],
+        headers: T.Optional[T.Dict[str, str]] = None) -> Response:
+    """Join the pre-encoded JSON items into a JSON array response."""
+    return Response(
+        b"[" + b",".join(items) + b"]",
+        media_type="application/json",
+        headers=headers)
+
+
+def parse_cursor(cursor: T.Optional[str]):
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid cursor: {cursor}")
+
+
+async def get_archived_job(
+        app: "CustomFastAPI", job_id: str,
+        user: T.Optional[User]) -> T.Optional[dict]:
+    """Get the serialized job from the archive."""
+    if app.job_archive is None:
+        return None
+    archived = await run_in_threadpool(app.job_archive.get, job_id)
+    if archived is None:
+        return None
+    if (user is not None) and \
+            (not user_can_access_owner(user, archived.owner)):
+        raise HTTPException(
+            status.HTTP_403_FORBIDDEN,
+            detail="Can't access to the job."
+        )
+    return archived.data
+
+
+async def remove_archived_job(
+        app: "CustomFastAPI", job_id: str,
+        user: T.Optional[User]) -> T.Optional[dict]:
+    """Delete the job from the archive, return the serialized job."""
+    archived = await get_archived_job(app, job_id, user)
+    if archived is not None:
+        assert app.job_archive is not None
+        await run_in_threadpool(app.job_archive.remove, job_id)
+    return archived
+
+
 @router.get("/status/{job_id}")
 async def get_job_status(
         job_id: str,
+        request: Request,
         user: T.Optional[User] = Depends(get_current_user),
         app: "CustomFastAPI" = Depends(get_app)):
+    if job_id not in app.engine.jobs:
+        archived = await get_archived_job(app, job_id, user)
+        if archived is not None:
+            return archived
     job = get_job(app.engine, job_id, user)
-    return ser_job(job, is_allow_proxy(app))
+    index = get_job_index(app)
+    etag = index.job_etag(job)
+    resp = not_modified(request, etag)
+    if resp is not None:
+        return resp
+    data = index.ser_job_json(job, is_allow_proxy(app))
+    return Response(
+        data, media_type="application/json", headers={"ETag": etag})
+
+
+class StatusBatchRequest(BaseModel):
+    job_ids: T.List[str]
+
+
+@router.post("/status_batch")
+async def get_jobs_status_batch(
+        req: StatusBatchRequest,
+        user: T.Optional[User] = Depends(get_current_user),
+        app: "CustomFastAPI" = Depends(get_app)):
+    """Get the status of many jobs in one request.
+    Not found or forbidden jobs are reported per entry."""
+    jobs = get_job_index(app)
+    allow_proxy = is_allow_proxy(app)
+    resp: T.List[bytes] = []
+    for job_id in req.job_ids:
+        try:
+            job = jobs.get_job_by_id(job_id)
+        except JobNotFoundError:
+            resp.append(dump_json({'id': job_id, 'error': "Job not found."}))
+            continue
+        if (user is not None) and (not user_can_access(user, job)):
+            resp.append(dump_json(
+                {'id': job_id, 'error': "Can't access to the job."}))
+            continue
+        resp.append(
+            b'{"id":' + dump_json(job_id) +
+            b',"job":' + jobs.ser_job_json(job, allow_proxy) + b'}')
+    return json_list_response(resp)
 
 
 @router.get("/list_all")
 async def get_all_jobs(
+        request: Request,
+        response: Response,
+        query: JobQuery = Depends(job_query_params),
+        limit: T.Optional[int] = Query(None, ge=1),
+        cursor: T.Optional[str] = None,
+        reverse: bool = False,
+        archived: bool = False,
         user: T.Optional[User] = Depends(get_current_user),
         app: "CustomFastAPI" = Depends(get_app)):
-    resp = []
-    job: Job
-    all_jobs = app.engine.jobs.all_jobs()
-    if user is None:
-        jobs = all_jobs
-    else:
-        jobs = (j for j in all_jobs if user_can_access(user, j))
-    for job in jobs:
-        resp.append(ser_job(job, is_allow_proxy(app)))
-    return resp
+    """List jobs ordered by the created time.
+    When the result is truncated by `limit`, the cursor for
+    fetching the next page is returned in the `X-Next-Cursor` header.
+    If `archived` is true, list the jobs evicted to the archive.
+    Not archived listing is tagged by the version of the job table,
+    respond 304 if it is not changed."""
+    if app.job_retention is not None:
+        await app.job_retention.enforce_async()
+    if archived:
+        if app.job_archive is None:
+            return []
+        records, next_key = await run_in_threadpool(
+            app.job_archive.query,
+            query, parse_cursor(cursor), limit, reverse, user)
+        if next_key is not None:
+            response.headers["X-Next-Cursor"] = encode_cursor(next_key)
+        return [r.data for r in records]
+    index = get_job_index(app)
+    etag = index.table_etag(user_tag(user))
+    resp = not_modified(request, etag)
+    if resp is not None:
+        return resp
+    jobs, next_key = index.query(
+        query, parse_cursor(cursor), limit, reverse, user=user)
+    allow_proxy = is_allow_proxy(app)
+    headers = {"ETag": etag}
+    if next_key is not None:
+        headers["X-Next-Cursor"] = encode_cursor(next_key)
+    return json_list_response(
+        (index.ser_job_json(job, allow_proxy) for job in jobs), headers)
 
 
-@router.get("/cancel/{job_id}")
-async def cancel_job(
-        job_id: str,
+@router.get("/changes")
+async def get_job_changes(
+        since: T.Optional[str] = None,
         user: T.Optional[User] = Depends(get_current_user),
         app: "CustomFastAPI" = Depends(get_app)):
-    job = get_job(app.engine, job_id, user)
+    """Get the jobs created or updated, and the ids of jobs removed
+    after the cursor `since`, with the cursor of the current version.
+    If `since` is not provided, or the changes since it are not tracked
+    anymore(e.g. it's from a previous run of the server),
+    `reset` is true and all jobs are returned in `changed`."""
+    if app.job_retention is not None:
+        await app.job_retention.enforce_async()
+    index = get_job_index(app)
+    version = None if since is None else index.parse_changes_cursor(since)
+    changes = None if version is None else index.changes(version)
+    reset = changes is None
+    if changes is None:
+        changed: T.List[Job] = [
+            job for _, job in index.iter_query(JobQuery(), user=user)]
+        removed_ids: T.List[str] = []
+    else:
+        changed = changes[0]
+        removed_ids = [
+            job_id for job_id, owner in changes[1]
+            if (user is None) or user_can_access_owner(user, owner)
+        ]
+        if user is not None:
+            changed = [job for job in changed if user_can_access(user, job)]
+    allow_proxy = is_allow_proxy(app)
+    data = (
+        b'{"version":' + dump_json(index.changes_cursor()) +
+        b',"reset":' + dump_json(reset) +
+        b',"changed":[' +
+        b",".join(index.ser_job_json(job, allow_proxy) for job in changed) +
+        b'],"removed":' + dump_json(removed_ids) + b'}'
+    )
+    return Response(data, media_type="application/json")
+
+
+async def do_cancel(app: "CustomFastAPI", job: Job):
     if job.status in ("running", "pending"):
         await job.cancel()
-        return ser_job(job, is_allow_proxy(app))
     else:
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST,
             detail="The job is not in running or pending.")
 
 
-@router.get("/re_run/{job_id}")
-async def re_run_job(
-        job_id: str,
-        user: T.Optional[User] = Depends(get_current_user),
-        app: "CustomFastAPI" = Depends(get_app)):
-    job = get_job(app.engine, job_id, user)
+async def do_rerun(app: "CustomFastAPI", job: Job):
+    if job.status not in ("pending", "running"):
+        await app.admission.admit(1, job.attrs.get("user"))
     try:
         await job.rerun()
-        return ser_job(job, is_allow_proxy(app))
     except InvalidStateError as e:
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST,
             detail=str(e))
+    scheduler = getattr(app.engine.jobs, "scheduler", None)
+    if scheduler is not None:
+        scheduler.on_submit(job)
+
+
+async def do_remove(app: "CustomFastAPI", job: Job):
+    if job.status in ("pending", "running"):
+        await job.cancel()
+    app.engine.jobs.remove(job)
+
+
+BulkAction = T.Literal["cancel", "remove", "rerun"]
+
+job_actions: T.Dict[
+        BulkAction,
+        T.Callable[["CustomFastAPI", Job], T.Awaitable[None]]] = {
+    "cancel": do_cancel,
+    "remove": do_remove,
+    "rerun": do_rerun,
+}
+
+
+@router.get("/cancel/{job_id}")
+async def cancel_job(
+        job_id: str,
+        user: T.Optional[User] = Depends(get_current_user),
+        app: "CustomFastAPI" = Depends(get_app)):
+    job = get_job(app.engine, job_id, user, manage=True)
+    await do_cancel(app, job)
+    return ser_job(job, is_allow_proxy(app))
+
+
+@router.get("/re_run/{job_id}")
+async def re_run_job(
+        job_id: str,
+        user: T.Optional[User] = Depends(get_current_user),
+        app: "CustomFastAPI" = Depends(get_app)):
+    job = get_job(app.engine, job_id, user, manage=True)
+    await do_rerun(app, job)
+    return ser_job(job, is_allow_proxy(app))
 
 
 @router.get("/remove/{job_id}")
@@ -93,30 +340,166 @@ async def remove_job(
         job_id: str,
         user: T.Optional[User] = Depends(get_current_user),
         app: "CustomFastAPI" = Depends(get_app)):
-    job = get_job(app.engine, job_id, user)
-    if job.status in ("pending", "running"):
-        await job.cancel()
-    app.engine.jobs.remove(job)
+    if job_id not in app.engine.jobs:
+        archived = await remove_archived_job(app, job_id, user)
+        if archived is not None:
+            return archived
+    job = get_job(app.engine, job_id, user, manage=True)
+    await do_remove(app, job)
     return ser_job(job, is_allow_proxy(app))
 
 
+class JobFilter(BaseModel):
+    status: T.Optional[T.List[JobStatusType]] = None
+    task_name: T.Optional[T.List[str]] = None
+    job_type: T.Optional[T.List[JobType]] = None
+    username: T.Optional[T.List[str]] = None
+    created_after: T.Optional[datetime] = None
+    created_before: T.Optional[datetime] = None
+    stopped_after: T.Optional[datetime] = None
+    stopped_before: T.Optional[datetime] = None
+
+    def to_query(self) -> JobQuery:
+        return JobQuery(
+            statuses=self.status,
+            names=self.task_name,
+            job_types=self.job_type,
+            usernames=self.username,
+            created_after=self.created_after,
+            created_before=self.created_before,
+            stopped_after=self.stopped_after,
+            stopped_before=self.stopped_before,
+        )
+
+
+class BulkRequest(BaseModel):
+    action: BulkAction
+    job_ids: T.Optional[T.List[str]] = None
+    filter: T.Optional[JobFilter] = None
+
+
+@router.post("/bulk")
+async def bulk_job_action(
+        req: BulkRequest,
+        user: T.Optional[User] = Depends(get_current_user),
+        app: "CustomFastAPI" = Depends(get_app)):
+    """Cancel, remove or rerun the jobs selected by
+    the id list or the filter. The actions run concurrently,
+    the outcome of each job is reported per entry."""
+    if (req.job_ids is None) == (req.filter is None):
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            detail="Either job_ids or filter should be provided.")
+    index = get_job_index(app)
+    targets: T.List[T.Union[Job, str]]
+    if req.job_ids is not None:
+        targets = list(req.job_ids)
+    else:
+        assert req.filter is not None
+        # the jobs shared with the user are not managed by the user
+        targets = [
+            job for _, job in
+            index.iter_query(req.filter.to_query(), user=user)
+            if (user is None) or user_can_manage(user, job)]
+    action = job_actions[req.action]
+    semaphore = asyncio.Semaphore(app.config.bulk_action_concurrency)
+    allow_proxy = is_allow_proxy(app)
+
+    async def run_action(target: T.Union[Job, str]) -> bytes:
+        job_id = target if isinstance(target, str) else target.id
+        try:
+            if (req.action == "remove") and isinstance(target, str) and \
+                    (target not in app.engine.jobs):
+                archived = await remove_archived_job(app, target, user)
+                if archived is not None:
+                    return (
+                        b'{"id":' + dump_json(job_id) +
+                        b',"job":' + dump_json(archived) + b'}')
+            if isinstance(target, str):
+                job = get_job(app.engine, target, user, manage=True)
+            else:
+                job = target
+            async with semaphore:
+                await action(app, job)
+        except HTTPException as e:
+            return dump_json({'id': job_id, 'error': e.detail})
+        except Exception as e:
+            return dump_json({'id': job_id, 'error': str(e)})
+        return (
+            b'{"id":' + dump_json(job_id) +
+            b',"job":' + index.ser_job_json(job, allow_proxy) + b'}')
+
+    resp = await asyncio.gather(*[run_action(t) for t in targets])
+    return json_list_response(resp)
+
+
+async def wait_job_status(
+        app: "CustomFastAPI", job: Job,
+        statuses: T.Iterable[JobStatusType],
+        timeout: T.Optional[float]):
+    succeed = await get_job_index(app).wait_status(job, statuses, timeout)
+    if not succeed:
+        raise HTTPException(
+            status.HTTP_408_REQUEST_TIMEOUT,
+            detail=f"Timeout when waiting the job: {job.id}")
+
+
 @router.get("/result/{job_id}")
 async def wait_job_result(
         job_id: str,
+        request: Request,
+        timeout: T.Optional[float] = Query(None, ge=0),
+        fmt: T.Optional[ResultFormat] = Query(None, alias="format"),
         user: T.Optional[User] = Depends(get_current_user),
         app: "CustomFastAPI" = Depends(get_app)):
+    """Wait the job finish and return the result.
+
+    The result format is selected by the `format` parameter or
+    the Accept header. Except JSON, the encoded result is streamed
+    by chunks, the numpy arrays and the bytes are sent from
+    their buffers without a full copy. The sent chunks are cached
+    for the repeated fetches, which are served from the memory."""
     job = get_job(app.engine, job_id, user)
-    await job.join()
-    return {
-        'job': ser_job(job, is_allow_proxy(app)),
-        'result': job.result(),
+    await wait_job_status(app, job, finished_statuses, timeout)
+    if fmt is None:
+        fmt = negotiate_format(request.headers.get("accept"))
+    if fmt == "json":
+        return {
+            'job': ser_job(job, is_allow_proxy(app)),
+            'result': job.result(),
+        }
+    if (fmt == "pickle") and (not app.config.allow_pickle_result):
+        raise HTTPException(
+            status.HTTP_406_NOT_ACCEPTABLE,
+            detail="Pickle result is not allowed by the server.")
+    media_type = format_media_types[fmt]
+    headers = {
+        "X-Job-Id": job.id,
+        "X-Job-Status": job.status,
     }
+    data = app.result_cache.get(job, fmt)
+    if data is not None:
+        return Response(data, media_type=media_type, headers=headers)
+    result = job.result()
+    try:
+        buffers = await run_in_threadpool(encode_result, result, fmt)
+    except ResultEncodeError as e:
+        raise HTTPException(
+            status.HTTP_406_NOT_ACCEPTABLE, detail=str(e))
+    headers["Content-Length"] = str(sum(len(b) for b in buffers))
+    return StreamingResponse(
+        app.result_cache.tee(job, fmt, iter_chunks(buffers)),
+        media_type=media_type,
+        headers=headers,
+    )
 
 
 class WaitRequest(BaseModel):
     job_id: str
-    statuses: T.List[JobStatusType] = ["done", "failed", "cancelled"]
+    statuses: T.List[JobStatusType] = finished_statuses
+    # not used anymore, the waiting is notified by the job status change
     time_delta: float = 0.1
+    timeout: T.Optional[float] = None
 
 
 @router.post("/wait")
@@ -125,38 +508,108 @@ async def wait(
         user: T.Optional[User] = Depends(get_current_user),
         app: "CustomFastAPI" = Depends(get_app)):
     job = get_job(app.engine, req.job_id, user)
-    while True:
-        if job.status in req.statuses:
-            break
-        await asyncio.sleep(req.time_delta)
+    await wait_job_status(app, job, req.statuses, req.timeout)
     return ser_job(job, is_allow_proxy(app))
 
 
-def _read_then_return(job: Job, fname: str):
-    try:
-        with open(job.cache_dir / fname) as f:
-            content = f.read()
-        return {'content': content}
-    except Exception as e:
-        raise HTTPException(
-            status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
+async def _read_log(
+        job: Job, fname: str,
+        offset: T.Optional[int],
+        limit: T.Optional[int],
+        tail: T.Optional[int],
+        follow: bool):
+    assert job.cache_dir is not None
+    path = job.cache_dir / fname
+    if follow:
+        return follow_log_response(
+            path, offset or 0,
+            lambda: job.status in finished_statuses)
+    return await read_log_async(path, offset, limit, tail)
 
 
 @router.get("/stdout/{job_id}")
 async def get_job_stdout(
         job_id: str,
+        offset: T.Optional[int] = Query(None, ge=0),
+        limit: T.Optional[int] = Query(None, ge=0),
+        tail: T.Optional[int] = Query(None, ge=0),
+        follow: bool = False,
         user: T.Optional[User] = Depends(get_current_user),
         app: "CustomFastAPI" = Depends(get_app)):
     job = get_job(app.engine, job_id, user)
-    return _read_then_return(job, "stdout.txt")
+    return await _read_log(job, "stdout.txt", offset, limit, tail, follow)
 
 
 @router.get("/stderr/{job_id}")
 async def get_job_stderr(
         job_id: str,
+        offset: T.Optional[int] = Query(None, ge=0),
+        limit: T.Optional[int] = Query(None, ge=0),
+        tail: T.Optional[int] = Query(None, ge=0),
+        follow: bool = False,
         user: T.Optional[User] = Depends(get_current_user),
         app: "CustomFastAPI" = Depends(get_app)):
     job = get_job(app.engine, job_id, user)
-    return _read_then_return(job, "stderr.txt")
+    return await _read_log(job, "stderr.txt", offset, limit, tail, follow)
+
+
+def format_sse(event: dict) -> str:
+    data = json.dumps(event)
+    return f"event: {event['event']}\ndata: {data}\n\n"
+
+
+@router.get("/events")
+async def job_events(
+        user: T.Optional[User] = Depends(get_current_user),
+        app: "CustomFastAPI" = Depends(get_app)):
+    """Stream the job lifecycle events as Server-Sent Events."""
+    jobs = get_job_index(app)
+
+    async def event_stream():
+        with jobs.subscribe(
+                app.config.job_events_queue_size,
+                user_predicate(user)) as sub:
+            async for event in sub:
+                yield format_sse(event)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.websocket("/events/ws")
+async def job_events_ws(websocket: WebSocket):
+    """Push the job lifecycle events through the WebSocket."""
+    app: "CustomFastAPI" = websocket.app
+    try:
+        user = await get_websocket_user(websocket)
+    except HTTPException:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    await websocket.accept()
+    jobs = get_job_index(app)
+
+    async def send_events():
+        with jobs.subscribe(
+                app.config.job_events_queue_size,
+                user_predicate(user)) as sub:
+            async for event in sub:
+                await websocket.send_json(event)
+
+    async def wait_disconnect():
+        while True:
+            msg = await websocket.receive()
+            if msg["type"] == "websocket.disconnect":
+                break
+
+    sender = asyncio.create_task(send_events())
+    receiver = asyncio.create_task(wait_disconnect())
+    done, pending = await asyncio.wait(
+        [sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    if (sender in done) and (sender.exception() is None):
+        # overflowed, let the client re-sync
+        await websocket.close()
@@ -1,8 +1,11 @@
 import typing as T
+import functools
 from pathlib import Path
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, Depends, Query
+from diskcache import Cache
 
 from ..utils import ser_job, get_jobs, get_app, CustomFastAPI
+from ..utils.logfile import read_log_async, follow_log_response
 
 
 router = APIRouter(prefix="/monitor")
@@ -21,37 +24,58 @@ async def get_all_jobs_from_cache(
     return resp
 
 
-def _read_then_return(
+def _job_finished(cache_path: Path, job_id: str) -> bool:
+    """The job is not pending or running in the cache of the monitored
+    engine."""
+    for s in ("pending", "running"):
+        path = cache_path / "jobs" / s
+        if not path.exists():
+            continue
+        with Cache(str(path)) as cache:
+            if job_id in cache:
+                return False
+    return True
+
+
+async def _read_log(
         job_id: str, log_file: str,
-        monitor_cache_path: T.Union[str, Path]):
+        monitor_cache_path: T.Union[str, Path],
+        offset: T.Optional[int],
+        limit: T.Optional[int],
+        tail: T.Optional[int],
+        follow: bool):
     cache_path = Path(monitor_cache_path)
-    job_cache_dir = cache_path / job_id
-    try:
-        with open(job_cache_dir / log_file) as f:
-            content = f.read()
-        return {'content': content}
-    except Exception as e:
-        raise HTTPException(
-            status.HTTP_400_BAD_REQUEST,
-            detail=str(e)
-        )
+    path = cache_path / job_id / log_file
+    if follow:
+        return follow_log_response(
+            path, offset or 0,
+            functools.partial(_job_finished, cache_path, job_id))
+    return await read_log_async(path, offset, limit, tail)
 
 
 @router.get("/stdout/{job_id}")
 async def get_job_stdout(
         job_id: str,
+        offset: T.Optional[int] = Query(None, ge=0),
+        limit: T.Optional[int] = Query(None, ge=0),
+        tail: T.Optional[int] = Query(None, ge=0),
+        follow: bool = False,
         app: "CustomFastAPI" = Depends(get_app)):
     cache_path = app.config.monitor_cache_path
     assert cache_path is not None
-    return _read_then_return(
-        job_id, "stdout.txt", cache_path)
+    return await _read_log(
+        job_id, "stdout.txt", cache_path, offset, limit, tail, follow)
 
 
 @router.get("/stderr/{job_id}")
 async def get_job_stderr(
         job_id: str,
+        offset: T.Optional[int] = Query(None, ge=0),
+        limit: T.Optional[int] = Query(None, ge=0),
+        tail: T.Optional[int] = Query(None, ge=0),
+        follow: bool = False,
         app: "CustomFastAPI" = Depends(get_app)):
     cache_path = app.config.monitor_cache_path
     assert cache_path is not None
-    return _read_then_return(
-        job_id, "stderr.txt", cache_path)
+    return await _read_log(
+        job_id, "stderr.txt", cache_path, offset, limit, tail, follow)
@@ -1,12 +1,22 @@
 import typing as T
-from fastapi import APIRouter, HTTPException, status, Depends
-from pydantic import BaseModel
+from datetime import datetime
+from fastapi import (
+    APIRouter, HTTPException, status, Depends, Request, Response
+)
+from pydantic import BaseModel, Field
+from starlette.concurrency import run_in_threadpool
 
-from executor.engine.job.condition import AfterAnother
+from executor.engine.job import Job
+from executor.engine.job.condition import AfterAnother, Condition
+from executor.engine.launcher import AsyncLauncher
 
 from ..utils import ConditionType, ser_job, get_app, CustomFastAPI
 from ..utils.auth import get_current_user
+from ..utils.etag import not_modified
 from ..user_db.schemas import User
+from ..task import Call, create_chunk_job
+from ..task_cache import TaskResultCache
+from ..jobs import IndexedJobs
 
 
 router = APIRouter(prefix="/task")
@@ -17,52 +27,311 @@ class CallRequest(BaseModel):
     args: T.List[T.Any]
     kwargs: T.Dict[str, T.Any]
     condition: T.Optional[ConditionType] = None
+    # the pending jobs with higher priority start first
+    priority: int = 0
 
 
-@router.post("/call")
-async def call(
-        req: CallRequest,
-        user: T.Optional[User] = Depends(get_current_user),
-        app: CustomFastAPI = Depends(get_app)):
+def get_task(app: CustomFastAPI, task_name: str) -> AsyncLauncher:
     try:
-        task = app.task_table[req.task_name]
+        return app.task_table[task_name]
     except KeyError:
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST,
             detail="Function not registered.")
 
-    condition = None
-    if req.condition is not None:
-        if req.condition.type == "AfterAnother":
-            condition = AfterAnother(**req.condition.arguments)
-        else:
-            raise HTTPException(
-                status.HTTP_400_BAD_REQUEST,
-                detail=f"Unsupported condition type: {req.condition.type}."
-            )
-    try:
-        job = task.create_job(
-            tuple(req.args), req.kwargs, condition=condition)
-    except Exception as e:
+
+def get_condition(
+        condition: T.Optional[ConditionType]) -> T.Optional[Condition]:
+    if condition is None:
+        return None
+    if condition.type == "AfterAnother":
+        return AfterAnother(**condition.arguments)
+    else:
         raise HTTPException(
             status.HTTP_400_BAD_REQUEST,
-            detail=f"Error when create job: {str(e)}",
+            detail=f"Unsupported condition type: {condition.type}."
         )
+
+
+def setup_job(
+        app: CustomFastAPI, job: Job,
+        user: T.Optional[User], priority: int = 0) -> Job:
     if user is not None:
         job.attrs['user'] = user
-    if app.config.redirect_job_stream:
+    # the actor calls run in the worker processes of the pool
+    if app.config.redirect_job_stream and (not job.attrs.get('actor')):
         job.redirect_out_err = True
-    await app.engine.submit_async(job)
+    job.attrs['priority'] = priority
+    scheduler = getattr(app.engine.jobs, "scheduler", None)
+    if scheduler is not None:
+        scheduler.gate(job)
+    return job
+
+
+def new_job(
+        task: AsyncLauncher, args: tuple, kwargs: dict,
+        condition: T.Optional[Condition] = None) -> Job:
+    try:
+        return task.create_job(args, kwargs, condition=condition)
+    except Exception as e:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            detail=f"Error when create job: {str(e)}",
+        )
+
+
+def resolve_cached_job(app: CustomFastAPI, job: Job, value: T.Any):
+    """Resolve the job by the cached result, the job is added to
+    the job table in "done" status without running."""
+    job.attrs['cached'] = True
+    job.engine = app.engine
+    job.future.set_result(value)
+    job._status = "done"
+    job.submit_time = job.stoped_time = datetime.now()
+    app.engine.jobs.add(job)
+
+
+async def create_job(
+        app: CustomFastAPI, task: AsyncLauncher,
+        args: tuple, kwargs: dict,
+        condition: T.Optional[Condition],
+        user: T.Optional[User], priority: int = 0) -> Job:
+    """Create the job of the task call, the job may be resolved
+    from the result cache, or shared with an identical call which is
+    in flight. Only the jobs in "created" status need to be submitted."""
+    cache = app.task_table.get_cache(task.name)
+    key = None
+    if (cache is not None) and (condition is None):
+        key = cache.make_key(task.name, args, kwargs)
+        hit, value = await cache.get_async(key)
+        if hit:
+            job = setup_job(
+                app, new_job(task, args, kwargs), user, priority)
+            resolve_cached_job(app, job, value)
+            return job
+    scope = app.task_table.coalesce.get(task.name)
+    inflight_key = None
+    if (scope is not None) and (condition is None):
+        inflight_key = key or TaskResultCache.make_key(task.name, args, kwargs)
+        if (scope == "user") and (user is not None):
+            inflight_key += f":{user.username}"
+        inflight = app.task_table.get_inflight(inflight_key)
+        if inflight is not None:
+            jobs = app.engine.jobs
+            if (user is not None) and isinstance(jobs, IndexedJobs):
+                jobs.share(inflight, user)
+            return inflight
+    job = new_job(task, args, kwargs, condition)
+    if key is not None:
+        app.task_table.track_cache(task.name, key, job)
+    if inflight_key is not None:
+        app.task_table.track_inflight(inflight_key, job)
+    return setup_job(app, job, user, priority)
+
+
+async def submit_jobs(
+        app: CustomFastAPI, jobs: T.Iterable[Job],
+        user: T.Optional[User]):
+    """Submit the new created jobs, if the jobs exceed the limits
+    of the pending and running jobs, raise HTTPException(429)."""
+    new_jobs = {job.id: job for job in jobs if job.status == "created"}
+    n_jobs = len(new_jobs)
+    table = app.task_table
+    # the coalesced job may be waited by several requests
+    table.begin_admit(new_jobs.values())
+    admitted = False
+    try:
+        await app.admission.admit(n_jobs, user)
+        admitted = True
+    finally:
+        released = table.end_admit(new_jobs.values())
+        if not admitted:
+            for job in released:
+                if job.status == "created":
+                    table.untrack(job)
+    # submitted by the other requests during the wait
+    to_submit = [job for job in new_jobs.values() if job.status == "created"]
+    await app.engine.submit_async(*to_submit)
+    scheduler = getattr(app.engine.jobs, "scheduler", None)
+    if scheduler is not None:
+        for job in to_submit:
+            scheduler.on_submit(job)
+
+
+@router.post("/call")
+async def call(
+        req: CallRequest,
+        user: T.Optional[User] = Depends(get_current_user),
+        app: CustomFastAPI = Depends(get_app)):
+    task = get_task(app, req.task_name)
+    condition = get_condition(req.condition)
+    job = await create_job(
+        app, task, tuple(req.args), req.kwargs, condition, user,
+        req.priority)
+    await submit_jobs(app, [job], user)
     allow_proxy = "proxy" in app.config.allowed_routers
     return ser_job(job, allow_proxy)
 
 
+class RunRequest(CallRequest):
+    # seconds to wait the job, wait until it finished if None
+    timeout: T.Optional[float] = Field(None, ge=0)
+    # remove the job from the job table after the result returned
+    remove: bool = False
+
+
+@router.post("/run")
+async def run(
+        req: RunRequest,
+        response: Response,
+        user: T.Optional[User] = Depends(get_current_user),
+        app: CustomFastAPI = Depends(get_app)):
+    """Call the task and wait the result in one request.
+
+    Return the job and the result(or the error) if the job finished
+    within the `timeout`, else return the job with status code 202,
+    the result can be fetched later by `/job/result/{job_id}`."""
+    task = get_task(app, req.task_name)
+    condition = get_condition(req.condition)
+    job = await create_job(
+        app, task, tuple(req.args), req.kwargs, condition, user,
+        req.priority)
+    await submit_jobs(app, [job], user)
+    allow_proxy = "proxy" in app.config.allowed_routers
+    jobs = app.engine.jobs
+    assert isinstance(jobs, IndexedJobs)
+    finished = await jobs.wait_status(
+        job, ["done", "failed", "cancelled"], req.timeout)
+    if not finished:
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {'job': ser_job(job, allow_proxy), 'result': None}
+    if job.status != "done":
+        exc = job.exception()
+        return {
+            'job': ser_job(job, allow_proxy),
+            'result': None,
+            'error': None if exc is None else repr(exc),
+        }
+    res = {'job': ser_job(job, allow_proxy), 'result': job.result()}
+    # the coalesced job may be waited by the other callers
+    if req.remove and (not job.attrs.get('shared_users')) and \
+            (job in jobs):
+        jobs.remove(job)
+    return res
+
+
+class CallArgs(BaseModel):
+    args: T.List[T.Any] = []
+    kwargs: T.Dict[str, T.Any] = {}
+
+
+class MapArgs(BaseModel):
+    # position of the positional argument or name of the keyword argument
+    arg: T.Union[int, str]
+    values: T.List[T.Any]
+    args: T.List[T.Any] = []
+    kwargs: T.Dict[str, T.Any] = {}
+
+    def iter_calls(self) -> T.Iterator[T.Tuple[tuple, dict]]:
+        for value in self.values:
+            args, kwargs = list(self.args), dict(self.kwargs)
+            if isinstance(self.arg, int):
+                args.insert(self.arg, value)
+            else:
+                kwargs[self.arg] = value
+            yield tuple(args), kwargs
+
+
+class CallBatchRequest(BaseModel):
+    task_name: str
+    calls: T.Optional[T.List[CallArgs]] = None
+    map: T.Optional[MapArgs] = None
+    condition: T.Optional[ConditionType] = None
+    chunk_size: T.Optional[int] = Field(None, ge=1)
+    priority: int = 0
+
+
+@router.post("/call_batch")
+async def call_batch(
+        req: CallBatchRequest,
+        user: T.Optional[User] = Depends(get_current_user),
+        app: CustomFastAPI = Depends(get_app)):
+    """Submit many calls of a task in one request,
+    the calls are given by a list of args/kwargs, or by mapping
+    the values over one argument. Return the ids of the created jobs.
+
+    If `chunk_size` is set, every `chunk_size` calls are packed
+    into one job, the result of the job is the list of the results,
+    so the i-th call is the `i % chunk_size` item of the result of
+    the `i // chunk_size` job."""
+    if (req.calls is None) == (req.map is None):
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            detail="Either calls or map should be provided.")
+    task = get_task(app, req.task_name)
+    calls: T.List[Call]
+    if req.calls is not None:
+        calls = [(tuple(c.args), c.kwargs) for c in req.calls]
+    else:
+        assert req.map is not None
+        if isinstance(req.map.arg, int) and \
+                not (0 <= req.map.arg <= len(req.map.args)):
+            raise HTTPException(
+                status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid position of the mapped argument: "
+                       f"{req.map.arg}")
+        calls = list(req.map.iter_calls())
+
+    jobs: T.List[Job] = []
+    if req.chunk_size is None:
+        for args, kwargs in calls:
+            jobs.append(await create_job(
+                app, task, args, kwargs, get_condition(req.condition), user,
+                req.priority))
+    else:
+        for start in range(0, len(calls), req.chunk_size):
+            chunk = calls[start:start + req.chunk_size]
+            try:
+                job = create_chunk_job(
+                    task, chunk, condition=get_condition(req.condition))
+            except ValueError as e:
+                raise HTTPException(
+                    status.HTTP_400_BAD_REQUEST,
+                    detail=str(e))
+            jobs.append(setup_job(app, job, user, req.priority))
+    await submit_jobs(app, jobs, user)
+    return {
+        'job_ids': [job.id for job in jobs],
+        'chunk_size': req.chunk_size,
+    }
+
+
 @router.get("/list_all")
 async def get_task_list(
+        request: Request,
+        response: Response,
         app: CustomFastAPI = Depends(get_app),
         user: T.Optional[User] = Depends(get_current_user)):
+    etag = app.task_table.etag
+    resp = not_modified(request, etag)
+    if resp is not None:
+        return resp
     task_list = [
         app.task_table.task_to_dict(t)
         for t in app.task_table.table.values()
     ]
+    response.headers["ETag"] = etag
     return task_list
+
+
+@router.get("/cache_stats")
+async def get_cache_stats(
+        app: CustomFastAPI = Depends(get_app),
+        user: T.Optional[User] = Depends(get_current_user)):
+    """Hit/miss counters and sizes of the task result caches."""
+    stats = {}
+    for name in app.task_table.caches:
+        cache = app.task_table.get_cache(name)
+        assert cache is not None
+        stats[name] = await run_in_threadpool(cache.stats)
+    return stats
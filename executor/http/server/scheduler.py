@@ -0,0 +1,244 @@
+import typing as T
+import bisect
+import itertools
+import math
+import time
+from dataclasses import dataclass
+
+from executor.engine.job import Job
+from executor.engine.job.condition import Condition
+
+if T.TYPE_CHECKING:
+    from executor.engine import Engine
+    from .jobs import JobEvent
+    from .user_db.schemas import Role
+
+
+@dataclass
+class ScheduleGate(Condition):
+    """Condition which let the scheduler decide when the job starts,
+    wraps the original condition of the job."""
+    job_id: str
+    condition: T.Optional[Condition] = None
+
+    def satisfy(self, engine: "Engine") -> bool:
+        if (self.condition is not None) and \
+                (not self.condition.satisfy(engine)):
+            return False
+        scheduler = get_scheduler(engine)
+        if scheduler is None:
+            return True
+        return scheduler.try_start(engine.jobs.get_job_by_id(self.job_id))
+
+
+def unwrap_condition(cond: T.Optional[Condition]) -> T.Optional[Condition]:
+    """Get the original condition of the job."""
+    while isinstance(cond, ScheduleGate):
+        cond = cond.condition
+    return cond
+
+
+def get_scheduler(
+        engine: T.Optional["Engine"]) -> T.Optional["PriorityScheduler"]:
+    if engine is None:
+        return None
+    return getattr(engine.jobs, "scheduler", None)
+
+
+def queue_position(job: Job) -> T.Optional[int]:
+    """Position of the job in the pending queue, None if not queued."""
+    scheduler = get_scheduler(job.engine)
+    if scheduler is None:
+        return None
+    return scheduler.position(job.id)
+
+
+QueueKey = T.Tuple[float, int, str]
+
+
+class PriorityScheduler(object):
+    """Start the pending jobs in the order of priority,
+    at most `max_running` jobs run at the same time.
+
+    The waiting time raises the priority by `aging_rate` per second,
+    so the low priority jobs will not be starved. Because all jobs age
+    at the same rate, the order is fixed once the job is queued:
+    `priority + rate * (now - t_queued)` is ordered by
+    `priority - rate * t_queued`.
+
+    Only the jobs whose own condition is satisfied(ready jobs)
+    compete for the slots, so a job waiting for another job
+    will not block the others.
+
+    If `role_weights` is given, the jobs are queued per user
+    (`job.attrs['user']`) and the users share the slots by
+    weighted round-robin(stride scheduling): every start of a user's job
+    advance the user's pass by `1 / weight`, the user with the least pass
+    goes next. The priority orders the jobs of the same user."""
+
+    def __init__(
+            self, max_running: T.Optional[int] = None,
+            aging_rate: float = 1 / 60,
+            role_weights: T.Optional[T.Dict["Role", float]] = None) -> None:
+        self.max_running = max_running
+        self.aging_rate = aging_rate
+        self.role_weights = role_weights
+        self._keys: T.Dict[str, QueueKey] = {}
+        self._owners: T.Dict[str, str] = {}
+        # queued and ready jobs of the users
+        self._queues: T.Dict[str, T.List[QueueKey]] = {}
+        self._ready: T.Dict[str, T.List[QueueKey]] = {}
+        self._ready_ids: T.Set[str] = set()
+        self._weights: T.Dict[str, float] = {}
+        self._passes: T.Dict[str, float] = {}
+        self._vtime = 0.0
+        self._next_user: T.Optional[str] = None
+        self._next_dirty = False
+        self.running: T.Set[str] = set()
+        self._seq = itertools.count()
+        # increase when the queue is changed
+        self.version = 0
+
+    @staticmethod
+    def gate(job: Job):
+        """Put the job under the control of the scheduler."""
+        if not isinstance(job.condition, ScheduleGate):
+            job.condition = ScheduleGate(job.id, job.condition)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _owner_of(self, job: Job) -> T.Tuple[str, float]:
+        user = job.attrs.get("user")
+        if (self.role_weights is None) or (user is None):
+            return "", 1.0
+        return user.username, self.role_weights.get(user.role, 1.0)
+
+    def enqueue(self, job: Job):
+        if (job.id in self._keys) or (job.id in self.running):
+            return
+        owner, weight = self._owner_of(job)
+        priority = job.attrs.get("priority", 0)
+        base = priority - self.aging_rate * time.monotonic()
+        key = (-base, next(self._seq), job.id)
+        queue = self._queues.setdefault(owner, [])
+        if not queue:
+            # the user becomes active, can not use the credit of idle time
+            self._passes[owner] = max(
+                self._passes.get(owner, 0.0), self._vtime)
+        self._weights[owner] = weight
+        bisect.insort(queue, key)
+        self._keys[job.id] = key
+        self._owners[job.id] = owner
+        self.version += 1
+
+    def on_submit(self, job: Job):
+        """Queue the submitted job right away, the job event which
+        also queues it is deferred, so the position is known
+        in the response of the submit."""
+        if isinstance(job.condition, ScheduleGate) and \
+                (job.status == "pending"):
+            self.enqueue(job)
+
+    @staticmethod
+    def _remove_key(keys: T.List[QueueKey], key: QueueKey):
+        idx = bisect.bisect_left(keys, key)
+        if (idx < len(keys)) and (keys[idx] == key):
+            del keys[idx]
+
+    def discard(self, job_id: str):
+        key = self._keys.pop(job_id, None)
+        if key is None:
+            return
+        owner = self._owners.pop(job_id)
+        queue = self._queues[owner]
+        self._remove_key(queue, key)
+        if not queue:
+            del self._queues[owner]
+        if job_id in self._ready_ids:
+            self._ready_ids.remove(job_id)
+            ready = self._ready[owner]
+            self._remove_key(ready, key)
+            if not ready:
+                del self._ready[owner]
+            self._next_dirty = True
+        self.version += 1
+
+    def position(self, job_id: str) -> T.Optional[int]:
+        """Position of the job in the pending queue, start from 0.
+        With the fair share, the jobs of the other users before the job
+        are estimated from their passes."""
+        key = self._keys.get(job_id)
+        if key is None:
+            return None
+        owner = self._owners[job_id]
+        pos = bisect.bisect_left(self._queues[owner], key)
+        if len(self._queues) > 1:
+            target = self._passes[owner] + pos / self._weights[owner]
+            for user, queue in self._queues.items():
+                if user == owner:
+                    continue
+                x = (target - self._passes[user]) * self._weights[user]
+                # the ties go to the user with the smaller name
+                if user < owner:
+                    n_before = math.floor(x + 1e-9) + 1
+                else:
+                    n_before = math.ceil(x - 1e-9)
+                pos += min(len(queue), max(n_before, 0))
+        return pos
+
+    def n_slots(self) -> int:
+        if self.max_running is None:
+            return len(self._ready_ids)
+        return self.max_running - len(self.running)
+
+    def next_user(self) -> T.Optional[str]:
+        """The user whose ready job goes next."""
+        if self._next_dirty:
+            self._next_user = min(
+                self._ready, default=None,
+                key=lambda u: (self._passes[u], u))
+            self._next_dirty = False
+        return self._next_user
+
+    def try_start(self, job: Job) -> bool:
+        """Called when the job's own condition is satisfied,
+        return True if the job can start now."""
+        key = self._keys.get(job.id)
+        if key is None:
+            return False
+        owner = self._owners[job.id]
+        if job.id not in self._ready_ids:
+            self._ready_ids.add(job.id)
+            bisect.insort(self._ready.setdefault(owner, []), key)
+            self._next_dirty = True
+        n_slots = self.n_slots()
+        if n_slots <= 0:
+            return False
+        if n_slots < len(self._ready_ids):
+            # compete for the slots
+            if (self.next_user() != owner) or \
+                    (self._ready[owner][0] != key):
+                return False
+        if not job.has_resource():
+            return False
+        # the resource is consumed right after the condition satisfied
+        self.discard(job.id)
+        self.running.add(job.id)
+        self._vtime = max(self._vtime, self._passes[owner])
+        self._passes[owner] += 1 / self._weights[owner]
+        self._next_dirty = True
+        return True
+
+    def on_event(self, event: "JobEvent"):
+        job = event.job
+        if (job is None) or (not isinstance(job.condition, ScheduleGate)):
+            return
+        if (event.event == "remove") or \
+                (event.status in ("done", "failed", "cancelled")):
+            self.discard(job.id)
+            self.running.discard(job.id)
+        elif (job.status == "pending") and (event.status == "pending"):
+            # a failed job goes back to pending when it retries
+            self.running.discard(job.id)
+            self.enqueue(job)
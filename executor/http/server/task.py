@@ -1,29 +1,232 @@
 import typing as T
+import uuid
+import functools
+import inspect
+from pathlib import Path
 
+from copy import copy
+
+from executor.engine.job import Job
 from executor.engine.launcher import (
     LauncherBase, AsyncLauncher,
     SyncLauncher,
 )
+from executor.engine.launcher.core import job_type_classes
+from cmd2func.core import Cmd2Func
 from funcdesc.desc import NotDef
 
+from .utils.etag import make_etag
+from .task_cache import CachePolicy, TaskResultCache
+from .jobs import JobEvent
+from .actor import ActorPool, actor_runner
+
+
+Call = T.Tuple[tuple, dict]
+
+# scope of coalescing the identical calls:
+# "all" share the job between all users, "user" only for the same user
+CoalesceScope = T.Literal["all", "user"]
+
+chunkable_job_types = ("local", "thread", "process", "dask")
+
+
+def chunk_runner(func: T.Callable) -> T.Callable[[T.List[Call]], list]:
+    """Wrap the function to run several calls in one job."""
+    def run_chunk(calls: T.List[Call]) -> list:
+        return [func(*args, **kwargs) for args, kwargs in calls]
+    return run_chunk
+
+
+def create_chunk_job(
+        task: LauncherBase, calls: T.List[Call], **attrs) -> Job:
+    """Create a job which run several calls of the task,
+    the result of the job is the list of the results of the calls."""
+    if (task.job_type not in chunkable_job_types) or \
+            isinstance(task.target_func, Cmd2Func) or \
+            task.job_attrs.get('actor'):
+        raise ValueError(
+            f"Can't pack the calls of {task.job_type} task into one job.")
+    func = task.target_func
+    if inspect.iscoroutinefunction(func) or \
+            inspect.isasyncgenfunction(func) or \
+            inspect.isgeneratorfunction(func):
+        raise ValueError(
+            "Can't pack the calls of async or generator task into one job.")
+    job_attrs = copy(task.job_attrs)
+    job_attrs.update(attrs)
+    job_attrs['chunk_size'] = len(calls)
+    job_class = job_type_classes[task.job_type]
+    return job_class(
+        chunk_runner(func), (calls,), {}, **job_attrs)  # type: ignore
+
 
 class TaskTable(object):
     def __init__(
             self,
             table: T.Optional[T.Dict[str, AsyncLauncher]] = None) -> None:
         self.table: T.Dict[str, AsyncLauncher] = table or {}
+        # increase when the table is changed
+        self.version = 0
+        self.instance_id = uuid.uuid4().hex[:8]
+        self.caches: T.Dict[str, TaskResultCache] = {}
+        # default directory of the disk tier of the result caches
+        self.cache_dir: T.Optional[Path] = None
+        self.coalesce: T.Dict[str, CoalesceScope] = {}
+        # pending or running jobs of the coalesced calls
+        self.inflight: T.Dict[str, Job] = {}
+        self._inflight_keys: T.Dict[str, str] = {}
+        # jobs fill the result cache when done: job id -> (task name, key)
+        self._cache_keys: T.Dict[str, T.Tuple[str, str]] = {}
+        # number of the requests waiting the admission of the jobs
+        self._admitting: T.Dict[str, int] = {}
+        # worker pools of the actor tasks
+        self.actor_pools: T.Dict[str, ActorPool] = {}
 
     def __getitem__(self, key: str) -> AsyncLauncher:
         return self.table[key]
 
-    def register(self, task: T.Union[LauncherBase, T.Callable]):
+    def register(
+            self, task: T.Union[LauncherBase, T.Callable, None] = None,
+            cache: T.Union[CachePolicy, bool, None] = None,
+            coalesce: T.Optional[CoalesceScope] = None):
+        """Register the task. If `cache` is set, the results of
+        the task calls are cached and reused for the same arguments.
+        If `coalesce` is set, an identical call share the job
+        of the pending or running call instead of creating a new one.
+        Can be used as a decorator with arguments:
+
+            @task_table.register(cache=CachePolicy(ttl=3600))
+            @launcher(job_type="process")
+            def f(x): ...
+        """
+        if task is None:
+            return functools.partial(
+                self.register, cache=cache, coalesce=coalesce)
+        async_task: AsyncLauncher
         if isinstance(task, SyncLauncher):
-            task = task.to_async()
+            async_task = task.to_async()
         elif isinstance(task, AsyncLauncher):
-            task = task
+            async_task = task
+        else:
+            async_task = AsyncLauncher(task)
+        self.table[async_task.name] = async_task
+        old_cache = self.caches.pop(async_task.name, None)
+        if old_cache is not None:
+            old_cache.close()
+        old_pool = self.actor_pools.pop(async_task.name, None)
+        if old_pool is not None:
+            old_pool.remove()
+        if cache:
+            policy = cache if isinstance(cache, CachePolicy) \
+                else CachePolicy()
+            self.caches[async_task.name] = TaskResultCache(policy)
+        if coalesce is not None:
+            self.coalesce[async_task.name] = coalesce
         else:
-            task = AsyncLauncher(task)
-        self.table[task.name] = task
+            self.coalesce.pop(async_task.name, None)
+        self.version += 1
+        return async_task
+
+    def register_actor(
+            self, func: T.Optional[T.Callable] = None,
+            init: T.Optional[T.Callable[[], T.Any]] = None,
+            pool_size: int = 1,
+            name: T.Optional[str] = None,
+            cache: T.Union[CachePolicy, bool, None] = None,
+            coalesce: T.Optional[CoalesceScope] = None):
+        """Register an actor task, the calls run in `pool_size`
+        long-lived worker processes. `init` runs once in each worker,
+        the returned state is passed to `func` as the first argument:
+
+            @task_table.register_actor(init=load_model, pool_size=2)
+            def predict(model, x): ...
+        """
+        if func is None:
+            return functools.partial(
+                self.register_actor, init=init, pool_size=pool_size,
+                name=name, cache=cache, coalesce=coalesce)
+        pool = ActorPool(init, pool_size)
+        task = AsyncLauncher(
+            actor_runner(func, pool), job_type="local", name=name,
+            job_attrs={'actor': True, 'pool_size': pool_size})
+        async_task = self.register(task, cache=cache, coalesce=coalesce)
+        self.actor_pools[async_task.name] = pool
+        return async_task
+
+    def shutdown_actors(self):
+        """Stop the workers of the actor tasks,
+        they will be restarted by the next calls."""
+        for pool in self.actor_pools.values():
+            pool.close()
+
+    def get_cache(self, task_name: str) -> T.Optional[TaskResultCache]:
+        cache = self.caches.get(task_name)
+        if (cache is not None) and (cache.disk_path is None):
+            cache_dir = self.cache_dir or Path(".executor") / "task_cache"
+            cache.disk_path = cache_dir / task_name
+        return cache
+
+    def get_inflight(self, key: str) -> T.Optional[Job]:
+        job = self.inflight.get(key)
+        if (job is not None) and \
+                (job.status not in ("created", "pending", "running")):
+            self.untrack_inflight(job)
+            return None
+        return job
+
+    def track_inflight(self, key: str, job: Job):
+        self.inflight[key] = job
+        self._inflight_keys[job.id] = key
+
+    def untrack_inflight(self, job: Job):
+        key = self._inflight_keys.pop(job.id, None)
+        if (key is not None) and (self.inflight.get(key) is job):
+            self.inflight.pop(key)
+
+    def track_cache(self, task_name: str, key: str, job: Job):
+        """Set the result of the job to the cache of the task when done."""
+        self._cache_keys[job.id] = (task_name, key)
+
+    def untrack(self, job: Job):
+        """Stop sharing and caching the job, which is not submitted."""
+        self.untrack_inflight(job)
+        self._cache_keys.pop(job.id, None)
+
+    def begin_admit(self, jobs: T.Iterable[Job]):
+        for job in jobs:
+            self._admitting[job.id] = self._admitting.get(job.id, 0) + 1
+
+    def end_admit(self, jobs: T.Iterable[Job]) -> T.List[Job]:
+        """Return the jobs not waited by the other requests."""
+        released = []
+        for job in jobs:
+            n = self._admitting.pop(job.id, 0) - 1
+            if n > 0:
+                self._admitting[job.id] = n
+            else:
+                released.append(job)
+        return released
+
+    def on_job_event(self, event: JobEvent):
+        """Stop sharing the job when it's finished or removed,
+        and fill the result cache if it's done."""
+        job = event.job
+        if job is None:
+            return
+        if (event.event != "remove") and \
+                (event.status not in ("done", "failed", "cancelled")):
+            return
+        if job.id in self._inflight_keys:
+            self.untrack_inflight(job)
+        cache_key = self._cache_keys.pop(job.id, None)
+        if (cache_key is not None) and (event.status == "done"):
+            cache = self.caches.get(cache_key[0])
+            if cache is not None:
+                cache.set_nowait(cache_key[1], job.result())
+
+    @property
+    def etag(self) -> str:
+        return make_etag("tasks", self.instance_id, self.version)
 
     @staticmethod
     def task_to_dict(task: AsyncLauncher) -> dict:
@@ -0,0 +1,151 @@
+import typing as T
+import json
+import asyncio
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+if T.TYPE_CHECKING:
+    from diskcache import Cache
+
+
+@dataclass
+class CachePolicy:
+    """Result cache policy of a deterministic task."""
+    # max number of results in the memory tier
+    max_entries: int = 128
+    # time to live of the results, in seconds
+    ttl: T.Optional[float] = None
+    # store the results on disk(diskcache) as the second tier
+    disk: bool = False
+    disk_size_limit: int = 1024 * 1024 * 1024  # bytes
+    disk_path: T.Optional[T.Union[str, Path]] = None
+
+
+_missing = object()
+
+
+class TaskResultCache(object):
+    """Two tiers(memory LRU and diskcache) cache of the task results,
+    keyed on the hash of the task name and the arguments."""
+
+    def __init__(self, policy: CachePolicy) -> None:
+        self.policy = policy
+        self.disk_path: T.Optional[Path] = None
+        if policy.disk_path is not None:
+            self.disk_path = Path(policy.disk_path)
+        self._memory: "OrderedDict[str, T.Tuple[T.Any, float]]" = \
+            OrderedDict()
+        self._disk: T.Optional["Cache"] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(task_name: str, args: tuple, kwargs: dict) -> str:
+        data = json.dumps(
+            [task_name, args, kwargs],
+            sort_keys=True, separators=(",", ":"), default=repr)
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    @property
+    def disk(self) -> T.Optional["Cache"]:
+        if (not self.policy.disk) or (self._disk is not None):
+            return self._disk
+        if self.disk_path is None:
+            raise ValueError("The path of the disk cache is not set.")
+        from diskcache import Cache
+        self._disk = Cache(
+            str(self.disk_path),
+            size_limit=self.policy.disk_size_limit,
+            eviction_policy="least-recently-used")
+        return self._disk
+
+    def _expire_at(self) -> float:
+        if self.policy.ttl is None:
+            return float("inf")
+        return time.time() + self.policy.ttl
+
+    def _set_memory(self, key: str, value: T.Any, expire_at: float):
+        self._memory[key] = (value, expire_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.policy.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> T.Tuple[bool, T.Any]:
+        """Return (hit, value)."""
+        with self._lock:
+            item = self._memory.get(key)
+            if item is not None:
+                if item[1] > time.time():
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return True, item[0]
+                self._memory.pop(key)
+            disk = self.disk
+            if disk is not None:
+                value, expire_at = disk.get(
+                    key, default=_missing, expire_time=True)
+                if value is not _missing:
+                    if expire_at is None:
+                        expire_at = float("inf")
+                    self._set_memory(key, value, expire_at)
+                    self.hits += 1
+                    return True, value
+            self.misses += 1
+            return False, None
+
+    async def get_async(self, key: str) -> T.Tuple[bool, T.Any]:
+        """`get`, in the thread pool if the disk tier is used."""
+        if self.policy.disk:
+            return await run_in_threadpool(self.get, key)
+        return self.get(key)
+
+    def _set_disk(self, key: str, value: T.Any):
+        with self._lock:
+            disk = self.disk
+        if disk is not None:
+            disk.set(key, value, expire=self.policy.ttl)
+
+    def set(self, key: str, value: T.Any):
+        with self._lock:
+            self._set_memory(key, value, self._expire_at())
+        self._set_disk(key, value)
+
+    def set_nowait(self, key: str, value: T.Any):
+        """Set the memory tier, and write the disk tier
+        in the thread pool if there is a running loop."""
+        with self._lock:
+            self._set_memory(key, value, self._expire_at())
+        if not self.policy.disk:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._set_disk(key, value)
+        else:
+            loop.run_in_executor(None, self._set_disk, key, value)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self.disk is not None:
+                self.disk.clear()
+
+    def stats(self) -> dict:
+        disk = self.disk
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self._memory),
+            "disk_entries": None if disk is None else len(disk),
+        }
+
+    def close(self):
+        if self._disk is not None:
+            self._disk.close()
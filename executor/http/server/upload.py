@@ -0,0 +1,155 @@
+import typing as T
+import bisect
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from starlette.concurrency import run_in_threadpool
+
+
+def copy_file(src: T.BinaryIO, dst: Path, chunk_size: int):
+    """Copy the file object to the path chunk by chunk."""
+    with open(dst, "wb") as f:
+        shutil.copyfileobj(src, f, chunk_size)
+
+
+class RangeSet(object):
+    """Sorted and merged byte ranges, [start, end)."""
+
+    def __init__(self) -> None:
+        self._starts: T.List[int] = []
+        self._ends: T.List[int] = []
+
+    def add(self, start: int, end: int):
+        if start >= end:
+            return
+        # merge the ranges overlap or adjacent to [start, end)
+        lo = bisect.bisect_left(self._ends, start)
+        hi = bisect.bisect_right(self._starts, end)
+        if lo < hi:
+            start = min(start, self._starts[lo])
+            end = max(end, self._ends[hi - 1])
+        self._starts[lo:hi] = [start]
+        self._ends[lo:hi] = [end]
+
+    def prefix_end(self, start: int = 0) -> int:
+        """End of the continuous range begin at `start`."""
+        idx = bisect.bisect_right(self._starts, start) - 1
+        if (idx >= 0) and (self._ends[idx] >= start):
+            return self._ends[idx]
+        return start
+
+    def total(self) -> int:
+        return sum(e - s for s, e in zip(self._starts, self._ends))
+
+    def to_list(self) -> T.List[T.Tuple[int, int]]:
+        return list(zip(self._starts, self._ends))
+
+
+class UploadSession(object):
+    """Upload a file by chunks, the chunks can be written in any order
+    and in parallel. The data is written to a part file beside the target,
+    which is renamed to the target when finalized."""
+
+    def __init__(
+            self, user_path: Path, target: Path, size: int,
+            sha256: T.Optional[str] = None) -> None:
+        self.id = uuid.uuid4().hex
+        self.user_path = user_path
+        self.target = target
+        self.size = size
+        self.expected_sha256 = sha256
+        self.part_path = target.with_name(f".{target.name}.{self.id}.part")
+        self.received = RangeSet()
+        self.created_time = time.time()
+        self.updated_time = self.created_time
+        # the checksum is updated when the continuous prefix grows
+        self._hash = hashlib.sha256()
+        self.hashed = 0
+        # the chunks are written in the threads, the file position
+        # is shared(no pwrite/pread on Windows), so seek under the lock
+        self._lock = threading.Lock()
+        self._file = open(self.part_path, "w+b")
+        self._file.truncate(size)
+
+    def write(self, offset: int, data: bytes):
+        with self._lock:
+            self._file.seek(offset)
+            self._file.write(data)
+            self.received.add(offset, offset + len(data))
+            self.updated_time = time.time()
+            # the chunks in order are hashed without reading back
+            if offset == self.hashed:
+                self._hash.update(data)
+                self.hashed += len(data)
+
+    def _update_hash(self, chunk_size: int):
+        with self._lock:
+            end = self.received.prefix_end(0)
+            while self.hashed < end:
+                n = min(chunk_size, end - self.hashed)
+                self._file.seek(self.hashed)
+                data = self._file.read(n)
+                self._hash.update(data)
+                self.hashed += len(data)
+
+    async def update_hash(self, chunk_size: int):
+        await run_in_threadpool(self._update_hash, chunk_size)
+
+    @property
+    def complete(self) -> bool:
+        return self.received.prefix_end(0) >= self.size
+
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def close(self, remove_part: bool = True):
+        if not self._file.closed:
+            self._file.close()
+        if remove_part and self.part_path.exists():
+            os.remove(self.part_path)
+
+    def finalize(self):
+        """Move the part file to the target."""
+        self.close(remove_part=False)
+        os.replace(self.part_path, self.target)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "size": self.size,
+            "received": self.received.to_list(),
+            "received_size": self.received.total(),
+            "hashed": self.hashed,
+            "complete": self.complete,
+        }
+
+
+class UploadSessions(object):
+    """The in-progress upload sessions,
+    the sessions without update for `expire` seconds are dropped."""
+
+    def __init__(self, expire: float = 24 * 3600) -> None:
+        self.expire = expire
+        self.sessions: T.Dict[str, UploadSession] = {}
+
+    def add(self, session: UploadSession):
+        self.expire_sessions()
+        self.sessions[session.id] = session
+
+    def get(self, session_id: str) -> T.Optional[UploadSession]:
+        return self.sessions.get(session_id)
+
+    def pop(self, session_id: str) -> T.Optional[UploadSession]:
+        return self.sessions.pop(session_id, None)
+
+    def expire_sessions(self):
+        now = time.time()
+        for session in list(self.sessions.values()):
+            if now - session.updated_time > self.expire:
+                self.sessions.pop(session.id)
+                session.close()
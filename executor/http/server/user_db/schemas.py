@@ -14,7 +14,7 @@ class Login(BaseModel):
 
 
 Role = T.Literal["root", "admin", "user"]
-_role_order = ['root', 'admin', 'user']
+_role_order: T.List[Role] = ['root', 'admin', 'user']
 
 
 def role_priority_over(role1: Role, role2: Role) -> bool:
@@ -27,6 +27,11 @@ def role_priority_over(role1: Role, role2: Role) -> bool:
         return False
 
 
+def roles_under(role: Role) -> T.List[Role]:
+    """Roles which the `role` has priority over(include itself)."""
+    return [r for r in _role_order if role_priority_over(role, r)]
+
+
 class UserBase(BaseModel):
     username: str
     role: Role
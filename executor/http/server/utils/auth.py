@@ -1,7 +1,7 @@
 import typing as T
 from datetime import datetime, timedelta
 
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status, Request, WebSocket
 from sqlalchemy.ext.asyncio import AsyncSession
 from jose import jwt, JWTError
 
@@ -46,10 +46,10 @@ async def get_db(app: CustomFastAPI = Depends(get_app)):
         yield None
 
 
-async def get_current_user(
-        token: str = Depends(token_dependency),
-        db: AsyncSession = Depends(get_db),
-        app: CustomFastAPI = Depends(get_app),
+async def get_user_from_token(
+        token: T.Optional[str],
+        db: AsyncSession,
+        app: CustomFastAPI,
         ) -> T.Optional[schemas.User]:
     if app.config.user_mode != "free":
         credentials_exception = HTTPException(
@@ -57,6 +57,8 @@ async def get_current_user(
             detail="Could not validate credentials.",
             headers={"WWW-Authenticate": "Bearer"},
         )
+        if token is None:
+            raise credentials_exception
         try:
             payload = jwt.decode(
                 token, app.config.jwt_secret_key, [app.config.jwt_algorithm])
@@ -75,6 +77,34 @@ async def get_current_user(
         return None
 
 
+async def get_current_user(
+        token: str = Depends(token_dependency),
+        db: AsyncSession = Depends(get_db),
+        app: CustomFastAPI = Depends(get_app),
+        ) -> T.Optional[schemas.User]:
+    return await get_user_from_token(token, db, app)
+
+
+async def get_websocket_user(
+        websocket: WebSocket) -> T.Optional[schemas.User]:
+    """Authenticate the websocket connection, the token can be passed
+    by the `token` query parameter, header or cookie."""
+    app: CustomFastAPI = websocket.app
+    if app.config.user_mode == "free":
+        return None
+    token = websocket.query_params.get("token")
+    if token is None:
+        oauth2_scheme = OAuth2PasswordBearerCookie(
+            tokenUrl="user/token", auto_error=False)
+        token = await oauth2_scheme(websocket)  # type: ignore
+    assert app.db_engine is not None
+    db = get_async_session(app.db_engine)
+    try:
+        return await get_user_from_token(token, db, app)
+    finally:
+        await db.close()
+
+
 async def auth_user(
         db: AsyncSession,
         username: str, password: str,
@@ -104,21 +134,37 @@ def create_access_token(
     return encoded_jwt
 
 
-def user_can_access(user: User, job: Job) -> bool:
-    job_user: T.Optional[User] = job.attrs.get("user")
-    if job_user is not None:
-        if user.username == job_user.username:
+def user_can_access_owner(user: User, owner: T.Optional[User]) -> bool:
+    if owner is not None:
+        if user.username == owner.username:
             return True
-        if role_priority_over(user.role, job_user.role):
+        if role_priority_over(user.role, owner.role):
             return True
     return False
 
 
-def check_user_job(user: T.Optional[User], job: Job) -> Job:
+def user_can_access(user: User, job: Job) -> bool:
+    """Read access, the users sharing the job can read and wait it."""
+    if user.username in job.attrs.get("shared_users", ()):
+        return True
+    return user_can_access_owner(user, job.attrs.get("user"))
+
+
+def user_can_manage(user: User, job: Job) -> bool:
+    """Cancel, remove and rerun the job, not allowed to the shared users."""
+    return user_can_access_owner(user, job.attrs.get("user"))
+
+
+def check_user_job(
+        user: T.Optional[User], job: Job, manage: bool = False) -> Job:
     if user is None:
         return job
     else:
-        if user_can_access(user, job):
+        if manage:
+            allowed = user_can_manage(user, job)
+        else:
+            allowed = user_can_access(user, job)
+        if allowed:
             return job
         raise HTTPException(
             status.HTTP_403_FORBIDDEN,
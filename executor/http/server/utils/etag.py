@@ -0,0 +1,44 @@
+import typing as T
+import hashlib
+
+from fastapi import Request, Response, status
+
+if T.TYPE_CHECKING:
+    from ..user_db.schemas import User
+
+
+def make_etag(*parts: T.Any) -> str:
+    """Make a strong entity tag from the parts."""
+    return '"' + "-".join(str(p) for p in parts) + '"'
+
+
+def user_tag(user: T.Optional["User"]) -> str:
+    """Short digest of the user's visibility(name and role)."""
+    if user is None:
+        return "all"
+    key = f"{user.username}:{user.role}".encode("utf-8")
+    return hashlib.sha1(key).hexdigest()[:12]
+
+
+def etag_matches(if_none_match: T.Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def not_modified(request: Request, etag: str) -> T.Optional[Response]:
+    """Return the 304 response if the `If-None-Match` header
+    matches the etag, else None."""
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED,
+            headers={"ETag": etag})
+    return None
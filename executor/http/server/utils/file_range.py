@@ -0,0 +1,178 @@
+import typing as T
+import os
+import uuid
+import mimetypes
+from email.utils import formatdate, parsedate_to_datetime
+from pathlib import Path
+
+import anyio
+from fastapi import Request, Response, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from .etag import make_etag, etag_matches
+
+
+ByteRange = T.Tuple[int, int]  # [start, end)
+
+max_ranges = 100
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def parse_range(header: str, size: int) -> T.Optional[T.List[ByteRange]]:
+    """Parse the `Range` header, return None if it's malformed
+    (the header should be ignored). Raise RangeNotSatisfiable if
+    none of the ranges overlap the file."""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges: T.List[ByteRange] = []
+    specs = spec.split(",")
+    if len(specs) > max_ranges:
+        return None
+    for item in specs:
+        first, sep, last = item.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if first == "":
+                # suffix range: the last N bytes
+                n = int(last)
+                if n <= 0:
+                    continue
+                start, end = max(size - n, 0), size
+            else:
+                start = int(first)
+                end = size
+                if last != "":
+                    if int(last) < start:
+                        return None
+                    end = min(int(last) + 1, size)
+        except ValueError:
+            return None
+        if (start < 0) or (start >= size):
+            continue
+        ranges.append((start, end))
+    if not ranges:
+        raise RangeNotSatisfiable()
+    return ranges
+
+
+def file_etag(stat: os.stat_result) -> str:
+    return make_etag(f"{stat.st_mtime_ns:x}", f"{stat.st_size:x}")
+
+
+def is_not_modified(
+        request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime) <= since
+    return False
+
+
+def if_range_matches(
+        if_range: str, etag: str, last_modified: str) -> bool:
+    # weak tags are not allowed
+    return (if_range == etag) or (if_range == last_modified)
+
+
+async def iter_file_ranges(
+        path: Path, ranges: T.List[ByteRange], chunk_size: int,
+        part_headers: T.Optional[T.List[bytes]] = None,
+        tail: bytes = b"") -> T.AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as f:
+        for i, (start, end) in enumerate(ranges):
+            if part_headers is not None:
+                yield part_headers[i]
+            await f.seek(start)
+            remain = end - start
+            while remain > 0:
+                data = await f.read(min(chunk_size, remain))
+                if not data:
+                    break
+                remain -= len(data)
+                yield data
+            if part_headers is not None:
+                yield b"\r\n"
+    if tail:
+        yield tail
+
+
+async def file_response(
+        request: Request, path: Path,
+        chunk_size: int = 64 * 1024) -> Response:
+    """Response of the file, support the conditional requests
+    (`If-None-Match`, `If-Modified-Since`) and the range requests
+    (`Range`, `If-Range`), the ranges are streamed from the file."""
+    stat = await run_in_threadpool(os.stat, path)
+    size = stat.st_size
+    etag = file_etag(stat)
+    last_modified = formatdate(stat.st_mtime, usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+    }
+    if is_not_modified(request, etag, stat.st_mtime):
+        return Response(
+            status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    content_type = mimetypes.guess_type(path.name)[0] or \
+        "application/octet-stream"
+
+    ranges = None
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # the whole file is sent if it's changed since the `If-Range`
+    use_range = (range_header is not None) and (
+        (if_range is None) or
+        if_range_matches(if_range, etag, last_modified))
+    if use_range:
+        assert range_header is not None
+        try:
+            ranges = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            headers["Content-Range"] = f"bytes */{size}"
+            return Response(
+                status_code=status.HTTP_416_RANGE_NOT_SATISFIABLE,
+                headers=headers)
+
+    if ranges is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            iter_file_ranges(path, [(0, size)], chunk_size),
+            media_type=content_type, headers=headers)
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+        headers["Content-Length"] = str(end - start)
+        return StreamingResponse(
+            iter_file_ranges(path, ranges, chunk_size),
+            status_code=status.HTTP_206_PARTIAL_CONTENT,
+            media_type=content_type, headers=headers)
+    boundary = uuid.uuid4().hex
+    part_headers = [
+        (f"--{boundary}\r\n"
+         f"Content-Type: {content_type}\r\n"
+         f"Content-Range: bytes {start}-{end - 1}/{size}\r\n\r\n"
+         ).encode("latin-1")
+        for start, end in ranges
+    ]
+    tail = f"--{boundary}--\r\n".encode("latin-1")
+    length = sum(len(h) + (end - start) + 2
+                 for h, (start, end) in zip(part_headers, ranges))
+    headers["Content-Length"] = str(length + len(tail))
+    return StreamingResponse(
+        iter_file_ranges(path, ranges, chunk_size, part_headers, tail),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        media_type=f"multipart/byteranges; boundary={boundary}",
+        headers=headers)
@@ -0,0 +1,169 @@
+import typing as T
+import os
+import json
+import asyncio
+from pathlib import Path
+
+from fastapi import HTTPException, status
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+
+_TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def _complete_utf8_len(data: bytes) -> int:
+    """Length of the data without the trailing incomplete UTF-8 char."""
+    n = len(data)
+    for i in range(1, min(4, n) + 1):
+        byte = data[n - i]
+        if byte & 0b11000000 == 0b10000000:  # continuation byte
+            continue
+        if byte & 0b10000000 == 0:  # ascii
+            return n
+        if byte & 0b11100000 == 0b11000000:
+            char_len = 2
+        elif byte & 0b11110000 == 0b11100000:
+            char_len = 3
+        else:
+            char_len = 4
+        return n if i >= char_len else n - i
+    return n
+
+
+def _first_char_len(data: bytes) -> int:
+    byte = data[0]
+    if byte & 0b11100000 == 0b11000000:
+        char_len = 2
+    elif byte & 0b11110000 == 0b11100000:
+        char_len = 3
+    elif byte & 0b11111000 == 0b11110000:
+        char_len = 4
+    else:
+        char_len = 1
+    return min(char_len, len(data))
+
+
+def _read_tail(f: T.BinaryIO, size: int, n_lines: int) -> bytes:
+    """Read the last `n_lines` lines, seek from the end of the file."""
+    if n_lines <= 0:
+        return b""
+    pos = size
+    data = b""
+    while pos > 0:
+        read_size = min(_TAIL_BLOCK_SIZE, pos)
+        pos -= read_size
+        f.seek(pos)
+        data = f.read(read_size) + data
+        # the trailing newline is not the separator of the last line
+        if data.count(b"\n", 0, len(data) - 1) >= n_lines:
+            break
+    lines = data.splitlines(keepends=True)
+    return b"".join(lines[-n_lines:])
+
+
+def read_log(
+        path: Path,
+        offset: T.Optional[int] = None,
+        limit: T.Optional[int] = None,
+        tail: T.Optional[int] = None) -> dict:
+    """Read the log file.
+
+    Args:
+        path: Path to the log file.
+        offset: Read from the byte offset.
+        limit: Max number of bytes to read.
+        tail: Only read the last N lines.
+
+    Return the content and the offset for the next read.
+    """
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if tail is not None:
+            data = _read_tail(f, size, tail)
+            next_offset = size
+        else:
+            start = min(offset or 0, size)
+            f.seek(start)
+            data = f.read(-1 if limit is None else limit)
+            n = _complete_utf8_len(data)
+            if (n == 0) and data:
+                # the limit cuts the first char, read the whole char
+                # so the offset always moves forward
+                data += f.read(3)
+                n = _first_char_len(data)
+            data = data[:n]
+            next_offset = start + len(data)
+    return {
+        'content': data.decode('utf-8', errors='replace'),
+        'offset': next_offset,
+        'size': size,
+    }
+
+
+async def read_log_async(
+        path: Path,
+        offset: T.Optional[int] = None,
+        limit: T.Optional[int] = None,
+        tail: T.Optional[int] = None) -> dict:
+    """Read the log file in the thread pool,
+    raise HTTPException if failed."""
+    try:
+        return await run_in_threadpool(read_log, path, offset, limit, tail)
+    except Exception as e:
+        raise HTTPException(
+            status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+
+async def follow_log(
+        path: Path,
+        offset: int = 0,
+        is_finished: T.Optional[T.Callable[[], bool]] = None,
+        poll_interval: float = 0.5,
+        chunk_size: int = 1024 * 1024,
+        ) -> T.AsyncIterator[dict]:
+    """Yield the newly appended content of the log file.
+    Stop when `is_finished` return True and all content is read."""
+    while True:
+        finished = (is_finished is not None) and \
+            await run_in_threadpool(is_finished)
+        try:
+            res = await run_in_threadpool(
+                read_log, path, offset, chunk_size)
+        except FileNotFoundError:
+            res = {'content': "", 'offset': 0, 'size': 0}
+        if res['size'] < offset:  # truncated
+            offset = 0
+            continue
+        if res['offset'] > offset:
+            offset = res['offset']
+            yield res
+            if offset < res['size']:
+                continue
+        if finished:
+            break
+        await asyncio.sleep(poll_interval)
+
+
+def follow_log_response(
+        path: Path,
+        offset: int = 0,
+        is_finished: T.Optional[T.Callable[[], bool]] = None,
+        poll_interval: float = 0.5) -> StreamingResponse:
+    """Stream the appended content of the log file as Server-Sent Events."""
+    async def event_stream():
+        async for res in follow_log(path, offset, is_finished, poll_interval):
+            data = json.dumps({
+                'content': res['content'],
+                'offset': res['offset'],
+            })
+            yield f"event: log\ndata: {data}\n\n"
+        yield "event: end\ndata: {}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
@@ -11,10 +11,17 @@ from executor.engine.job import Job, LocalJob, ThreadJob, ProcessJob
 from executor.engine.job.extend import SubprocessJob, WebappJob
 from executor.engine.manager import Jobs
 
+from ..scheduler import unwrap_condition, queue_position
+
 if T.TYPE_CHECKING:
     from executor.engine import Engine
     from ..config import ServerSetting
     from ..task import TaskTable
+    from ..result import ResultCache
+    from ..archive import JobArchive, JobRetention
+    from ..admission import AdmissionControl
+    from ..upload import UploadSessions
+    from ..dir_list import DirListCache
     from sqlalchemy.ext.asyncio import AsyncEngine
 
 
@@ -23,6 +30,12 @@ class CustomFastAPI(FastAPI):
     task_table: "TaskTable"
     engine: "Engine"
     db_engine: T.Optional["AsyncEngine"]
+    result_cache: "ResultCache"
+    job_archive: T.Optional["JobArchive"]
+    job_retention: T.Optional["JobRetention"]
+    admission: "AdmissionControl"
+    upload_sessions: "UploadSessions"
+    dir_cache: "DirListCache"
     include_proxy_router: T.Callable
 
 
@@ -62,11 +75,12 @@ def job_to_jobtype(job: Job) -> JobType:
 
 def ser_job(job: Job, allow_proxy: bool) -> dict:
     """Convert job to a JSON-able dict."""
-    if job.condition is not None:
-        cls_name = job.condition.__class__.__name__
+    condition = unwrap_condition(job.condition)
+    if condition is not None:
+        cls_name = condition.__class__.__name__
         cond = ConditionType(
             type=cls_name,
-            arguments=asdict(job.condition)
+            arguments=asdict(condition)
         )
         cond_dict = cond.dict()
     else:
@@ -77,8 +91,9 @@ def ser_job(job: Job, allow_proxy: bool) -> dict:
         if 'address' in job.attrs:
             attrs.pop('address')
 
-    if 'user' in job.attrs:
-        attrs.pop('user')
+    attrs.pop('user', None)
+    # not expose the usernames of the others
+    attrs.pop('shared_users', None)
 
     return {
         'id': job.id,
@@ -91,6 +106,7 @@ def ser_job(job: Job, allow_proxy: bool) -> dict:
         'created_time': format_datetime(job.created_time),
         'submit_time': format_datetime(job.submit_time),
         'stoped_time': format_datetime(job.stoped_time),
+        'queue_position': queue_position(job),
         'attrs': attrs,
     }
 
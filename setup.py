@@ -60,8 +60,11 @@ requires_test = [
 ]
 packages_for_dev = ["pip", "setuptools", "wheel", "twine", "ipdb"]
 
-requires_dev = packages_for_dev + requires_test
 requires_dask = ['dask', 'distributed', 'nest_asyncio']
+requires_serialization = ['msgpack', 'numpy']
+requires_archive = ['zstandard']
+requires_dev = packages_for_dev + requires_test + \
+    requires_serialization + requires_archive
 
 
 setup(
@@ -82,6 +85,8 @@ setup(
     extras_require={
         'dev': requires_dev,
         'dask': requires_dask,
+        'serialization': requires_serialization,
+        'archive': requires_archive,
     },
     python_requires='>=3.7, <4',
 )
@@ -157,3 +157,280 @@ def test_move_files(
     ])
     assert all([(not Path(f).exists()) for f in files_path_for_move])
     shutil.rmtree(dest_dir_path)
+
+
+def test_upload_session(
+        client: TestClient,
+        headers: T.Optional[dict],
+        base_path: Path):
+    import hashlib
+    content = b"0123456789" * 10
+    target = "uploaded_by_chunks.bin"
+    resp = client.post(
+        "/file/upload_session",
+        json={
+            "path": target, "size": len(content),
+            "sha256": hashlib.sha256(content).hexdigest(),
+        },
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    session_id = resp.json()['id']
+    url = f"/file/upload_session/{session_id}"
+
+    def put(start, end):
+        return client.put(
+            f"{url}?offset={start}", content=content[start:end],
+            headers=headers)
+
+    # chunks in any order
+    assert put(60, 100).status_code == 200
+    resp = put(0, 30)
+    assert resp.json()['received'] == [[0, 30], [60, 100]]
+    assert resp.json()['hashed'] == 30
+    assert client.post(
+        f"{url}/finalize", headers=headers).status_code == 409
+    resp = client.put(
+        f"{url}?offset=90", content=b"x" * 30, headers=headers)
+    assert resp.status_code == 400
+    resp = client.put(
+        f"{url}?offset=30", content=b"x",
+        headers={**(headers or {}), "Content-Length": "x"})
+    assert resp.status_code == 400
+    # resume from the status
+    resp = client.get(url, headers=headers)
+    assert resp.json()['received_size'] == 70
+    assert put(30, 60).json()['complete']
+    resp = client.post(f"{url}/finalize", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()['sha256'] == hashlib.sha256(content).hexdigest()
+    assert (base_path / target).read_bytes() == content
+    assert client.get(url, headers=headers).status_code == 404
+    os.remove(base_path / target)
+
+    # checksum mismatch
+    resp = client.post(
+        "/file/upload_session",
+        json={"path": target, "size": 3, "sha256": "0" * 64},
+        headers=headers,
+    )
+    url = f"/file/upload_session/{resp.json()['id']}"
+    client.put(f"{url}?offset=0", content=b"abc", headers=headers)
+    resp = client.post(f"{url}/finalize", headers=headers)
+    assert resp.status_code == 400
+    assert not (base_path / target).exists()
+    assert not list(base_path.glob(f".{target}.*.part"))
+
+
+def test_download_range(
+        client: TestClient,
+        headers: T.Optional[dict],
+        base_path: Path):
+    headers = headers or {}
+    content = bytes(range(256)) * 4
+    file_path = base_path / "for_range.bin"
+    file_path.write_bytes(content)
+    url = "/file/download?path=for_range.bin"
+
+    resp = client.get(url, headers=headers)
+    assert resp.status_code == 200
+    assert resp.content == content
+    etag = resp.headers["etag"]
+    last_modified = resp.headers["last-modified"]
+    assert resp.headers["accept-ranges"] == "bytes"
+
+    resp = client.get(url, headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 304
+    resp = client.get(
+        url, headers={**headers, "If-Modified-Since": last_modified})
+    assert resp.status_code == 304
+
+    resp = client.get(url, headers={**headers, "Range": "bytes=10-19"})
+    assert resp.status_code == 206
+    assert resp.content == content[10:20]
+    assert resp.headers["content-range"] == f"bytes 10-19/{len(content)}"
+    resp = client.get(url, headers={**headers, "Range": "bytes=-5"})
+    assert resp.content == content[-5:]
+    resp = client.get(url, headers={**headers, "Range": "bytes=2000-"})
+    assert resp.status_code == 416
+    assert resp.headers["content-range"] == f"bytes */{len(content)}"
+
+    resp = client.get(
+        url, headers={**headers, "Range": "bytes=0-1,100-"})
+    assert resp.status_code == 206
+    ctype = resp.headers["content-type"]
+    assert ctype.startswith("multipart/byteranges")
+    assert int(resp.headers["content-length"]) == len(resp.content)
+    boundary = ctype.split("boundary=")[1].encode()
+    parts = resp.content.split(b"--" + boundary)
+    assert len(parts) == 4
+    assert parts[1].endswith(b"\r\n\r\n" + content[0:2] + b"\r\n")
+    assert parts[2].endswith(b"\r\n\r\n" + content[100:] + b"\r\n")
+
+    # the range is ignored if the file is changed
+    resp = client.get(url, headers={
+        **headers, "Range": "bytes=0-1", "If-Range": etag})
+    assert resp.status_code == 206
+    resp = client.get(url, headers={
+        **headers, "Range": "bytes=0-1", "If-Range": '"old"'})
+    assert resp.status_code == 200
+    assert resp.content == content
+
+    resp = client.get("/file/download?path=../../x", headers=headers)
+    assert resp.status_code == 403
+    os.remove(file_path)
+
+
+def test_list_dir_paging(
+        client: TestClient,
+        headers: T.Optional[dict],
+        base_path: Path):
+    dir_path = base_path / "test_list_paging"
+    dir_path.mkdir(exist_ok=True)
+    for i in range(5):
+        (dir_path / f"f{i}.txt").write_bytes(b"x" * (5 - i))
+    (dir_path / "sub").mkdir()
+
+    def list_dir(**kwargs):
+        return client.post(
+            "/file/list_dir",
+            json={"path": "test_list_paging", **kwargs},
+            headers=headers,
+        )
+
+    resp = list_dir()
+    assert [f['name'] for f in resp.json()] == \
+        ["f0.txt", "f1.txt", "f2.txt", "f3.txt", "f4.txt", "sub"]
+    assert resp.json()[-1]['isDir']
+    assert "X-Next-Cursor" not in resp.headers
+
+    names = []
+    cursor = None
+    while True:
+        resp = list_dir(pattern="*.txt", sort="size", limit=2, cursor=cursor)
+        names += [f['name'] for f in resp.json()]
+        cursor = resp.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert names == ["f4.txt", "f3.txt", "f2.txt", "f1.txt", "f0.txt"]
+
+    resp = list_dir(reverse=True, limit=4)
+    assert [f['name'] for f in resp.json()] == \
+        ["sub", "f4.txt", "f3.txt", "f2.txt"]
+    resp = list_dir(
+        reverse=True, limit=4, cursor=resp.headers["X-Next-Cursor"])
+    assert [f['name'] for f in resp.json()] == ["f1.txt", "f0.txt"]
+
+    resp = list_dir(names_only=True, pattern="f0*")
+    assert resp.json() == [{"name": "f0.txt", "isDir": False}]
+    assert list_dir(sort="mtime", cursor="bad").status_code == 400
+    shutil.rmtree(dir_path)
+
+
+def test_list_dir_cache_invalidation(
+        client: TestClient,
+        headers: T.Optional[dict],
+        base_path: Path):
+    client.app.dir_cache.mtime_granularity_ns = 0
+    dir_path = base_path / "test_list_cache"
+    dir_path.mkdir(exist_ok=True)
+    stat = os.stat(dir_path)
+
+    def list_names():
+        resp = client.post(
+            "/file/list_dir",
+            json={"path": "test_list_cache"},
+            headers=headers,
+        )
+        return [f['name'] for f in resp.json()]
+
+    assert list_names() == []
+    assert list_names() == []
+    assert client.app.dir_cache.hits >= 1
+    # a change which keeps the mtime is hidden by the cache
+    (dir_path / "a.txt").write_text("1")
+    os.utime(dir_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert list_names() == []
+    # until the file router changes the dir
+    (dir_path / "b.txt").write_text("2")
+    os.utime(dir_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    resp = client.post(
+        "/file/delete",
+        json={"paths": ["test_list_cache/b.txt"]},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    assert list_names() == ["a.txt"]
+    shutil.rmtree(dir_path)
+
+
+def test_download_archive(
+        client: TestClient,
+        headers: T.Optional[dict],
+        base_path: Path):
+    import io
+    import tarfile
+    import zipfile
+    dir_path = base_path / "test_archive"
+    (dir_path / "sub" / "empty").mkdir(parents=True, exist_ok=True)
+    (dir_path / "a.txt").write_text("aaa")
+    big = os.urandom(300 * 1024)
+    (dir_path / "sub" / "b.bin").write_bytes(big)
+    (base_path / "c.txt").write_text("ccc")
+
+    resp = client.post(
+        "/file/archive",
+        json={"paths": ["test_archive", "c.txt"]},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/zip"
+    assert "archive.zip" in resp.headers["content-disposition"]
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        assert zf.read("test_archive/a.txt") == b"aaa"
+        assert zf.read("test_archive/sub/b.bin") == big
+        assert zf.read("c.txt") == b"ccc"
+        assert "test_archive/sub/empty/" in zf.namelist()
+
+    resp = client.post(
+        "/file/archive",
+        json={"paths": ["test_archive"], "format": "tar.gz"},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    assert "test_archive.tar.gz" in resp.headers["content-disposition"]
+    with tarfile.open(fileobj=io.BytesIO(resp.content), mode="r:gz") as tar:
+        assert tar.getmember("test_archive/sub/empty").isdir()
+        f = tar.extractfile("test_archive/sub/b.bin")
+        assert f is not None and f.read() == big
+
+    resp = client.post(
+        "/file/archive",
+        json={"paths": ["c.txt"], "format": "tar.zst"},
+        headers=headers,
+    )
+    try:
+        import zstandard
+    except ImportError:
+        assert resp.status_code == 400
+    else:
+        data = zstandard.ZstdDecompressor().stream_reader(
+            io.BytesIO(resp.content)).read()
+        with tarfile.open(fileobj=io.BytesIO(data)) as tar:
+            f = tar.extractfile("c.txt")
+            assert f is not None and f.read() == b"ccc"
+
+    resp = client.post(
+        "/file/archive",
+        json={"paths": ["not_exists"]},
+        headers=headers,
+    )
+    assert resp.status_code == 404
+    resp = client.post(
+        "/file/archive",
+        json={"paths": ["../../"]},
+        headers=headers,
+    )
+    assert resp.status_code == 403
+    shutil.rmtree(dir_path)
+    os.remove(base_path / "c.txt")
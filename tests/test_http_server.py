@@ -1,4 +1,5 @@
 import typing as T
+import io
 import time
 from http.server import HTTPServer, SimpleHTTPRequestHandler
 from cmd2func import cmd2func
@@ -181,6 +182,23 @@ async def test_fetch_log(
     resp = await async_client.get(f"/job/stderr/{job_id}", headers=headers)
     assert resp.status_code == 200
     assert len(resp.json()['content']) > 0
+    resp = await async_client.get(
+        f"/job/stdout/{job_id}", params={"offset": 1, "limit": 2},
+        headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()['content'] == "el"
+    assert resp.json()['offset'] == 3
+    resp = await async_client.get(
+        f"/job/stderr/{job_id}", params={"tail": 1}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()['content'].count("\n") <= 1
+    resp = await async_client.get(
+        f"/job/stdout/{job_id}", params={"follow": True, "offset": 2},
+        headers=headers)
+    assert resp.status_code == 200
+    assert resp.text.startswith("event: log\n")
+    assert '"content": "llo\\n"' in resp.text
+    assert resp.text.endswith("event: end\ndata: {}\n\n")
 
 
 @pytest.mark.asyncio
@@ -424,3 +442,690 @@ def test_register_job(
     assert resp.status_code == 200
     resp = client.get("/task/list_all", headers=headers)
     assert resp.status_code == 200
+
+
+def test_list_jobs_pagination(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="local")
+    def add_1(a):
+        return a + 1
+
+    @task_table.register
+    @launcher(job_type="local")
+    def add_2(a):
+        return a + 2
+
+    job_ids = []
+    for i in range(5):
+        resp = client.post(
+            "/task/call",
+            json={
+                "task_name": "add_1" if i < 3 else "add_2",
+                "args": [i],
+                "kwargs": {},
+            },
+            headers=headers,
+        )
+        assert resp.status_code == 200
+        job_ids.append(resp.json()['id'])
+
+    fetched = []
+    cursor = None
+    while True:
+        params: T.Dict[str, T.Any] = {"limit": 2}
+        if cursor is not None:
+            params["cursor"] = cursor
+        resp = client.get("/job/list_all", params=params, headers=headers)
+        assert resp.status_code == 200
+        assert len(resp.json()) <= 2
+        fetched.extend(job['id'] for job in resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert fetched == job_ids
+
+    resp = client.get(
+        "/job/list_all", params={"reverse": True}, headers=headers)
+    assert [job['id'] for job in resp.json()] == job_ids[::-1]
+
+    resp = client.get(
+        "/job/list_all", params={"task_name": "add_2"}, headers=headers)
+    assert [job['id'] for job in resp.json()] == job_ids[3:]
+
+    resp = client.get(
+        "/job/list_all",
+        params={"task_name": "add_1", "job_type": "process"},
+        headers=headers)
+    assert resp.json() == []
+
+    resp = client.get(
+        "/job/list_all", params={"cursor": "bad"}, headers=headers)
+    assert resp.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_wait_job_timeout(
+        async_client: AsyncClient,
+        async_get_headers: T.Awaitable[T.Optional[dict]]):
+    task_table: TaskTable = async_client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="thread")
+    def sleep_then_return(t):
+        time.sleep(t)
+        return t
+
+    headers = await async_get_headers
+    resp = await async_client.post(
+        "/task/call",
+        json={
+            "task_name": "sleep_then_return",
+            "args": [1],
+            "kwargs": {},
+        },
+        headers=headers
+    )
+    assert resp.status_code == 200
+    job_id = resp.json()['id']
+    resp = await async_client.post("/job/wait", json={
+        "job_id": job_id,
+        "timeout": 0.1,
+    }, headers=headers)
+    assert resp.status_code == 408
+    resp = await async_client.get(
+        f"/job/result/{job_id}", params={"timeout": 0.1}, headers=headers)
+    assert resp.status_code == 408
+    resp = await async_client.post("/job/wait", json={
+        "job_id": job_id,
+        "statuses": ["running", "done"],
+    }, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()['status'] in ("running", "done")
+    resp = await async_client.get(
+        f"/job/result/{job_id}", params={"timeout": 5}, headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()['result'] == 1
+
+
+def test_job_events_ws(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="local")
+    def add_3(a):
+        return a + 3
+
+    with client.websocket_connect(
+            "/job/events/ws", headers=headers or {}) as ws:
+        resp = client.post(
+            "/task/call",
+            json={
+                "task_name": "add_3",
+                "args": [1],
+                "kwargs": {},
+            },
+            headers=headers,
+        )
+        job_id = resp.json()['id']
+        event = ws.receive_json()
+        assert event['event'] == "add"
+        assert event['id'] == job_id
+        assert event['name'] == "add_3"
+        statuses = []
+        while True:
+            event = ws.receive_json()
+            assert event['event'] == "status"
+            statuses.append(event['status'])
+            if event['status'] == "done":
+                break
+        assert statuses == ["running", "done"]
+        assert event['stoped_time'] is not None
+        client.get(f"/job/remove/{job_id}", headers=headers)
+        event = ws.receive_json()
+        assert event == {"event": "remove", "id": job_id}
+
+    if client.app.config.user_mode != "free":
+        with pytest.raises(Exception):
+            with client.websocket_connect("/job/events/ws") as ws:
+                ws.receive_json()
+
+
+def test_job_status_batch(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="local")
+    def add_4(a):
+        return a + 4
+
+    job_ids = []
+    for i in range(3):
+        resp = client.post(
+            "/task/call",
+            json={
+                "task_name": "add_4",
+                "args": [i],
+                "kwargs": {},
+            },
+            headers=headers,
+        )
+        job_ids.append(resp.json()['id'])
+    resp = client.post(
+        "/job/status_batch",
+        json={"job_ids": job_ids + ["fake"]},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    entries = resp.json()
+    assert [e['id'] for e in entries] == job_ids + ["fake"]
+    assert all(e['job']['id'] == e['id'] for e in entries[:3])
+    assert 'error' in entries[3]
+
+
+def test_job_changes(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="local")
+    def add_5(a):
+        return a + 5
+
+    resp = client.get("/job/changes", headers=headers)
+    assert resp.status_code == 200
+    assert resp.json()['reset']
+    version = resp.json()['version']
+    resp = client.get(
+        "/job/changes", params={"since": version}, headers=headers)
+    assert resp.json()['changed'] == []
+    assert resp.json()['removed'] == []
+
+    resp = client.post(
+        "/task/call",
+        json={"task_name": "add_5", "args": [1], "kwargs": {}},
+        headers=headers,
+    )
+    job_id = resp.json()['id']
+    resp = client.get(
+        "/job/changes", params={"since": version}, headers=headers)
+    changes = resp.json()
+    assert not changes['reset']
+    assert [j['id'] for j in changes['changed']] == [job_id]
+    assert changes['version'] != version
+    version = changes['version']
+
+    resp = client.get(f"/job/remove/{job_id}", headers=headers)
+    assert resp.status_code == 200
+    resp = client.get(
+        "/job/changes", params={"since": version}, headers=headers)
+    changes = resp.json()
+    assert changes['changed'] == []
+    assert changes['removed'] == [job_id]
+
+    instance_id, _, n = changes['version'].partition(":")
+    resp = client.get(
+        "/job/changes", params={"since": f"{instance_id}:{int(n) + 100}"},
+        headers=headers)
+    assert resp.json()['reset']
+    # the cursor from a previous run of the server
+    resp = client.get(
+        "/job/changes", params={"since": f"x{instance_id[1:]}:{n}"},
+        headers=headers)
+    assert resp.json()['reset']
+    resp = client.get(
+        "/job/changes", params={"since": "bad"}, headers=headers)
+    assert resp.json()['reset']
+
+
+def test_conditional_listing(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+    headers = headers or {}
+
+    resp = client.get("/task/list_all", headers=headers)
+    etag = resp.headers['ETag']
+    resp = client.get(
+        "/task/list_all", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 304
+
+    @task_table.register
+    @launcher(job_type="local")
+    def add_6(a):
+        return a + 6
+
+    resp = client.get(
+        "/task/list_all", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200
+    assert resp.headers['ETag'] != etag
+
+    resp = client.post(
+        "/task/call",
+        json={"task_name": "add_6", "args": [1], "kwargs": {}},
+        headers=headers,
+    )
+    job_id = resp.json()['id']
+    client.get(f"/job/result/{job_id}", headers=headers)
+    resp = client.get(f"/job/status/{job_id}", headers=headers)
+    assert resp.json()['status'] == "done"
+    etag = resp.headers['ETag']
+    resp = client.get(
+        f"/job/status/{job_id}", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 304
+    assert resp.content == b""
+
+    resp = client.get("/job/list_all", headers=headers)
+    etag = resp.headers['ETag']
+    resp = client.get(
+        "/job/list_all", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 304
+    resp = client.post(
+        "/task/call",
+        json={"task_name": "add_6", "args": [2], "kwargs": {}},
+        headers=headers,
+    )
+    resp = client.get(
+        "/job/list_all", headers={**headers, "If-None-Match": etag})
+    assert resp.status_code == 200
+
+
+def test_job_bulk(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="thread")
+    def bulk_sleep(t):
+        time.sleep(t)
+        return t
+
+    job_ids = []
+    for _ in range(3):
+        resp = client.post(
+            "/task/call",
+            json={"task_name": "bulk_sleep", "args": [2], "kwargs": {}},
+            headers=headers,
+        )
+        job_ids.append(resp.json()['id'])
+    resp = client.post(
+        "/job/bulk",
+        json={"action": "cancel", "job_ids": job_ids[:1] + ["fake"]},
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    entries = resp.json()
+    assert entries[0]['job']['status'] == "cancelled"
+    assert 'error' in entries[1]
+
+    resp = client.post(
+        "/job/bulk",
+        json={
+            "action": "cancel",
+            "filter": {"task_name": ["bulk_sleep"], "status": ["running"]},
+        },
+        headers=headers,
+    )
+    entries = resp.json()
+    assert sorted(e['id'] for e in entries) == sorted(job_ids[1:])
+    assert all(e['job']['status'] == "cancelled" for e in entries)
+
+    resp = client.post(
+        "/job/bulk",
+        json={"action": "remove", "filter": {"task_name": ["bulk_sleep"]}},
+        headers=headers,
+    )
+    assert sorted(e['id'] for e in resp.json()) == sorted(job_ids)
+    resp = client.get(
+        "/job/list_all", params={"task_name": "bulk_sleep"}, headers=headers)
+    assert resp.json() == []
+
+    resp = client.post(
+        "/job/bulk", json={"action": "remove"}, headers=headers)
+    assert resp.status_code == 400
+
+
+def test_call_batch(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="local")
+    def sub_7(a, b=7):
+        return a - b
+
+    resp = client.post(
+        "/task/call_batch",
+        json={
+            "task_name": "sub_7",
+            "calls": [
+                {"args": [10]},
+                {"args": [10], "kwargs": {"b": 1}},
+            ],
+        },
+        headers=headers,
+    )
+    assert resp.status_code == 200
+    job_ids = resp.json()['job_ids']
+    results = [
+        client.get(f"/job/result/{i}", headers=headers).json()['result']
+        for i in job_ids]
+    assert results == [3, 9]
+
+    resp = client.post(
+        "/task/call_batch",
+        json={
+            "task_name": "sub_7",
+            "map": {"arg": "a", "values": list(range(5)), "kwargs": {"b": 1}},
+            "chunk_size": 2,
+        },
+        headers=headers,
+    )
+    job_ids = resp.json()['job_ids']
+    assert len(job_ids) == 3
+    results = [
+        client.get(f"/job/result/{i}", headers=headers).json()['result']
+        for i in job_ids]
+    assert results == [[-1, 0], [1, 2], [3]]
+
+    resp = client.post(
+        "/task/call_batch",
+        json={"task_name": "sub_7", "map": {"arg": 1, "values": [1]}},
+        headers=headers,
+    )
+    assert resp.status_code == 400
+
+    resp = client.post(
+        "/task/call_batch",
+        json={
+            "task_name": "sub_7",
+            "map": {"arg": 1, "values": [1], "args": [8]},
+        },
+        headers=headers,
+    )
+    job_id = resp.json()['job_ids'][0]
+    resp = client.get(f"/job/result/{job_id}", headers=headers)
+    assert resp.json()['result'] == 7
+
+    @task_table.register
+    @launcher(job_type="local")
+    async def async_sub(a, b=7):
+        return a - b
+
+    resp = client.post(
+        "/task/call_batch",
+        json={
+            "task_name": "async_sub",
+            "map": {"arg": "a", "values": [1, 2]},
+            "chunk_size": 2,
+        },
+        headers=headers,
+    )
+    assert resp.status_code == 400
+
+
+def test_task_result_cache(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+    n_calls = []
+
+    @task_table.register(cache=True)
+    @launcher(job_type="local")
+    def cached_add(a, b):
+        n_calls.append(1)
+        return a + b
+
+    results = []
+    for i in range(3):
+        resp = client.post(
+            "/task/call",
+            json={"task_name": "cached_add", "args": [1, 2], "kwargs": {}},
+            headers=headers,
+        )
+        job_id = resp.json()['id']
+        if i > 0:
+            # the cache hit is resolved already
+            assert resp.json()['status'] == "done"
+        resp = client.get(f"/job/result/{job_id}", headers=headers)
+        results.append(resp.json())
+    assert [r['result'] for r in results] == [3, 3, 3]
+    assert 'cached' not in results[0]['job']['attrs']
+    assert results[1]['job']['attrs']['cached']
+    assert results[1]['job']['args'] == [1, 2]
+    assert len(n_calls) == 1
+    resp = client.get(
+        "/job/list_all", params={"job_type": "local"}, headers=headers)
+    assert job_id in [j['id'] for j in resp.json()]
+
+    resp = client.get("/task/cache_stats", headers=headers)
+    stats = resp.json()['cached_add']
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+
+
+def test_task_result_cache_diskcache_engine(tmp_path):
+    from executor.engine import Engine, EngineSetting
+    from executor.http.server.app import create_app
+    from executor.http.server.config import ServerSetting
+    from executor.http.server.task_cache import CachePolicy
+
+    engine = Engine(setting=EngineSetting(
+        cache_type="diskcache", cache_path=str(tmp_path / "engine")))
+    app = create_app(ServerSetting(), engine=engine)
+
+    @app.task_table.register(cache=CachePolicy(disk=True))
+    @launcher(job_type="thread")
+    def add(a, b):
+        return a + b
+
+    with TestClient(app) as client:
+        for _ in range(2):
+            resp = client.post(
+                "/task/call",
+                json={"task_name": "add", "args": [1, 2], "kwargs": {}})
+            assert resp.status_code == 200
+            assert resp.json()['job_type'] == "thread"
+            resp = client.get(f"/job/result/{resp.json()['id']}")
+            assert resp.json()['result'] == 3
+        assert resp.json()['job']['status'] == "done"
+        assert resp.json()['job']['attrs']['cached']
+        stats = client.get("/task/cache_stats").json()['add']
+        assert stats['hits'] == 1
+        assert stats['disk_entries'] == 1
+
+
+def test_job_result_formats(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    import pickle
+    msgpack = pytest.importorskip("msgpack")
+    np = pytest.importorskip("numpy")
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="local")
+    def make_list(n):
+        return list(range(n))
+
+    @task_table.register
+    @launcher(job_type="local")
+    def make_bytes(n):
+        return b"x" * n
+
+    headers = dict(headers or {})
+
+    def call(task_name, n):
+        resp = client.post(
+            "/task/call",
+            json={"task_name": task_name, "args": [n], "kwargs": {}},
+            headers=headers,
+        )
+        return resp.json()['id']
+
+    job_id = call("make_list", 100)
+    resp = client.get(
+        f"/job/result/{job_id}",
+        headers={**headers, "Accept": "application/msgpack"})
+    assert resp.status_code == 200
+    assert resp.headers['content-type'] == "application/msgpack"
+    assert msgpack.unpackb(resp.content) == list(range(100))
+    cache = client.app.result_cache
+    n_cached = len(cache)
+    resp = client.get(
+        f"/job/result/{job_id}", params={"format": "msgpack"},
+        headers=headers)
+    assert msgpack.unpackb(resp.content) == list(range(100))
+    assert len(cache) == n_cached
+
+    resp = client.get(
+        f"/job/result/{job_id}", params={"format": "npy"}, headers=headers)
+    assert resp.status_code == 200
+    arr = np.load(io.BytesIO(resp.content))
+    assert (arr == np.arange(100)).all()
+
+    resp = client.get(
+        f"/job/result/{job_id}", params={"format": "raw"}, headers=headers)
+    assert resp.status_code == 406
+    resp = client.get(
+        f"/job/result/{job_id}", params={"format": "pickle"},
+        headers=headers)
+    assert resp.status_code == 406
+    client.app.config.allow_pickle_result = True
+    resp = client.get(
+        f"/job/result/{job_id}", params={"format": "pickle"},
+        headers=headers)
+    assert pickle.loads(resp.content) == list(range(100))
+
+    job_id = call("make_bytes", 1024 * 1024)
+    resp = client.get(
+        f"/job/result/{job_id}",
+        headers={**headers, "Accept": "application/octet-stream"})
+    assert resp.status_code == 200
+    assert resp.content == b"x" * 1024 * 1024
+    resp = client.get(
+        f"/job/result/{job_id}",
+        headers={**headers, "Accept": "text/html, application/json"})
+    assert resp.json()['job']['id'] == job_id
+
+
+def test_task_run(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register
+    @launcher(job_type="local")
+    def div(a, b):
+        return a / b
+
+    @task_table.register
+    @launcher(job_type="thread")
+    def slow_echo(x):
+        time.sleep(0.5)
+        return x
+
+    def run(task_name, args, **kwargs):
+        return client.post(
+            "/task/run",
+            json={
+                "task_name": task_name, "args": args, "kwargs": {},
+                **kwargs,
+            },
+            headers=headers,
+        )
+
+    resp = run("div", [6, 3])
+    assert resp.status_code == 200
+    assert resp.json()['result'] == 2
+    job_id = resp.json()['job']['id']
+    assert resp.json()['job']['status'] == "done"
+    resp = client.get(f"/job/status/{job_id}", headers=headers)
+    assert resp.status_code == 200
+
+    resp = run("div", [6, 3], remove=True)
+    assert resp.json()['result'] == 2
+    job_id = resp.json()['job']['id']
+    resp = client.get(f"/job/status/{job_id}", headers=headers)
+    assert resp.status_code == 400
+
+    resp = run("div", [1, 0], remove=True)
+    assert resp.status_code == 200
+    assert resp.json()['job']['status'] == "failed"
+    assert "ZeroDivisionError" in resp.json()['error']
+
+    resp = run("slow_echo", [1], timeout=0.01)
+    assert resp.status_code == 202
+    assert resp.json()['result'] is None
+    assert resp.json()['job']['status'] in ("pending", "running")
+
+
+def _init_counter():
+    return {}
+
+
+def test_actor_task(
+        client: TestClient,
+        headers: T.Optional[dict]):
+    task_table: TaskTable = client.app.task_table
+
+    @task_table.register_actor(init=_init_counter, pool_size=1)
+    def count(counter: dict, key: str, step: int = 1):
+        counter[key] = counter.get(key, 0) + step
+        return counter[key]
+
+    resp = client.get("/task/list_all", headers=headers)
+    desc = [t for t in resp.json() if t['name'] == "count"][0]
+    assert [a['name'] for a in desc['args']] == ["key", "step"]
+
+    def run(*args):
+        resp = client.post(
+            "/task/run",
+            json={"task_name": "count", "args": args, "kwargs": {}},
+            headers=headers,
+        )
+        assert resp.status_code == 200
+        return resp.json()['result']
+
+    # the state is kept in the worker across the calls
+    assert run("a") == 1
+    assert run("a", 2) == 3
+    assert run("b") == 1
+    task_table.shutdown_actors()
+
+
+def test_actor_task_diskcache_engine(tmp_path):
+    from executor.engine import Engine, EngineSetting
+    from executor.http.server.app import create_app
+    from executor.http.server.config import ServerSetting
+
+    engine = Engine(setting=EngineSetting(
+        cache_type="diskcache", cache_path=str(tmp_path / "engine")))
+    app = create_app(ServerSetting(), engine=engine)
+
+    @app.task_table.register_actor(init=_init_counter)
+    def count(counter: dict, key: str):
+        counter[key] = counter.get(key, 0) + 1
+        return counter[key]
+
+    with TestClient(app) as client:
+        for expect in (1, 2):
+            resp = client.post(
+                "/task/run",
+                json={
+                    "task_name": "count", "args": ["a"], "kwargs": {},
+                    "timeout": 30,
+                })
+            assert resp.status_code == 200
+            assert resp.json()['job']['status'] == "done"
+            assert resp.json()['result'] == expect
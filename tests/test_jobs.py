@@ -0,0 +1,448 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+from executor.engine import Engine, LocalJob, ThreadJob
+
+from executor.http.server.jobs import IndexedJobs, JobQuery, job_sort_key
+
+
+def test_indexed_jobs_query():
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+
+    async def submit_jobs():
+        local_jobs = [LocalJob(lambda: 1, name="a") for _ in range(3)]
+        thread_jobs = [ThreadJob(lambda: 2, name="b") for _ in range(3)]
+        await engine.submit_async(*local_jobs, *thread_jobs)
+        await engine.join()
+        return local_jobs, thread_jobs
+
+    local_jobs, thread_jobs = asyncio.run(submit_jobs())
+    all_ids = [j.id for j in local_jobs + thread_jobs]
+    assert [j.id for j in jobs] == all_ids
+    assert len(jobs.by_status.get("done")) == 6
+
+    res, cursor = jobs.query(JobQuery(names=["b"]), limit=2)
+    assert [j.id for j in res] == all_ids[3:5]
+    res, cursor = jobs.query(JobQuery(names=["b"]), cursor=cursor, limit=2)
+    assert [j.id for j in res] == all_ids[5:]
+    assert cursor is None
+
+    res, _ = jobs.query(JobQuery(job_types=["local"], statuses=["done"]))
+    assert [j.id for j in res] == all_ids[:3]
+    res, _ = jobs.query(JobQuery(statuses=["pending", "running"]))
+    assert res == []
+
+    now = datetime.now()
+    res, _ = jobs.query(JobQuery(
+        created_before=now, stopped_after=now - timedelta(minutes=1)))
+    assert len(res) == 6
+    res, _ = jobs.query(JobQuery(created_after=now))
+    assert res == []
+
+    jobs.remove(local_jobs[0])
+    assert local_jobs[0].id not in jobs
+    res, _ = jobs.query(JobQuery(names=["a"]))
+    assert [j.id for j in res] == all_ids[1:3]
+
+
+def test_ser_job_json_cache():
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+
+    async def main():
+        job = LocalJob(asyncio.sleep, args=(10,))
+        await engine.submit_async(job)
+        await asyncio.sleep(0.05)
+        data = jobs.ser_job_json(job, False)
+        assert json.loads(data)["status"] == "running"
+        assert jobs.ser_job_json(job, False) is data
+        await job.cancel()
+        await asyncio.sleep(0.05)
+        data = jobs.ser_job_json(job, False)
+        assert json.loads(data)["status"] == "cancelled"
+        assert json.loads(data)["stoped_time"] is not None
+        jobs.remove(job)
+        assert jobs._ser_cache == {}
+
+    asyncio.run(main())
+
+
+def test_indexed_jobs_wait_status():
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+
+    async def main():
+        job = ThreadJob(lambda: 1)
+        await engine.submit_async(job)
+        waiters = [
+            jobs.wait_status(job, ["done"]) for _ in range(10)]
+        assert all(await asyncio.gather(*waiters))
+        assert job.status == "done"
+        assert job.id not in jobs._waiters
+        assert await jobs.wait_status(job, ["done"], timeout=0)
+
+        job = LocalJob(asyncio.sleep, args=(10,))
+        await engine.submit_async(job)
+        assert not await jobs.wait_status(job, ["done"], timeout=0.05)
+        waiter = asyncio.create_task(jobs.wait_status(job, ["done"]))
+        await asyncio.sleep(0.05)
+        await job.cancel()
+        jobs.remove(job)
+        assert await waiter
+
+    asyncio.run(main())
+
+
+def test_job_events_overflow():
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+
+    async def main():
+        with jobs.subscribe(3) as sub:
+            await engine.submit_async(
+                *[LocalJob(lambda: 1) for _ in range(3)])
+            await engine.join()
+            events = [e['event'] async for e in sub]
+        assert events == ["overflow"]
+        assert len(jobs._subscribers) == 0
+
+        with jobs.subscribe(10, lambda job: job.name == "b") as sub:
+            job_a = LocalJob(lambda: 1, name="a")
+            job_b = LocalJob(lambda: 1, name="b")
+            await engine.submit_async(job_a, job_b)
+            await engine.join()
+            assert sub.queue.qsize() == 3
+            event = sub.queue.get_nowait()
+            assert event['id'] == job_b.id
+
+    asyncio.run(main())
+
+
+def test_job_retention(tmp_path):
+    from executor.http.server.archive import JobArchive, JobRetention
+    from executor.http.server.user_db.schemas import User
+
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+    archive = JobArchive(tmp_path / "archive.db")
+    retention = JobRetention(jobs, archive, max_finished=3, max_per_user=1)
+    user_a = User(username="a", role="user", id=1)
+    user_b = User(username="b", role="admin", id=2)
+
+    async def main():
+        for user in (user_a, user_a, user_b, None, None, None):
+            job = LocalJob(lambda: 1, user=user)
+            await engine.submit_async(job)
+            await engine.join()
+        await asyncio.sleep(0)
+        # wait the scheduled archiving
+        await retention.enforce_async()
+
+    asyncio.run(main())
+    assert len(jobs) == 3
+    assert len(archive) == 3
+    assert all(j.attrs.get("user") is None for j in jobs)
+    res, cursor = archive.query(JobQuery(), limit=2)
+    assert len(res) == 2
+    res2, cursor = archive.query(JobQuery(), cursor=cursor, limit=2)
+    assert len(res2) == 1
+    assert cursor is None
+    assert archive.get(res[0].id).owner == user_a
+    res, _ = archive.query(JobQuery(), user=user_a)
+    assert {r.owner.username for r in res} == {"a"}
+    res, _ = archive.query(JobQuery(statuses=["done"]), user=user_b)
+    assert len(res) == 3
+
+    retention.max_age = 0
+    retention.enforce()
+    assert len(jobs) == 0
+    assert len(archive) == 6
+    archive.close()
+
+
+def test_archived_job_endpoints(tmp_path):
+    from fastapi.testclient import TestClient
+    from executor.engine.launcher import launcher
+    from executor.http.server.app import create_app
+    from executor.http.server.config import ServerSetting
+
+    app = create_app(ServerSetting(
+        max_finished_jobs=1,
+        job_archive_path=tmp_path / "archive.db",
+    ))
+
+    @app.task_table.register
+    @launcher(job_type="local")
+    def add_5(a):
+        return a + 5
+
+    client = TestClient(app)
+    job_ids = []
+    for i in range(3):
+        resp = client.post("/task/call", json={
+            "task_name": "add_5", "args": [i], "kwargs": {}})
+        job_ids.append(resp.json()['id'])
+        resp = client.post("/job/wait", json={"job_id": job_ids[-1]})
+        assert resp.json()['status'] == "done"
+    resp = client.get("/job/list_all")
+    assert [j['id'] for j in resp.json()] == job_ids[2:]
+    resp = client.get(
+        "/job/list_all", params={"archived": True, "limit": 1})
+    assert [j['id'] for j in resp.json()] == job_ids[:1]
+    assert "X-Next-Cursor" in resp.headers
+    resp = client.get(f"/job/status/{job_ids[0]}")
+    assert resp.status_code == 200
+    assert resp.json()['status'] == "done"
+    assert resp.json()['name'] == "add_5"
+
+    resp = client.get(f"/job/remove/{job_ids[0]}")
+    assert resp.status_code == 200
+    assert resp.json()['id'] == job_ids[0]
+    assert client.get(f"/job/status/{job_ids[0]}").status_code == 400
+    resp = client.post("/job/bulk", json={
+        "action": "remove", "job_ids": [job_ids[1]]})
+    assert resp.json()[0]['job']['id'] == job_ids[1]
+    resp = client.get("/job/list_all", params={"archived": True})
+    assert resp.json() == []
+
+
+def test_job_changes():
+    jobs = IndexedJobs()
+    jobs.max_tombstones = 2
+    local_jobs = [LocalJob(lambda: 1) for _ in range(4)]
+    for job in local_jobs:
+        job._status = "pending"
+        jobs.add(job)
+    assert jobs.changes(0) == (local_jobs, [])
+    version = jobs.version
+    jobs.move_job_store(local_jobs[0], "running")
+    changed, removed = jobs.changes(version)
+    assert changed == [local_jobs[0]]
+    assert removed == []
+
+    for job in local_jobs[1:]:
+        jobs.remove(job)
+    changed, removed = jobs.changes(jobs.version - 2)
+    assert changed == []
+    assert [job_id for job_id, _ in removed] == \
+        [j.id for j in local_jobs[2:]]
+    # the oldest tombstone is dropped
+    assert jobs.changes(version) is None
+
+    cursor = jobs.changes_cursor()
+    assert jobs.parse_changes_cursor(cursor) == jobs.version
+    assert IndexedJobs().parse_changes_cursor(cursor) is None
+
+
+def test_indexed_jobs_owner():
+    from executor.http.server.user_db.schemas import User
+    from executor.http.server.utils.auth import user_can_access
+
+    jobs = IndexedJobs()
+    users = [
+        User(username="root", role="root", id=0),
+        User(username="admin", role="admin", id=1),
+        User(username="a", role="user", id=2),
+        User(username="b", role="user", id=3),
+    ]
+    all_jobs = []
+    for i in range(8):
+        job = LocalJob(lambda: 1)
+        job._status = "pending"
+        job.attrs["user"] = users[i % 4]
+        jobs.add(job)
+        all_jobs.append(job)
+    for user in users:
+        expect = [j for j in all_jobs if user_can_access(user, j)]
+        res, _ = jobs.query(JobQuery(), user=user)
+        assert res == expect
+        assert jobs.count(JobQuery(), user=user) == len(expect)
+    jobs.remove(all_jobs[1])
+    assert jobs.by_owner.get("admin") == [job_sort_key(all_jobs[5])]
+    assert jobs.count(JobQuery(statuses=["pending"]), user=users[1]) == 5
+
+
+def test_admission_control():
+    import pytest
+    from fastapi import HTTPException
+    from executor.http.server.admission import AdmissionControl
+    from executor.http.server.user_db.schemas import User
+
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+    admission = AdmissionControl(
+        jobs, max_active=3, max_active_per_user=1, wait_timeout=0)
+    user_a = User(username="a", role="user", id=1)
+    user_b = User(username="b", role="user", id=2)
+
+    async def main():
+        job = LocalJob(asyncio.sleep, args=(10,))
+        job.attrs["user"] = user_a
+        await admission.admit(1, user_a)
+        await engine.submit_async(job)
+        assert jobs.n_active() == 1
+        assert jobs.n_active("a") == 1
+        with pytest.raises(HTTPException) as e:
+            await admission.admit(1, user_a)
+        assert e.value.status_code == 429
+        assert int(e.value.headers["Retry-After"]) >= 1
+        await admission.admit(1, user_b)
+        with pytest.raises(HTTPException):
+            await admission.admit(3, None)
+
+        admission.wait_timeout = 5
+        waiter = asyncio.create_task(admission.admit(1, user_a))
+        await asyncio.sleep(0.05)
+        assert not waiter.done()
+        await job.cancel()
+        await asyncio.wait_for(waiter, 1)
+        assert jobs.n_active("a") == 0
+
+    asyncio.run(main())
+
+
+def test_priority_scheduler():
+    from executor.http.server.scheduler import PriorityScheduler
+    from executor.http.server.utils import ser_job
+
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+    scheduler = jobs.scheduler = PriorityScheduler(max_running=1)
+    jobs.add_listener(scheduler.on_event)
+    order = []
+
+    async def run(name, t=0.0):
+        await asyncio.sleep(t)
+        order.append(name)
+
+    def make_job(name, priority, t=0.0):
+        job = LocalJob(run, args=(name, t))
+        job.attrs["priority"] = priority
+        scheduler.gate(job)
+        return job
+
+    async def main():
+        blocker = make_job("blocker", 0, 0.2)
+        await engine.submit_async(blocker)
+        await asyncio.sleep(0.05)
+        assert blocker.status == "running"
+        low = [make_job(f"low{i}", 0) for i in range(2)]
+        high = make_job("high", 10)
+        await engine.submit_async(*low, high)
+        await asyncio.sleep(0.05)
+        assert scheduler.position(high.id) == 0
+        assert ser_job(low[1], False)["queue_position"] == 2
+        assert ser_job(low[1], False)["condition"] is None
+        await engine.wait_async()
+        assert order == ["blocker", "high", "low0", "low1"]
+        assert len(scheduler) == 0
+        assert not scheduler.running
+
+    asyncio.run(main())
+
+
+def test_priority_scheduler_retry():
+    from executor.http.server.scheduler import PriorityScheduler
+
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+    scheduler = jobs.scheduler = PriorityScheduler(max_running=1)
+    jobs.add_listener(scheduler.on_event)
+    n_calls = []
+
+    def flaky():
+        n_calls.append(1)
+        if len(n_calls) == 1:
+            raise ValueError("first call fails")
+        return 1
+
+    async def main():
+        job = LocalJob(flaky, retries=1)
+        scheduler.gate(job)
+        await engine.submit_async(job)
+        await asyncio.wait_for(job.join(), 5)
+        assert job.status == "done"
+        assert len(n_calls) == 2
+        assert not scheduler.running
+
+    asyncio.run(main())
+
+
+def test_priority_scheduler_aging():
+    from executor.http.server.scheduler import PriorityScheduler
+
+    scheduler = PriorityScheduler(max_running=1, aging_rate=100)
+    old = LocalJob(asyncio.sleep, args=(0,))
+    scheduler.enqueue(old)
+    new = LocalJob(asyncio.sleep, args=(0,))
+    new.attrs["priority"] = 1
+    # after waiting, the old job has gained more than 1 priority
+    time.sleep(0.05)
+    scheduler.enqueue(new)
+    assert scheduler.position(old.id) == 0
+    assert scheduler.position(new.id) == 1
+    scheduler.discard(old.id)
+    assert scheduler.position(new.id) == 0
+    assert scheduler.position(old.id) is None
+
+
+def test_fair_share_scheduler():
+    from executor.http.server.scheduler import PriorityScheduler
+    from executor.http.server.user_db.schemas import User
+
+    engine = Engine()
+    engine.jobs = IndexedJobs.adopt(engine.jobs)
+    jobs: IndexedJobs = engine.jobs
+    scheduler = jobs.scheduler = PriorityScheduler(
+        max_running=1, role_weights={"admin": 2.0, "user": 1.0})
+    jobs.add_listener(scheduler.on_event)
+    user_a = User(username="a", role="user", id=1)
+    user_b = User(username="b", role="user", id=2)
+    user_c = User(username="c", role="admin", id=3)
+    order = []
+
+    async def run(name, t=0.0):
+        await asyncio.sleep(t)
+        order.append(name)
+
+    def make_job(name, user, t=0.0):
+        job = LocalJob(run, args=(name, t))
+        job.attrs["user"] = user
+        scheduler.gate(job)
+        return job
+
+    async def main():
+        await engine.submit_async(make_job("blocker", user_a, 0.2))
+        await asyncio.sleep(0.05)
+        await engine.submit_async(
+            *[make_job(f"a{i}", user_a) for i in range(4)])
+        b_jobs = [make_job(f"b{i}", user_b) for i in range(2)]
+        await engine.submit_async(*b_jobs)
+        await asyncio.sleep(0.05)
+        assert scheduler.position(b_jobs[0].id) == 0
+        assert scheduler.position(b_jobs[1].id) == 2
+        await engine.wait_async()
+        assert order == ["blocker", "b0", "a0", "b1", "a1", "a2", "a3"]
+
+        # the admin's jobs start twice as often as the user's
+        order.clear()
+        await engine.submit_async(make_job("blocker", user_a, 0.2))
+        await asyncio.sleep(0.05)
+        await engine.submit_async(
+            *[make_job(f"a{i}", user_a) for i in range(3)],
+            *[make_job(f"c{i}", user_c) for i in range(4)])
+        await engine.wait_async()
+        assert order[1:6] == ["c0", "c1", "a0", "c2", "c3"]
+
+    asyncio.run(main())
@@ -67,6 +67,13 @@ def test_fetch_log():
     assert resp.status_code == 200
     assert len(resp.json()['content']) > 0
 
+    # the stream ends because the job is finished
+    resp = client.get(
+        f"/monitor/stdout/{job1.id}", params={"follow": True})
+    assert resp.status_code == 200
+    assert "hello" in resp.text
+    assert "event: end" in resp.text
+
     resp = client.get(f"/monitor/stdout/{job2.id}")
     assert resp.status_code == 400
 
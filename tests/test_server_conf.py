@@ -1,3 +1,5 @@
+import time
+
 from fastapi.testclient import TestClient
 
 from executor.http.server.app import create_app
@@ -26,3 +28,109 @@ def test_get_server_setting():
     assert resp.status_code == 200
     assert 'monitor_mode' in resp.json()
     assert 'allowed_routers' in resp.json()
+
+
+def test_admission_limits():
+    from executor.engine.launcher import launcher
+
+    app = create_app(ServerSetting(max_active_jobs=1))
+
+    @app.task_table.register
+    @launcher(job_type="thread")
+    def sleep_a_while(t):
+        time.sleep(t)
+
+    with TestClient(app) as client:
+        def call(t):
+            return client.post(
+                "/task/call",
+                json={"task_name": "sleep_a_while", "args": [t], "kwargs": {}})
+
+        resp = call(1)
+        assert resp.status_code == 200
+        job_id = resp.json()['id']
+        resp = call(1)
+        assert resp.status_code == 429
+        assert int(resp.headers['Retry-After']) >= 1
+        client.get(f"/job/result/{job_id}")
+        assert call(0).status_code == 200
+
+
+def test_admission_coalesced_calls():
+    from concurrent.futures import ThreadPoolExecutor
+    from executor.engine.launcher import launcher
+
+    app = create_app(ServerSetting(
+        max_active_jobs=1, admission_wait_timeout=5))
+    calls = []
+
+    @app.task_table.register(coalesce="all")
+    @launcher(job_type="thread")
+    def sleep_a_while(t):
+        calls.append(t)
+        time.sleep(t)
+
+    with TestClient(app) as client:
+        def call(t):
+            return client.post(
+                "/task/call",
+                json={"task_name": "sleep_a_while", "args": [t], "kwargs": {}})
+
+        first = call(0.3).json()['id']
+        with ThreadPoolExecutor(2) as pool:
+            resps = list(pool.map(call, [0.2, 0.2]))
+        assert [r.status_code for r in resps] == [200, 200]
+        assert resps[0].json()['id'] == resps[1].json()['id']
+        for job_id in (first, resps[0].json()['id']):
+            client.get(f"/job/result/{job_id}")
+        # the shared job is submitted only once
+        assert calls == [0.3, 0.2]
+        assert not app.task_table._admitting
+
+
+def test_admission_reject_cached_call():
+    from executor.engine.launcher import launcher
+
+    app = create_app(ServerSetting(max_active_jobs=1))
+
+    @app.task_table.register(cache=True)
+    @launcher(job_type="thread")
+    def sleep_a_while(t):
+        time.sleep(t)
+
+    with TestClient(app) as client:
+        def call(t):
+            return client.post(
+                "/task/call",
+                json={"task_name": "sleep_a_while", "args": [t], "kwargs": {}})
+
+        assert call(0.5).status_code == 200
+        for t in (0.1, 0.2):
+            assert call(t).status_code == 429
+        # the rejected jobs are not tracked
+        assert len(app.task_table._cache_keys) == 1
+
+
+def test_call_queue_position():
+    from executor.engine.launcher import launcher
+
+    app = create_app(ServerSetting(scheduler_max_running=1))
+
+    @app.task_table.register
+    @launcher(job_type="thread")
+    def sleep_a_while(t):
+        time.sleep(t)
+
+    with TestClient(app) as client:
+        def call(t):
+            return client.post(
+                "/task/call",
+                json={"task_name": "sleep_a_while", "args": [t], "kwargs": {}})
+
+        jobs = [call(0.5).json()]
+        time.sleep(0.2)
+        jobs += [call(0.1).json() for _ in range(2)]
+        # the queued jobs know the position in the call response
+        assert [j['queue_position'] for j in jobs[1:]] == [0, 1]
+        for job in jobs:
+            client.get(f"/job/result/{job['id']}")
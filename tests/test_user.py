@@ -148,3 +148,72 @@ def test_different_user():
     assert len(resp.json()) == 2
     resp = client.get(f"/job/status/{job_id}", headers=headers_root)
     assert resp.status_code == 200
+
+
+def test_coalesce_shared_job():
+    import time
+
+    app = create_app(ServerSetting(
+        user_mode="hub",
+        root_password="123",
+        allowed_routers=["job", "task", "file", "proxy", "user"],
+        # concurrent thread jobs can't redirect the streams
+        redirect_job_stream=False,
+    ))
+    task_table = app.task_table
+    db_engine = database.get_engine(app.config.user_database_url)
+    test_username, test_user_passwd = create_db_for_test(db_engine)
+
+    @task_table.register(coalesce="all")
+    @launcher(job_type="thread")
+    def slow_square(a):
+        time.sleep(1)
+        return a * a
+
+    with TestClient(app) as client:
+        headers_user1 = login_client(client, test_username, test_user_passwd)
+        headers_root = login_client(client, "root", "123")
+
+        def call(headers, a=2):
+            resp = client.post(
+                "/task/call",
+                json={"task_name": "slow_square", "args": [a], "kwargs": {}},
+                headers=headers,
+            )
+            assert resp.status_code == 200
+            return resp.json()
+
+        job = call(headers_root)
+        shared = call(headers_user1)
+        assert shared['id'] == job['id']
+        assert 'shared_users' not in shared['attrs']
+        assert call(headers_user1, 3)['id'] != job['id']
+        # the shared users can't manage the job
+        for action in ("cancel", "remove", "re_run"):
+            resp = client.get(
+                f"/job/{action}/{job['id']}", headers=headers_user1)
+            assert resp.status_code == 403
+        resp = client.post(
+            "/job/bulk", json={"action": "cancel", "job_ids": [job['id']]},
+            headers=headers_user1)
+        assert 'error' in resp.json()[0]
+        resp = client.post(
+            "/job/bulk",
+            json={"action": "cancel", "filter": {"task_name": ["slow_square"]}},
+            headers=headers_user1)
+        assert job['id'] not in [e['id'] for e in resp.json()]
+
+        resp = client.get(f"/job/result/{job['id']}", headers=headers_user1)
+        assert resp.status_code == 200
+        assert resp.json()['result'] == 4
+        resp = client.get(
+            "/job/list_all", params={"task_name": "slow_square"},
+            headers=headers_user1)
+        assert job['id'] in [j['id'] for j in resp.json()]
+        # the finished job is not shared anymore
+        assert call(headers_user1)['id'] != job['id']
+
+        task_table.register(slow_square, coalesce="user")
+        job = call(headers_root, 4)
+        assert call(headers_user1, 4)['id'] != job['id']
+        assert call(headers_root, 4)['id'] == job['id']
@@ -74,3 +74,215 @@ def test_oauth2password_bearer_cookie():
         headers={"Authorization": "Invalid mytoken"})
     assert response.status_code == 200
     assert response.json() == {"token": None}
+
+
+def test_read_log(tmp_path):
+    from executor.http.server.utils.logfile import read_log
+    path = tmp_path / "log.txt"
+    lines = [f"line{i}\n" for i in range(10000)]
+    path.write_text("".join(lines) + "中文")
+    content = path.read_bytes()
+
+    res = read_log(path)
+    assert res['content'] == content.decode()
+    assert res['offset'] == len(content)
+
+    res = read_log(path, offset=4, limit=6)
+    assert res['content'] == "0\nline"
+    assert res['offset'] == 10
+
+    # not split the multi-bytes char
+    res = read_log(path, offset=len(content) - 6, limit=4)
+    assert res['content'] == "中"
+    assert res['offset'] == len(content) - 3
+    # the limit is smaller than the char
+    res = read_log(path, offset=len(content) - 6, limit=1)
+    assert res['content'] == "中"
+    assert res['offset'] == len(content) - 3
+
+    res = read_log(path, tail=3)
+    assert res['content'] == "line9998\nline9999\n中文"
+    assert res['offset'] == len(content)
+    assert read_log(path, tail=0)['content'] == ""
+    assert read_log(path, tail=20000)['content'] == content.decode()
+
+
+def test_follow_log(tmp_path):
+    import asyncio
+    from executor.http.server.utils.logfile import follow_log
+    path = tmp_path / "log.txt"
+
+    async def main():
+        finished = False
+        contents = []
+
+        async def consume():
+            async for res in follow_log(
+                    path, 0, lambda: finished, poll_interval=0.01):
+                contents.append(res['content'])
+
+        task = asyncio.create_task(consume())
+        await asyncio.sleep(0.05)
+        with open(path, 'w') as f:
+            f.write("a\n")
+        await asyncio.sleep(0.05)
+        with open(path, 'a') as f:
+            f.write("b\n")
+        finished = True
+        await asyncio.wait_for(task, 1)
+        assert "".join(contents) == "a\nb\n"
+
+    asyncio.run(main())
+
+
+def test_negotiate_result_format():
+    from executor.http.server.result import negotiate_format
+    assert negotiate_format(None) == "json"
+    assert negotiate_format("*/*") == "json"
+    assert negotiate_format("application/x-msgpack") == "msgpack"
+    assert negotiate_format(
+        "application/json;q=0.5, application/x-npy") == "npy"
+    assert negotiate_format(
+        "application/msgpack;q=0, application/octet-stream") == "raw"
+
+
+def test_stream_result():
+    import io
+    import numpy as np
+    from executor.engine.job import LocalJob
+    from executor.http.server.result import (
+        ResultCache, encode_result, iter_chunks)
+
+    arr = np.asfortranarray(np.arange(3000, dtype="f8").reshape(30, 100))
+    buffers = encode_result(arr, "npy")
+    # the array data is not copied
+    assert len(buffers) == 2
+    chunks = list(iter_chunks(buffers, chunk_size=1000))
+    assert max(len(c) for c in chunks) == 1000
+    assert (np.load(io.BytesIO(b"".join(chunks))) == arr).all()
+    data = bytearray(b"abc" * 1000)
+    assert b"".join(iter_chunks(encode_result(data, "raw"), 7)) == data
+
+    job = LocalJob(lambda: None)
+    cache = ResultCache(max_size=4000)
+    stream = cache.tee(job, "raw", iter_chunks([data], 1000))
+    assert b"".join(stream) == data
+    assert cache.get(job, "raw") == data
+    # larger than the cache
+    stream = cache.tee(job, "npy", iter_chunks(buffers, 1000))
+    assert len(b"".join(stream)) > 4000
+    assert cache.get(job, "npy") is None
+
+
+def test_etag_matches():
+    from executor.http.server.utils.etag import etag_matches, make_etag
+    etag = make_etag("a", 1)
+    assert etag == '"a-1"'
+    assert etag_matches('"b-1", W/"a-1"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"a-2"', etag)
+    assert not etag_matches(None, etag)
+
+
+def test_task_result_cache(tmp_path):
+    import time
+    from executor.http.server.task_cache import CachePolicy, TaskResultCache
+
+    policy = CachePolicy(max_entries=2, ttl=0.2, disk=True)
+    cache = TaskResultCache(policy)
+    cache.disk_path = tmp_path / "cache"
+    keys = [cache.make_key("f", (i,), {"x": 1}) for i in range(3)]
+    assert keys[0] == cache.make_key("f", (0,), {"x": 1})
+    for i, key in enumerate(keys):
+        cache.set(key, i)
+    assert len(cache._memory) == 2
+    # evicted from the memory, fetch from the disk
+    assert cache.get(keys[0]) == (True, 0)
+    time.sleep(0.3)
+    assert cache.get(keys[1]) == (False, None)
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses']) == (1, 1)
+    cache.close()
+
+
+def test_range_set():
+    from executor.http.server.upload import RangeSet
+    ranges = RangeSet()
+    ranges.add(10, 20)
+    ranges.add(30, 40)
+    assert ranges.to_list() == [(10, 20), (30, 40)]
+    assert ranges.prefix_end(0) == 0
+    ranges.add(0, 10)
+    assert ranges.prefix_end(0) == 20
+    ranges.add(15, 35)
+    assert ranges.to_list() == [(0, 40)]
+    ranges.add(50, 60)
+    assert ranges.total() == 50
+    assert ranges.prefix_end(55) == 60
+
+
+def test_upload_session_out_of_order(tmp_path):
+    import hashlib
+    from executor.http.server.upload import UploadSession
+    content = bytes(range(256)) * 4
+    digest = hashlib.sha256(content).hexdigest()
+    target = tmp_path / "a.bin"
+    session = UploadSession(tmp_path, target, len(content), digest)
+
+    def write(start, end):
+        session.write(start, content[start:end])
+
+    write(600, 1024)
+    write(100, 400)
+    session._update_hash(64)
+    assert session.hashed == 0
+    # in order, hashed without reading back
+    write(0, 150)
+    assert session.hashed == 150
+    # re-sent chunk overlaps the hashed prefix
+    write(50, 250)
+    session._update_hash(64)
+    assert session.hashed == 400
+    write(350, 700)
+    # re-sent chunk begin at the hashed offset
+    write(400, 600)
+    assert session.hashed == 600
+    assert session.complete
+    session._update_hash(64)
+    assert session.hashed == len(content)
+    assert session.sha256() == digest
+    session.finalize()
+    assert target.read_bytes() == content
+    assert not session.part_path.exists()
+
+
+def test_dir_list_cache(tmp_path):
+    import os
+    from executor.http.server.dir_list import DirListCache
+
+    cache = DirListCache(max_entries=3, ttl=60)
+    cache.mtime_granularity_ns = 0
+    (tmp_path / "a").write_text("1")
+    stat = os.stat(tmp_path)
+    assert [e.name for e in cache.list(tmp_path).entries] == ["a"]
+    assert cache.list(tmp_path) is cache.list(tmp_path)
+    assert cache.hits == 2
+    # the names only listing can't be used for the stat
+    sub = tmp_path / "sub"
+    sub.mkdir()
+    os.utime(tmp_path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    cache.list(sub, with_stat=False)
+    assert not cache.list(sub).entries
+    assert cache.misses == 3
+    # changed without changing the mtime, found after invalidated
+    assert len(cache.list(tmp_path).entries) == 1
+    cache.invalidate(tmp_path)
+    assert len(cache.list(tmp_path).entries) == 2
+    # LRU eviction by the number of entries
+    for i in range(3):
+        (sub / str(i)).write_text("")
+    cache.list(sub)
+    assert cache._n_entries <= 3
+    assert tmp_path not in cache._listings
+    cache.invalidate(tmp_path, recursive=True)
+    assert not cache._listings